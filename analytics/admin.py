@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Performance, Activite
+from .models import Performance, Activite, StatistiqueJournaliere, StatistiqueMensuelle
 
 
 @admin.register(Performance)
@@ -29,3 +29,20 @@ class ActiviteAdmin(admin.ModelAdmin):
         return obj.description[:50] + '...' if len(obj.description) > 50 else obj.description
     description_court.short_description = 'Description'
 
+
+@admin.register(StatistiqueJournaliere)
+class StatistiqueJournaliereAdmin(admin.ModelAdmin):
+    list_display = ['user', 'matiere', 'date', 'nombre_qcm', 'nombre_revisions', 'revisions_reussies']
+    list_filter = ['matiere', 'date']
+    search_fields = ['user__username']
+    date_hierarchy = 'date'
+    list_select_related = ['user', 'matiere']
+
+
+@admin.register(StatistiqueMensuelle)
+class StatistiqueMensuelleAdmin(admin.ModelAdmin):
+    list_display = ['user', 'matiere', 'mois', 'nombre_qcm', 'nombre_revisions', 'revisions_reussies']
+    list_filter = ['matiere', 'mois']
+    search_fields = ['user__username']
+    date_hierarchy = 'mois'
+    list_select_related = ['user', 'matiere']
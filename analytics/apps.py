@@ -5,5 +5,5 @@ class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics'
 
-
-
+    def ready(self):
+        from . import signals
@@ -0,0 +1,41 @@
+"""
+Commande reconstruisant les agrégats d'analyse depuis l'historique
+Usage: python manage.py rebuild_analytics [--user-min N --user-max M] [--batch-size 5000]
+
+Idempotente : recalcule StatistiqueJournaliere, StatistiqueMensuelle et
+Performance par tranches d'identifiants utilisateur (la mémoire utilisée
+ne dépend que de la taille des tranches).
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from analytics.rollups import RollupService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les agrégats quotidiens, mensuels et les performances depuis l'historique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-min', type=int, default=0, help="Premier id utilisateur traité")
+        parser.add_argument('--user-max', type=int, help="Id utilisateur de fin (exclu)")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Nombre d'ids utilisateur par tranche")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être positif")
+
+        user_max = options['user_max']
+        if user_max is None:
+            user_max = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+        debut = options['user_min']
+        lignes = 0
+        while debut < user_max:
+            fin = min(debut + options['batch_size'], user_max)
+            lignes += RollupService.reconstruire(debut, fin)
+            debut = fin
+
+        self.stdout.write(self.style.SUCCESS(f"Agrégats reconstruits : {lignes} ligne(s) journalière(s)"))
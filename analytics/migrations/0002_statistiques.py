@@ -0,0 +1,167 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:55
+
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+TRANCHE = 5000  # Identifiants utilisateur par tranche, comme rebuild_analytics
+
+
+def reconstruire_statistiques(apps, schema_editor):
+    """
+    Agrégats des résultats et révisions antérieurs à ces tables
+
+    Même calcul que RollupService.reconstruire, sur les modèles historiques
+    et par tranches d'identifiants utilisateur : la mémoire utilisée ne
+    dépend que de la taille des tranches.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    ResultatQCM = apps.get_model('qcm', 'ResultatQCM')
+    Revision = apps.get_model('flashcards', 'Revision')
+    StatistiqueJournaliere = apps.get_model('analytics', 'StatistiqueJournaliere')
+    StatistiqueMensuelle = apps.get_model('analytics', 'StatistiqueMensuelle')
+    Performance = apps.get_model('analytics', 'Performance')
+
+    user_max = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    for debut in range(0, user_max, TRANCHE):
+        portee = Q(user_id__gte=debut, user_id__lt=debut + TRANCHE)
+
+        journaliers = defaultdict(Counter)
+        resultats = (
+            ResultatQCM.objects.filter(portee).order_by()
+            .annotate(jour=TruncDate('created_at'))
+            .values('user_id', 'qcm__chapitre__matiere_id', 'jour')
+            .annotate(nombre=Count('id'), somme=Sum('pourcentage'))
+        )
+        for ligne in resultats:
+            cle = (ligne['user_id'], ligne['qcm__chapitre__matiere_id'], ligne['jour'])
+            journaliers[cle]['nombre_qcm'] += ligne['nombre']
+            journaliers[cle]['somme_pourcentages'] += ligne['somme']
+        revisions = (
+            Revision.objects.filter(portee).order_by()
+            .annotate(jour=TruncDate('created_at'))
+            .values('user_id', 'flashcard__deck__chapitre__matiere_id', 'jour')
+            .annotate(nombre=Count('id'), reussies=Count('id', filter=Q(reussie=True)))
+        )
+        for ligne in revisions:
+            cle = (ligne['user_id'], ligne['flashcard__deck__chapitre__matiere_id'], ligne['jour'])
+            journaliers[cle]['nombre_revisions'] += ligne['nombre']
+            journaliers[cle]['revisions_reussies'] += ligne['reussies']
+
+        # Performance garde ses autres champs (temps d'étude, date de création)
+        Performance.objects.filter(portee).update(score_moyen=0.0, nombre_qcm=0, nombre_flashcards=0)
+        if not journaliers:
+            continue
+
+        mensuels = defaultdict(Counter)
+        performances = defaultdict(Counter)
+        for (user_id, matiere_id, jour), valeurs in journaliers.items():
+            mensuels[(user_id, matiere_id, jour.replace(day=1))].update(valeurs)
+            if matiere_id is not None:
+                performances[(user_id, matiere_id)].update(valeurs)
+
+        StatistiqueJournaliere.objects.bulk_create(
+            [
+                StatistiqueJournaliere(user_id=user_id, matiere_id=matiere_id, date=jour, **valeurs)
+                for (user_id, matiere_id, jour), valeurs in journaliers.items()
+            ],
+            batch_size=1000
+        )
+        StatistiqueMensuelle.objects.bulk_create(
+            [
+                StatistiqueMensuelle(user_id=user_id, matiere_id=matiere_id, mois=mois, **valeurs)
+                for (user_id, matiere_id, mois), valeurs in mensuels.items()
+            ],
+            batch_size=1000
+        )
+        Performance.objects.bulk_create(
+            [
+                Performance(
+                    user_id=user_id,
+                    matiere_id=matiere_id,
+                    score_moyen=(
+                        valeurs['somme_pourcentages'] / valeurs['nombre_qcm'] if valeurs['nombre_qcm'] else 0.0
+                    ),
+                    nombre_qcm=valeurs['nombre_qcm'],
+                    nombre_flashcards=valeurs['nombre_revisions'],
+                )
+                for (user_id, matiere_id), valeurs in performances.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user', 'matiere'],
+            update_fields=['score_moyen', 'nombre_qcm', 'nombre_flashcards'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0001_initial'),
+        ('analytics', '0001_initial'),
+        ('flashcards', '0001_initial'),
+        ('qcm', '0002_qcm_generation_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre_qcm', models.IntegerField(default=0)),
+                ('somme_pourcentages', models.FloatField(default=0.0)),
+                ('nombre_revisions', models.IntegerField(default=0)),
+                ('revisions_reussies', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('matiere', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.matiere')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_journalieres', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatistiqueMensuelle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre_qcm', models.IntegerField(default=0)),
+                ('somme_pourcentages', models.FloatField(default=0.0)),
+                ('nombre_revisions', models.IntegerField(default=0)),
+                ('revisions_reussies', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mois', models.DateField()),
+                ('matiere', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.matiere')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques_mensuelles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-mois'],
+                'indexes': [models.Index(fields=['user', 'mois'], name='analytics_s_user_id_602ca5_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statistiquemensuelle',
+            constraint=models.UniqueConstraint(fields=('user', 'matiere', 'mois'), name='statmois_user_matiere_mois'),
+        ),
+        migrations.AddConstraint(
+            model_name='statistiquemensuelle',
+            constraint=models.UniqueConstraint(condition=models.Q(('matiere__isnull', True)), fields=('user', 'mois'), name='statmois_user_sans_matiere_mois'),
+        ),
+        migrations.AddIndex(
+            model_name='statistiquejournaliere',
+            index=models.Index(fields=['user', 'date'], name='analytics_s_user_id_6967d7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='statistiquejournaliere',
+            constraint=models.UniqueConstraint(fields=('user', 'matiere', 'date'), name='statjour_user_matiere_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='statistiquejournaliere',
+            constraint=models.UniqueConstraint(condition=models.Q(('matiere__isnull', True)), fields=('user', 'date'), name='statjour_user_sans_matiere_date'),
+        ),
+        migrations.RunPython(reconstruire_statistiques, migrations.RunPython.noop),
+    ]
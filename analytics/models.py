@@ -48,4 +48,59 @@ class Activite(models.Model):
         return f"{self.user.username} - {self.type_activite}"
 
 
+class StatistiqueBase(models.Model):
+    """Agrégats d'un élève pour une matière sur une période (voir rollups.py)"""
+    nombre_qcm = models.IntegerField(default=0)
+    somme_pourcentages = models.FloatField(default=0.0)
+    nombre_revisions = models.IntegerField(default=0)
+    revisions_reussies = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def score_moyen(self):
+        return self.somme_pourcentages / self.nombre_qcm if self.nombre_qcm else 0.0
 
+    @property
+    def taux_reussite(self):
+        return self.revisions_reussies / self.nombre_revisions * 100 if self.nombre_revisions else 0.0
+
+
+class StatistiqueJournaliere(StatistiqueBase):
+    """Agrégats quotidiens par élève et par matière (matière vide : QCM sans chapitre)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='statistiques_journalieres')
+    matiere = models.ForeignKey(Matiere, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    date = models.DateField()
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'matiere', 'date'], name='statjour_user_matiere_date'),
+            models.UniqueConstraint(fields=['user', 'date'], condition=models.Q(matiere__isnull=True),
+                                    name='statjour_user_sans_matiere_date'),
+        ]
+        indexes = [models.Index(fields=['user', 'date'])]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date}"
+
+
+class StatistiqueMensuelle(StatistiqueBase):
+    """Agrégats mensuels par élève et par matière (mois = premier jour du mois)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='statistiques_mensuelles')
+    matiere = models.ForeignKey(Matiere, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    mois = models.DateField()
+
+    class Meta:
+        ordering = ['-mois']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'matiere', 'mois'], name='statmois_user_matiere_mois'),
+            models.UniqueConstraint(fields=['user', 'mois'], condition=models.Q(matiere__isnull=True),
+                                    name='statmois_user_sans_matiere_mois'),
+        ]
+        indexes = [models.Index(fields=['user', 'mois'])]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.mois:%Y-%m}"
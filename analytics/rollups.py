@@ -0,0 +1,251 @@
+"""
+Tables d'agrégats par élève et par matière
+
+StatistiqueJournaliere, StatistiqueMensuelle et Performance sont tenues à
+jour à chaque écriture d'un ResultatQCM ou d'une Revision (signaux, ou appel
+direct après un bulk_create) : création des lignes manquantes, puis un
+UPDATE incrémental par matière et par période. Un retrait ne fait que des
+UPDATE (jamais d'insertion) et supprime les lignes journalières et
+mensuelles devenues vides. Les tableaux de bord lisent ces lignes au lieu
+de parcourir l'historique.
+
+La commande rebuild_analytics les reconstruit depuis l'historique par
+requêtes groupées (et corrige toute dérive, ex. suppression d'un chapitre).
+"""
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from qcm.models import QCM, ResultatQCM
+from flashcards.models import Flashcard, Revision
+from .models import Performance, StatistiqueJournaliere, StatistiqueMensuelle
+
+
+class RollupService:
+    """Mise à jour et reconstruction des agrégats d'apprentissage"""
+
+    @classmethod
+    def enregistrer_resultats(cls, resultats, signe=1):
+        """
+        Ajoute des résultats de QCM aux agrégats (signe=-1 pour les retirer)
+
+        Args:
+            resultats: Liste de ResultatQCM enregistrés
+        """
+        resultats = list(resultats)
+        if not resultats:
+            return
+        matieres = dict(
+            QCM.objects.filter(id__in={r.qcm_id for r in resultats}).values_list('id', 'chapitre__matiere_id')
+        )
+        deltas = defaultdict(Counter)
+        for resultat in resultats:
+            cle = (resultat.user_id, matieres.get(resultat.qcm_id), timezone.localdate(resultat.created_at))
+            deltas[cle]['nombre_qcm'] += signe
+            deltas[cle]['somme_pourcentages'] += signe * resultat.pourcentage
+        cls._appliquer(deltas, creer=signe > 0)
+
+    @classmethod
+    def enregistrer_revisions(cls, revisions, signe=1):
+        """Ajoute des révisions de flashcards aux agrégats (signe=-1 pour les retirer)"""
+        revisions = list(revisions)
+        if not revisions:
+            return
+        matieres = dict(
+            Flashcard.objects.filter(id__in={r.flashcard_id for r in revisions})
+            .values_list('id', 'deck__chapitre__matiere_id')
+        )
+        deltas = defaultdict(Counter)
+        for revision in revisions:
+            cle = (revision.user_id, matieres.get(revision.flashcard_id), timezone.localdate(revision.created_at))
+            deltas[cle]['nombre_revisions'] += signe
+            deltas[cle]['revisions_reussies'] += signe * int(revision.reussie)
+        cls._appliquer(deltas, creer=signe > 0)
+
+    @classmethod
+    def _appliquer(cls, deltas, creer=True):
+        """
+        Répercute des deltas {(user_id, matiere_id, jour): Counter} sur les trois tables
+
+        Args:
+            creer: Créer les lignes manquantes (False pour un retrait : seules
+                les lignes existantes sont décrémentées)
+        """
+        mensuels = defaultdict(Counter)
+        performances = defaultdict(Counter)
+        for (user_id, matiere_id, jour), delta in deltas.items():
+            mensuels[(user_id, matiere_id, jour.replace(day=1))].update(delta)
+            if matiere_id is not None:
+                performances[(user_id, matiere_id)].update(delta)
+
+        with transaction.atomic():
+            cls._incrementer(StatistiqueJournaliere, 'date', deltas, creer)
+            cls._incrementer(StatistiqueMensuelle, 'mois', mensuels, creer)
+            cls._incrementer_performances(performances, creer)
+
+    @staticmethod
+    def _par_groupe(deltas):
+        """Regroupe les deltas par (matière[, période]) : {(matiere_id, ...): {user_id: delta}}"""
+        groupes = defaultdict(dict)
+        for (user_id, *groupe), delta in deltas.items():
+            groupes[tuple(groupe)][user_id] = delta
+        return groupes
+
+    @staticmethod
+    def _valeur(modele, par_user, champ):
+        """Incrément d'un champ, commun ou propre à chaque utilisateur"""
+        valeurs = {user_id: delta.get(champ, 0) for user_id, delta in par_user.items()}
+        if len(set(valeurs.values())) == 1:
+            return Value(next(iter(valeurs.values())))
+        return Case(
+            *[When(user_id=user_id, then=Value(valeur)) for user_id, valeur in valeurs.items()],
+            default=Value(0),
+            output_field=modele._meta.get_field(champ),
+        )
+
+    @classmethod
+    def _incrementer(cls, modele, champ_date, deltas, creer=True):
+        """
+        Une insertion (lignes manquantes) puis un UPDATE par (matière, période)
+
+        Sans création (retrait), les lignes qui ne comptent plus ni QCM ni
+        révision sont supprimées, comme si elles avaient été reconstruites.
+        """
+        if creer:
+            modele.objects.bulk_create(
+                [
+                    modele(user_id=user_id, matiere_id=matiere_id, **{champ_date: date})
+                    for user_id, matiere_id, date in deltas
+                ],
+                ignore_conflicts=True
+            )
+        maintenant = timezone.now()
+        for (matiere_id, date), par_user in cls._par_groupe(deltas).items():
+            champs = set().union(*par_user.values())
+            lignes = modele.objects.filter(user_id__in=par_user, matiere_id=matiere_id, **{champ_date: date})
+            lignes.update(
+                updated_at=maintenant,
+                **{champ: F(champ) + cls._valeur(modele, par_user, champ) for champ in champs}
+            )
+            if not creer:
+                lignes.filter(nombre_qcm__lte=0, nombre_revisions__lte=0).delete()
+
+    @classmethod
+    def _incrementer_performances(cls, deltas, creer=True):
+        """
+        Met à jour Performance : score moyen glissant, nombre de QCM et
+        nombre de révisions de flashcards
+        """
+        if not deltas:
+            return
+        if creer:
+            Performance.objects.bulk_create(
+                [Performance(user_id=user_id, matiere_id=matiere_id) for user_id, matiere_id in deltas],
+                ignore_conflicts=True
+            )
+        maintenant = timezone.now()
+        for (matiere_id,), par_user in cls._par_groupe(deltas).items():
+            champs = set().union(*par_user.values())
+            updates = {'updated_at': maintenant}
+            if 'nombre_qcm' in champs:
+                nombre = cls._valeur(StatistiqueJournaliere, par_user, 'nombre_qcm')
+                somme = cls._valeur(StatistiqueJournaliere, par_user, 'somme_pourcentages')
+                # Les deux expressions lisent les anciennes valeurs de la ligne
+                updates['score_moyen'] = (
+                    (F('score_moyen') * F('nombre_qcm') + somme) / Greatest(F('nombre_qcm') + nombre, Value(1))
+                )
+                updates['nombre_qcm'] = F('nombre_qcm') + nombre
+            if 'nombre_revisions' in champs:
+                updates['nombre_flashcards'] = (
+                    F('nombre_flashcards') + cls._valeur(StatistiqueJournaliere, par_user, 'nombre_revisions')
+                )
+            Performance.objects.filter(user_id__in=par_user, matiere_id=matiere_id).update(**updates)
+
+    @staticmethod
+    def reconstruire(user_min=0, user_max=None, batch_size=1000):
+        """
+        Recalcule les agrégats depuis l'historique pour les utilisateurs dont
+        l'id est dans [user_min, user_max)
+
+        Deux requêtes groupées par jour (résultats, révisions) ; les mois et
+        les performances sont cumulés en mémoire. Idempotent.
+
+        Returns:
+            int: Le nombre de lignes journalières écrites
+        """
+        portee = Q(user_id__gte=user_min)
+        if user_max is not None:
+            portee &= Q(user_id__lt=user_max)
+
+        journaliers = defaultdict(Counter)
+        resultats = (
+            ResultatQCM.objects.filter(portee).order_by()
+            .annotate(jour=TruncDate('created_at'))
+            .values('user_id', 'qcm__chapitre__matiere_id', 'jour')
+            .annotate(nombre=Count('id'), somme=Sum('pourcentage'))
+        )
+        for ligne in resultats:
+            cle = (ligne['user_id'], ligne['qcm__chapitre__matiere_id'], ligne['jour'])
+            journaliers[cle]['nombre_qcm'] += ligne['nombre']
+            journaliers[cle]['somme_pourcentages'] += ligne['somme']
+
+        revisions = (
+            Revision.objects.filter(portee).order_by()
+            .annotate(jour=TruncDate('created_at'))
+            .values('user_id', 'flashcard__deck__chapitre__matiere_id', 'jour')
+            .annotate(nombre=Count('id'), reussies=Count('id', filter=Q(reussie=True)))
+        )
+        for ligne in revisions:
+            cle = (ligne['user_id'], ligne['flashcard__deck__chapitre__matiere_id'], ligne['jour'])
+            journaliers[cle]['nombre_revisions'] += ligne['nombre']
+            journaliers[cle]['revisions_reussies'] += ligne['reussies']
+
+        mensuels = defaultdict(Counter)
+        performances = defaultdict(Counter)
+        for (user_id, matiere_id, jour), valeurs in journaliers.items():
+            mensuels[(user_id, matiere_id, jour.replace(day=1))].update(valeurs)
+            if matiere_id is not None:
+                performances[(user_id, matiere_id)].update(valeurs)
+
+        with transaction.atomic():
+            StatistiqueJournaliere.objects.filter(portee).delete()
+            StatistiqueMensuelle.objects.filter(portee).delete()
+            StatistiqueJournaliere.objects.bulk_create(
+                [
+                    StatistiqueJournaliere(user_id=user_id, matiere_id=matiere_id, date=jour, **valeurs)
+                    for (user_id, matiere_id, jour), valeurs in journaliers.items()
+                ],
+                batch_size=batch_size
+            )
+            StatistiqueMensuelle.objects.bulk_create(
+                [
+                    StatistiqueMensuelle(user_id=user_id, matiere_id=matiere_id, mois=mois, **valeurs)
+                    for (user_id, matiere_id, mois), valeurs in mensuels.items()
+                ],
+                batch_size=batch_size
+            )
+
+            # Performance garde ses autres champs (temps d'étude, date de création)
+            Performance.objects.filter(portee).update(
+                score_moyen=0.0, nombre_qcm=0, nombre_flashcards=0, updated_at=timezone.now()
+            )
+            Performance.objects.bulk_create(
+                [
+                    Performance(
+                        user_id=user_id,
+                        matiere_id=matiere_id,
+                        score_moyen=(
+                            valeurs['somme_pourcentages'] / valeurs['nombre_qcm'] if valeurs['nombre_qcm'] else 0.0
+                        ),
+                        nombre_qcm=valeurs['nombre_qcm'],
+                        nombre_flashcards=valeurs['nombre_revisions'],
+                    )
+                    for (user_id, matiere_id), valeurs in performances.items()
+                ],
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['user', 'matiere'],
+                update_fields=['score_moyen', 'nombre_qcm', 'nombre_flashcards', 'updated_at'],
+            )
+        return len(journaliers)
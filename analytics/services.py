@@ -0,0 +1,88 @@
+"""
+Service de calcul des statistiques d'un élève
+
+Les indicateurs sont lus dans les agrégats mensuels tenus à jour par
+rollups.py : une requête par indicateur, sur quelques lignes par mois,
+quel que soit l'historique.
+"""
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Performance, Activite, StatistiqueMensuelle
+
+
+class AnalyticsService:
+    """Statistiques d'apprentissage d'un élève"""
+
+    @staticmethod
+    def statistiques_qcm(user):
+        """Nombre de QCM complétés et score moyen"""
+        stats = StatistiqueMensuelle.objects.filter(user=user).aggregate(
+            total=Sum('nombre_qcm'),
+            somme=Sum('somme_pourcentages'),
+        )
+        total = stats['total'] or 0
+        return {
+            'total_qcm': total,
+            'score_moyen_qcm': round(stats['somme'] / total, 2) if total > 0 else 0,
+        }
+
+    @staticmethod
+    def statistiques_flashcards(user):
+        """Nombre de révisions et taux de réussite"""
+        stats = StatistiqueMensuelle.objects.filter(user=user).aggregate(
+            total=Sum('nombre_revisions'),
+            reussies=Sum('revisions_reussies'),
+        )
+        total = stats['total'] or 0
+        taux = (stats['reussies'] / total * 100) if total > 0 else 0
+        return {
+            'total_flashcards': total,
+            'taux_reussite': round(taux, 2),
+        }
+
+    @staticmethod
+    def debut_mois(nombre_mois, aujourd_hui=None):
+        """Premier jour du mois situé `nombre_mois - 1` mois avant le mois courant"""
+        aujourd_hui = aujourd_hui or timezone.localdate()
+        annee, mois = divmod(aujourd_hui.year * 12 + aujourd_hui.month - 1 - (nombre_mois - 1), 12)
+        return aujourd_hui.replace(year=annee, month=mois + 1, day=1)
+
+    @staticmethod
+    def evolution_mensuelle(user, nombre_mois=6):
+        """
+        Score moyen et nombre de QCM par mois, sur les derniers mois
+
+        Returns:
+            list: {"mois": "AAAA-MM", "score", "nombre"} du plus ancien au plus
+            récent ; les mois sans QCM sont omis
+        """
+        debut = AnalyticsService.debut_mois(nombre_mois)
+        lignes = (
+            StatistiqueMensuelle.objects.filter(user=user, mois__gte=debut, nombre_qcm__gt=0)
+            .values('mois')
+            .annotate(somme=Sum('somme_pourcentages'), nombre=Sum('nombre_qcm'))
+            .order_by('mois')
+        )
+        return [
+            {
+                'mois': ligne['mois'].strftime('%Y-%m'),
+                'score': round(ligne['somme'] / ligne['nombre'], 2),
+                'nombre': ligne['nombre'],
+            }
+            for ligne in lignes
+        ]
+
+    @staticmethod
+    def tableau_de_bord(user, nombre_mois=6):
+        """Toutes les données de la page d'analyses"""
+        from gamification.models import UserProgress
+
+        donnees = {
+            'performances': list(Performance.objects.filter(user=user).select_related('matiere')),
+            'activites_recentes': list(Activite.objects.filter(user=user)[:10]),
+            'resultats_par_mois': AnalyticsService.evolution_mensuelle(user, nombre_mois),
+            'progress': UserProgress.objects.filter(user=user).first(),
+        }
+        donnees.update(AnalyticsService.statistiques_qcm(user))
+        donnees.update(AnalyticsService.statistiques_flashcards(user))
+        return donnees
@@ -0,0 +1,47 @@
+"""
+Mise à jour incrémentale des agrégats d'analyse (voir analytics/rollups.py)
+
+Les bulk_create n'émettent pas de signaux : les appelants concernés
+(correction groupée des QCM) appellent RollupService directement.
+
+Les retraits se font en pre_delete, dans la transaction de la suppression :
+lors d'une cascade (suppression d'un QCM, d'un deck), la matière se lit
+encore depuis le QCM ou la flashcard. Quand la cascade vient de la
+suppression de l'élève lui-même, ses agrégats partent avec lui : rien à
+retirer.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from qcm.models import ResultatQCM
+from flashcards.models import Revision
+from .rollups import RollupService
+
+
+def _suppression_eleve(instance, origin):
+    """Vrai si la suppression est une cascade de celle de l'élève"""
+    return isinstance(origin, get_user_model()) and origin.pk == instance.user_id
+
+
+@receiver(post_save, sender=ResultatQCM)
+def ajouter_resultat(sender, instance, created, **kwargs):
+    if created:
+        RollupService.enregistrer_resultats([instance])
+
+
+@receiver(pre_delete, sender=ResultatQCM)
+def retirer_resultat(sender, instance, origin=None, **kwargs):
+    if not _suppression_eleve(instance, origin):
+        RollupService.enregistrer_resultats([instance], signe=-1)
+
+
+@receiver(post_save, sender=Revision)
+def ajouter_revision(sender, instance, created, **kwargs):
+    if created:
+        RollupService.enregistrer_revisions([instance])
+
+
+@receiver(pre_delete, sender=Revision)
+def retirer_revision(sender, instance, origin=None, **kwargs):
+    if not _suppression_eleve(instance, origin):
+        RollupService.enregistrer_revisions([instance], signe=-1)
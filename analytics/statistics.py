@@ -0,0 +1,137 @@
+"""
+Noyau statistique vectorisé
+
+Les colonnes d'un queryset sont lues en une requête (values_list) puis
+converties en tableaux NumPy ; moyennes par groupe, effectifs,
+histogrammes, percentiles et séries temporelles sont calculés sans boucle
+Python par ligne. Utilisé par les rapports PDF (export.pdf_services) et
+les vues d'analyses.
+"""
+import numpy as np
+
+PERCENTILES = (10, 25, 50, 75, 90)
+BORNES_SCORES = np.linspace(0, 100, 11)  # Tranches de 10 points
+PAS = ('D', 'W', 'M')  # Jour, semaine (commençant le lundi), mois
+
+
+def colonnes(queryset, *champs, dtypes=None):
+    """
+    Colonnes d'un queryset en tableaux NumPy (une requête)
+
+    Args:
+        queryset: QuerySet (ou valeurs annotées) à lire
+        champs: Noms des champs / annotations, dans l'ordre voulu
+        dtypes: Type NumPy par champ (object par défaut) ; None en entrée
+            donne NaN pour les flottants
+
+    Returns:
+        tuple: Un tableau par champ, de même longueur
+    """
+    dtypes = dtypes or {}
+    lignes = list(queryset.values_list(*champs))
+    valeurs = zip(*lignes) if lignes else [()] * len(champs)
+    tableaux = []
+    for champ, colonne in zip(champs, valeurs):
+        dtype = dtypes.get(champ, object)
+        if np.dtype(dtype).kind == 'f':
+            colonne = [np.nan if v is None else v for v in colonne]
+        tableaux.append(np.array(colonne, dtype=dtype))
+    return tuple(tableaux)
+
+
+def effectifs(cles):
+    """Clés distinctes (triées) et nombre d'occurrences de chacune"""
+    return np.unique(np.asarray(cles), return_counts=True)
+
+
+def moyennes_par_groupe(cles, valeurs):
+    """
+    Moyenne des valeurs pour chaque clé distincte
+
+    Returns:
+        tuple: (clés triées, moyennes, effectifs)
+    """
+    valeurs = np.asarray(valeurs, dtype=float)
+    if not len(valeurs):
+        return np.array([]), np.array([]), np.array([], dtype=np.int64)
+    groupes, inverse = np.unique(np.asarray(cles), return_inverse=True)
+    nombres = np.bincount(inverse, minlength=len(groupes))
+    sommes = np.bincount(inverse, weights=valeurs, minlength=len(groupes))
+    return groupes, sommes / nombres, nombres
+
+
+def histogramme(valeurs, bornes=BORNES_SCORES):
+    """Effectif de chaque tranche [bornes[i], bornes[i+1]) ; la dernière inclut sa borne haute"""
+    nombres, bornes = np.histogram(np.asarray(valeurs, dtype=float), bins=bornes)
+    return nombres, bornes
+
+
+def percentiles(valeurs, rangs=PERCENTILES):
+    """Percentiles demandés ({rang: valeur}), vide si aucune valeur"""
+    valeurs = np.asarray(valeurs, dtype=float)
+    if not len(valeurs):
+        return {}
+    return dict(zip(rangs, np.percentile(valeurs, rangs).tolist()))
+
+
+def resume(valeurs, rangs=PERCENTILES):
+    """Effectif, moyenne, écart-type, minimum, maximum et percentiles"""
+    valeurs = np.asarray(valeurs, dtype=float)
+    if not len(valeurs):
+        return {'nombre': 0, 'moyenne': 0, 'ecart_type': 0, 'minimum': 0, 'maximum': 0, 'percentiles': {}}
+    return {
+        'nombre': len(valeurs),
+        'moyenne': float(valeurs.mean()),
+        'ecart_type': float(valeurs.std()),
+        'minimum': float(valeurs.min()),
+        'maximum': float(valeurs.max()),
+        'percentiles': percentiles(valeurs, rangs),
+    }
+
+
+def periodes(dates, pas='D'):
+    """
+    Début de la période (jour, semaine ou mois) de chaque date
+
+    Args:
+        dates: Dates (date ou datetime64) ; les semaines commencent le lundi
+        pas: 'D', 'W' ou 'M'
+    """
+    if pas not in PAS:
+        raise ValueError(f"Pas inconnu : {pas}")
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    if pas == 'W':
+        # datetime64[W] compte depuis le jeudi 01/01/1970 : décalage de 3 jours
+        decalage = np.timedelta64(3, 'D')
+        return (dates + decalage).astype('datetime64[W]').astype('datetime64[D]') - decalage
+    return dates.astype(f'datetime64[{pas}]').astype('datetime64[D]')
+
+
+def pas_automatique(dates, points_max=60):
+    """Pas le plus fin qui donne au plus `points_max` périodes sur l'étendue des dates"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    if not len(dates):
+        return 'D'
+    etendue = int((dates.max() - dates.min()).astype(int)) + 1
+    for pas, jours in (('D', 1), ('W', 7)):
+        if etendue / jours <= points_max:
+            return pas
+    return 'M'
+
+
+def serie_temporelle(dates, valeurs, pas=None, points_max=60):
+    """
+    Moyenne des valeurs par période
+
+    Args:
+        dates: Date de chaque valeur
+        valeurs: Valeurs à moyenner
+        pas: 'D', 'W' ou 'M' ; choisi selon l'étendue des dates si None
+
+    Returns:
+        tuple: (début de chaque période en datetime64[D], moyennes, effectifs),
+        périodes vides omises
+    """
+    if pas is None:
+        pas = pas_automatique(dates, points_max)
+    return moyennes_par_groupe(periodes(dates, pas), valeurs)
@@ -0,0 +1,303 @@
+"""
+Tests unitaires pour l'application Analytics
+"""
+from datetime import date, timedelta
+from io import StringIO
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import Matiere, Chapitre
+from qcm.models import QCM, ResultatQCM
+from flashcards.models import Deck, Flashcard, Revision
+from .models import Performance, StatistiqueJournaliere, StatistiqueMensuelle
+from .rollups import RollupService
+from . import statistics
+from .services import AnalyticsService
+
+User = get_user_model()
+
+
+class AnalyticsServiceTest(TestCase):
+    """Tests pour le service de statistiques"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.matiere = Matiere.objects.create(nom='Mathématiques', code='MATH', niveau='college')
+        self.chapitre = Chapitre.objects.create(matiere=self.matiere, titre='Les équations', numero=1, contenu='Contenu')
+        self.qcm = QCM.objects.create(user=self.user, titre='QCM', chapitre=self.chapitre, texte_source='Texte')
+        deck = Deck.objects.create(user=self.user, titre='Deck', chapitre=self.chapitre)
+        self.flashcard = Flashcard.objects.create(deck=deck, recto='Q', verso='R')
+    
+    def _resultat(self, pourcentage, jours=0):
+        resultat = ResultatQCM.objects.create(
+            user=self.user, qcm=self.qcm, score=0, total=10, pourcentage=pourcentage
+        )
+        if jours:
+            ResultatQCM.objects.filter(id=resultat.id).update(created_at=timezone.now() - timedelta(days=jours))
+            RollupService.reconstruire()  # update() ne passe pas par les signaux
+        return resultat
+    
+    def test_statistiques(self):
+        """Test les agrégats QCM et flashcards"""
+        self._resultat(50)
+        self._resultat(100)
+        Revision.objects.create(user=self.user, flashcard=self.flashcard, reussie=True)
+        Revision.objects.create(user=self.user, flashcard=self.flashcard, reussie=False)
+        Revision.objects.create(user=self.user, flashcard=self.flashcard, reussie=True)
+        
+        self.assertEqual(AnalyticsService.statistiques_qcm(self.user), {'total_qcm': 2, 'score_moyen_qcm': 75.0})
+        self.assertEqual(
+            AnalyticsService.statistiques_flashcards(self.user),
+            {'total_flashcards': 3, 'taux_reussite': 66.67}
+        )
+    
+    def test_evolution_mensuelle(self):
+        """Test le regroupement par mois"""
+        self._resultat(40)
+        self._resultat(80)
+        self._resultat(60, jours=400)  # Hors de la fenêtre de 6 mois
+        
+        evolution = AnalyticsService.evolution_mensuelle(self.user)
+        self.assertEqual(len(evolution), 1)
+        self.assertEqual(evolution[0]['mois'], timezone.localdate().strftime('%Y-%m'))
+        self.assertEqual(evolution[0]['score'], 60.0)
+        self.assertEqual(evolution[0]['nombre'], 2)
+    
+    def test_debut_mois(self):
+        """Test le calcul du premier mois de la fenêtre"""
+        jour = timezone.localdate().replace(year=2024, month=3, day=15)
+        self.assertEqual(AnalyticsService.debut_mois(6, jour).isoformat(), '2023-10-01')
+        self.assertEqual(AnalyticsService.debut_mois(1, jour).isoformat(), '2024-03-01')
+    
+    def test_tableau_de_bord_nombre_de_requetes_constant(self):
+        """Test que le nombre de requêtes ne dépend pas de l'historique"""
+        for jours in range(0, 180, 10):
+            self._resultat(70, jours=jours)
+        with self.assertNumQueries(6):
+            donnees = AnalyticsService.tableau_de_bord(self.user)
+        self.assertEqual(donnees['total_qcm'], 18)
+        self.assertGreater(len(donnees['resultats_par_mois']), 1)
+
+
+class RollupServiceTest(TestCase):
+    """Tests pour les agrégats par élève et par matière"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.matiere = Matiere.objects.create(nom='Mathématiques', code='MATH', niveau='college')
+        chapitre = Chapitre.objects.create(matiere=self.matiere, titre='Les équations', numero=1, contenu='Contenu')
+        self.qcm = QCM.objects.create(user=self.user, titre='QCM', chapitre=chapitre, texte_source='Texte')
+        self.qcm_libre = QCM.objects.create(user=self.user, titre='QCM libre', texte_source='Texte')
+        deck = Deck.objects.create(user=self.user, titre='Deck', chapitre=chapitre)
+        self.flashcard = Flashcard.objects.create(deck=deck, recto='Q', verso='R')
+    
+    def _etat(self):
+        """Contenu des trois tables, pour comparer incrémental et reconstruction"""
+        champs = ('user_id', 'matiere_id', 'nombre_qcm', 'somme_pourcentages', 'nombre_revisions', 'revisions_reussies')
+        return (
+            list(StatistiqueJournaliere.objects.order_by('user_id', 'matiere_id', 'date').values_list('date', *champs)),
+            list(StatistiqueMensuelle.objects.order_by('user_id', 'matiere_id', 'mois').values_list('mois', *champs)),
+            list(
+                Performance.objects.order_by('user_id', 'matiere_id')
+                .values_list('user_id', 'matiere_id', 'score_moyen', 'nombre_qcm', 'nombre_flashcards')
+            ),
+        )
+    
+    def test_mise_a_jour_incrementale(self):
+        """Test que les écritures de résultats et de révisions alimentent les agrégats"""
+        ResultatQCM.objects.create(user=self.user, qcm=self.qcm, score=5, total=10, pourcentage=50)
+        ResultatQCM.objects.create(user=self.user, qcm=self.qcm, score=9, total=10, pourcentage=90)
+        ResultatQCM.objects.create(user=self.user, qcm=self.qcm_libre, score=1, total=2, pourcentage=50)
+        Revision.objects.create(user=self.user, flashcard=self.flashcard, reussie=True)
+        Revision.objects.create(user=self.user, flashcard=self.flashcard, reussie=False)
+        
+        jour = StatistiqueJournaliere.objects.get(user=self.user, matiere=self.matiere)
+        self.assertEqual(jour.date, timezone.localdate())
+        self.assertEqual((jour.nombre_qcm, jour.score_moyen), (2, 70.0))
+        self.assertEqual((jour.nombre_revisions, jour.taux_reussite), (2, 50.0))
+        self.assertEqual(StatistiqueJournaliere.objects.get(user=self.user, matiere=None).nombre_qcm, 1)
+        self.assertEqual(StatistiqueMensuelle.objects.get(user=self.user, matiere=self.matiere).nombre_qcm, 2)
+        
+        performance = Performance.objects.get(user=self.user, matiere=self.matiere)
+        self.assertAlmostEqual(performance.score_moyen, 70.0)
+        self.assertEqual((performance.nombre_qcm, performance.nombre_flashcards), (2, 2))
+    
+    def test_suppression(self):
+        """Test qu'une suppression retire le résultat des agrégats"""
+        ResultatQCM.objects.create(user=self.user, qcm=self.qcm, score=5, total=10, pourcentage=50)
+        resultat = ResultatQCM.objects.create(user=self.user, qcm=self.qcm, score=9, total=10, pourcentage=90)
+        resultat.delete()
+        
+        performance = Performance.objects.get(user=self.user, matiere=self.matiere)
+        self.assertAlmostEqual(performance.score_moyen, 50.0)
+        self.assertEqual(performance.nombre_qcm, 1)
+        self.assertEqual(StatistiqueMensuelle.objects.get(user=self.user, matiere=self.matiere).nombre_qcm, 1)
+    
+    def test_suppression_utilisateur(self):
+        """Test que supprimer un élève ne recrée pas ses agrégats (cascade)"""
+        autre = User.objects.create_user(username='autre', password='testpass123')
+        ResultatQCM.objects.create(user=autre, qcm=self.qcm, score=5, total=10, pourcentage=50)
+        Revision.objects.create(user=autre, flashcard=self.flashcard, reussie=True)
+        troisieme = User.objects.create_user(username='troisieme', password='testpass123')
+        ResultatQCM.objects.create(user=troisieme, qcm=self.qcm, score=5, total=10, pourcentage=50)
+        supprimes = [autre.id, troisieme.id]
+        
+        autre.delete()
+        User.objects.filter(id=troisieme.id).delete()  # Suppression par queryset
+        
+        connection.check_constraints()
+        for modele in (StatistiqueJournaliere, StatistiqueMensuelle, Performance):
+            self.assertFalse(modele.objects.filter(user_id__in=supprimes).exists())
+    
+    def test_suppression_qcm(self):
+        """Test que supprimer un QCM retire ses résultats sans créer de ligne"""
+        ResultatQCM.objects.create(user=self.user, qcm=self.qcm, score=5, total=10, pourcentage=50)
+        ResultatQCM.objects.create(user=self.user, qcm=self.qcm_libre, score=9, total=10, pourcentage=90)
+        
+        self.qcm.delete()
+        
+        self.assertFalse(StatistiqueJournaliere.objects.filter(nombre_qcm__lt=0).exists())
+        self.assertFalse(StatistiqueJournaliere.objects.filter(user=self.user, matiere=self.matiere).exists())
+        self.assertEqual(StatistiqueJournaliere.objects.get(user=self.user, matiere=None).nombre_qcm, 1)
+        self.assertEqual(StatistiqueMensuelle.objects.get().nombre_qcm, 1)
+        performance = Performance.objects.get(user=self.user, matiere=self.matiere)
+        self.assertEqual((performance.nombre_qcm, performance.score_moyen), (0, 0.0))
+    
+    def test_correction_groupee(self):
+        """Test que la correction groupée (bulk_create, sans signal) alimente les agrégats"""
+        from qcm.grading import BatchGradingService
+        autre = User.objects.create_user(username='autre', password='testpass123')
+        BatchGradingService.submit(self.qcm, [{'user_id': self.user.id, 'reponses': {}}, {'user_id': autre.id}])
+        
+        self.assertEqual(
+            set(Performance.objects.values_list('user_id', 'nombre_qcm')),
+            {(self.user.id, 1), (autre.id, 1)}
+        )
+    
+    def test_reconstruction_identique(self):
+        """Test que la reconstruction donne le même état que les mises à jour incrémentales"""
+        autre = User.objects.create_user(username='autre', password='testpass123')
+        for pourcentage in (20, 60, 100):
+            ResultatQCM.objects.create(user=self.user, qcm=self.qcm, score=0, total=10, pourcentage=pourcentage)
+        ResultatQCM.objects.create(user=autre, qcm=self.qcm_libre, score=0, total=10, pourcentage=30)
+        Revision.objects.create(user=autre, flashcard=self.flashcard, reussie=True)
+        incremental = self._etat()
+        
+        StatistiqueJournaliere.objects.all().delete()
+        Performance.objects.update(score_moyen=0, nombre_qcm=0)
+        call_command('rebuild_analytics', batch_size=1, stdout=StringIO())
+        
+        reconstruit = self._etat()
+        self.assertEqual(reconstruit[:2], incremental[:2])
+        for ligne, attendue in zip(reconstruit[2], incremental[2]):
+            self.assertEqual(ligne[:2] + ligne[3:], attendue[:2] + attendue[3:])
+            self.assertAlmostEqual(ligne[2], attendue[2])
+
+
+class StatisticsTest(TestCase):
+    """Tests pour le noyau statistique vectorisé"""
+    
+    def test_moyennes_par_groupe(self):
+        """Test les moyennes et effectifs par clé"""
+        groupes, moyennes, nombres = statistics.moyennes_par_groupe(
+            ['Maths', 'SVT', 'Maths', 'SVT', 'Maths'], [40, 80, 60, 100, 50]
+        )
+        self.assertEqual(groupes.tolist(), ['Maths', 'SVT'])
+        self.assertEqual(moyennes.tolist(), [50.0, 90.0])
+        self.assertEqual(nombres.tolist(), [3, 2])
+        self.assertEqual(len(statistics.moyennes_par_groupe([], [])[0]), 0)
+    
+    def test_histogramme_et_percentiles(self):
+        """Test la distribution par tranches de 10 points et les percentiles"""
+        valeurs = np.arange(0, 101, dtype=float)
+        nombres, bornes = statistics.histogramme(valeurs)
+        self.assertEqual(len(bornes), 11)
+        self.assertEqual(nombres.tolist(), [10] * 9 + [11])  # 100 inclus dans la dernière tranche
+        self.assertEqual(statistics.percentiles(valeurs, (25, 50)), {25: 25.0, 50: 50.0})
+        self.assertEqual(statistics.resume([])['nombre'], 0)
+        self.assertEqual(statistics.resume([20, 40])['moyenne'], 30.0)
+    
+    def test_periodes(self):
+        """Test le regroupement par jour, semaine (lundi) et mois"""
+        dates = [date(2024, 3, 3), date(2024, 3, 4), date(2024, 3, 10), date(2024, 3, 11)]
+        semaines = statistics.periodes(dates, 'W').astype(object).tolist()
+        self.assertEqual(semaines, [date(2024, 2, 26), date(2024, 3, 4), date(2024, 3, 4), date(2024, 3, 11)])
+        mois = statistics.periodes(dates, 'M').astype(object).tolist()
+        self.assertEqual(set(mois), {date(2024, 3, 1)})
+        with self.assertRaises(ValueError):
+            statistics.periodes(dates, 'Y')
+    
+    def test_serie_temporelle(self):
+        """Test les moyennes par période et le choix automatique du pas"""
+        debut = np.datetime64('2024-01-01')
+        self.assertEqual(statistics.pas_automatique([debut, debut + 30]), 'D')
+        self.assertEqual(statistics.pas_automatique([debut, debut + 200]), 'W')
+        self.assertEqual(statistics.pas_automatique([debut, debut + 1000]), 'M')
+        
+        jours, moyennes, nombres = statistics.serie_temporelle(
+            [debut, debut + 40, debut + 45], [30, 60, 80], pas='M'
+        )
+        self.assertEqual(jours.astype(str).tolist(), ['2024-01-01', '2024-02-01'])
+        self.assertEqual(moyennes.tolist(), [30.0, 70.0])
+        self.assertEqual(nombres.tolist(), [1, 2])
+    
+    def test_colonnes(self):
+        """Test la lecture d'un queryset en tableaux typés (une requête)"""
+        user = User.objects.create_user(username='eleve', password='testpass123')
+        matiere = Matiere.objects.create(nom='Physique', code='PHY', niveau='lycee')
+        chapitre = Chapitre.objects.create(matiere=matiere, titre='Forces', numero=1, contenu='Contenu')
+        qcm = QCM.objects.create(user=user, titre='QCM', chapitre=chapitre, texte_source='Texte')
+        for pourcentage in (25, 75):
+            ResultatQCM.objects.create(user=user, qcm=qcm, score=0, total=10, pourcentage=pourcentage)
+        
+        with self.assertNumQueries(1):
+            pourcentages, noms = statistics.colonnes(
+                ResultatQCM.objects.order_by('pourcentage'), 'pourcentage', 'qcm__chapitre__matiere__nom',
+                dtypes={'pourcentage': float},
+            )
+        self.assertEqual(pourcentages.dtype, np.float64)
+        self.assertEqual(pourcentages.tolist(), [25.0, 75.0])
+        self.assertEqual(noms.tolist(), ['Physique', 'Physique'])
+        
+        vides = statistics.colonnes(ResultatQCM.objects.none(), 'pourcentage', 'id', dtypes={'pourcentage': float})
+        self.assertEqual([len(colonne) for colonne in vides], [0, 0])
+
+
+class AnalyticsViewsTest(TestCase):
+    """Tests pour les vues d'analyses"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+    
+    def test_analytics_index(self):
+        """Test l'affichage de la page d'analyses"""
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('analytics:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'analytics/index.html')
+        self.assertEqual(response.context['total_qcm'], 0)
+    
+    def test_performance_detail(self):
+        """Test la page d'une matière : résumé, distribution et évolution des scores"""
+        matiere = Matiere.objects.create(nom='Mathématiques', code='MATH', niveau='college')
+        chapitre = Chapitre.objects.create(matiere=matiere, titre='Les équations', numero=1, contenu='Contenu')
+        qcm = QCM.objects.create(user=self.user, titre='QCM', chapitre=chapitre, texte_source='Texte')
+        for pourcentage in (40, 80):
+            ResultatQCM.objects.create(user=self.user, qcm=qcm, score=0, total=10, pourcentage=pourcentage)
+        
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('analytics:performance_detail', args=[matiere.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'analytics/performance_detail.html')
+        self.assertEqual(response.context['resume']['nombre'], 2)
+        self.assertEqual(response.context['resume']['moyenne'], 60.0)
+        self.assertEqual(sum(tranche['nombre'] for tranche in response.context['distribution']), 2)
+        self.assertEqual(response.context['evolution'][0]['score'], 60.0)
+        
+        response = self.client.get(reverse('analytics:performance_detail', args=[99999]))
+        self.assertEqual(response.status_code, 404)
@@ -1,9 +1,8 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.db import models
-from django.utils import timezone
-from datetime import timedelta
-from .models import Performance, Activite
+from django.db.models.functions import TruncDate
+from .services import AnalyticsService
+from . import statistics
 from qcm.models import ResultatQCM
 from flashcards.models import Revision
 from accounts.models import Matiere
@@ -12,70 +11,26 @@ from accounts.models import Matiere
 @login_required
 def analytics_index(request):
     """Page principale des analyses"""
-    performances = Performance.objects.filter(user=request.user)
-    
-    # Statistiques générales
-    total_qcm = ResultatQCM.objects.filter(user=request.user).count()
-    score_moyen_qcm = ResultatQCM.objects.filter(user=request.user).aggregate(
-        avg_score=models.Avg('pourcentage')
-    )['avg_score'] or 0
-    
-    total_flashcards = Revision.objects.filter(user=request.user).count()
-    flashcards_reussies = Revision.objects.filter(user=request.user, reussie=True).count()
-    taux_reussite = (flashcards_reussies / total_flashcards * 100) if total_flashcards > 0 else 0
-    
-    activites_recentes = Activite.objects.filter(user=request.user)[:10]
-    
-    # Données pour graphiques (évolution temporelle)
-    resultats_par_mois = []
-    for i in range(6):  # 6 derniers mois
-        mois = timezone.now().replace(day=1) - timedelta(days=30*i)
-        resultats_mois = ResultatQCM.objects.filter(
-            user=request.user,
-            created_at__year=mois.year,
-            created_at__month=mois.month
-        )
-        if resultats_mois.exists():
-            score_moyen = sum(r.pourcentage for r in resultats_mois) / resultats_mois.count()
-            resultats_par_mois.append({
-                'mois': mois.strftime('%Y-%m'),
-                'score': round(score_moyen, 2),
-                'nombre': resultats_mois.count()
-            })
-    
-    resultats_par_mois.reverse()
-    
-    # Gamification stats
-    from gamification.models import UserProgress
-    progress = None
-    try:
-        progress = UserProgress.objects.get(user=request.user)
-    except:
-        pass
-    
-    return render(request, 'analytics/index.html', {
-        'performances': performances,
-        'total_qcm': total_qcm,
-        'score_moyen_qcm': round(score_moyen_qcm, 2),
-        'total_flashcards': total_flashcards,
-        'taux_reussite': round(taux_reussite, 2),
-        'activites_recentes': activites_recentes,
-        'resultats_par_mois': resultats_par_mois,
-        'progress': progress,
-    })
+    return render(request, 'analytics/index.html', AnalyticsService.tableau_de_bord(request.user))
 
 
 @login_required
 def performance_detail(request, matiere_id):
     """Détails des performances par matière"""
     
-    matiere = Matiere.objects.get(id=matiere_id)
+    matiere = get_object_or_404(Matiere, id=matiere_id)
     
     # Résultats QCM pour cette matière
-    resultats_qcm = ResultatQCM.objects.filter(
-        user=request.user,
-        qcm__chapitre__matiere=matiere
-    ).order_by('-created_at')[:20]
+    resultats = ResultatQCM.objects.filter(user=request.user, qcm__chapitre__matiere=matiere)
+    resultats_qcm = resultats.order_by('-created_at')[:20]
+    
+    # Distribution et évolution des scores, sur tout l'historique (une requête)
+    pourcentages, dates = statistics.colonnes(
+        resultats.order_by().annotate(jour=TruncDate('created_at')), 'pourcentage', 'jour',
+        dtypes={'pourcentage': float, 'jour': 'datetime64[D]'},
+    )
+    nombres, bornes = statistics.histogramme(pourcentages)
+    jours, moyennes, _ = statistics.serie_temporelle(dates, pourcentages)
     
     # Révisions flashcards
     revisions = Revision.objects.filter(
@@ -87,5 +42,14 @@ def performance_detail(request, matiere_id):
         'matiere': matiere,
         'resultats_qcm': resultats_qcm,
         'revisions': revisions,
+        'resume': statistics.resume(pourcentages),
+        'distribution': [
+            {'tranche': f'{int(bas)}-{int(haut)}', 'nombre': int(nombre)}
+            for bas, haut, nombre in zip(bornes[:-1], bornes[1:], nombres)
+        ],
+        'evolution': [
+            {'date': str(jour), 'score': round(float(moyenne), 2)}
+            for jour, moyenne in zip(jours, moyennes)
+        ],
     })
 
@@ -13,7 +13,7 @@ User = get_user_model()
 @admin.action(description='Exporter les utilisateurs sélectionnés en CSV')
 def export_selected_users_csv(modeladmin, request, queryset):
     """Action admin pour exporter les utilisateurs sélectionnés"""
-    response = CSVExporter.export_users(queryset)
+    response = CSVExporter.export_users(queryset, streaming=True)
     return response
 export_selected_users_csv.short_description = "Exporter en CSV"
 
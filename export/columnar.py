@@ -0,0 +1,203 @@
+"""
+Export colonnaire (Parquet, Arrow Feather) pour la data science
+
+Colonnes typées (entiers, flottants, booléens, horodatages UTC) au lieu de
+chaînes formatées. Les lignes sont lues par paquets (values_list +
+iterator) et écrites lot par lot ; en téléchargement, les octets de chaque
+lot sont envoyés dès qu'ils sont écrits : la mémoire reste bornée par la
+taille d'un lot.
+"""
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+from django.http import StreamingHttpResponse
+from qcm.models import ResultatQCM
+from flashcards.models import Revision
+from analytics.models import Activite
+from .services import DataScienceTable
+from .streaming import CHUNK_SIZE, iter_values, nom_fichier
+
+FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'feather': ('feather', 'application/vnd.apache.arrow.file'),
+}
+
+
+def _types():
+    """Types Arrow des colonnes (construits à la demande, pyarrow étant optionnel)"""
+    entier, texte, horodatage = pa.int64(), pa.string(), pa.timestamp('us', tz='UTC')
+    return {
+        'resultats': [
+            ('id', 'id', entier),
+            ('user_id', 'user_id', entier),
+            ('username', 'user__username', texte),
+            ('qcm_id', 'qcm_id', entier),
+            ('qcm', 'qcm__titre', texte),
+            ('matiere', 'qcm__chapitre__matiere__nom', texte),
+            ('score', 'score', pa.int32()),
+            ('total', 'total', pa.int32()),
+            ('pourcentage', 'pourcentage', pa.float64()),
+            ('created_at', 'created_at', horodatage),
+        ],
+        'revisions': [
+            ('id', 'id', entier),
+            ('user_id', 'user_id', entier),
+            ('username', 'user__username', texte),
+            ('flashcard_id', 'flashcard_id', entier),
+            ('deck', 'flashcard__deck__titre', texte),
+            ('matiere', 'flashcard__deck__chapitre__matiere__nom', texte),
+            ('reussie', 'reussie', pa.bool_()),
+            ('temps_reponse', 'temps_reponse', pa.int32()),
+            ('created_at', 'created_at', horodatage),
+        ],
+        'activites': [
+            ('id', 'id', entier),
+            ('user_id', 'user_id', entier),
+            ('username', 'user__username', texte),
+            ('type_activite', 'type_activite', texte),
+            ('description', 'description', texte),
+            ('duree_minutes', 'duree_minutes', pa.int32()),
+            ('created_at', 'created_at', horodatage),
+        ],
+        'data_science': list(zip(DataScienceTable.COLONNES, DataScienceTable.COLONNES, [
+            entier, texte, texte, texte, entier, entier, pa.float64(), entier,
+            entier, entier, entier, horodatage, horodatage,
+        ])),
+    }
+
+
+JEUX = {
+    'resultats': ResultatQCM,
+    'revisions': Revision,
+    'activites': Activite,
+    'data_science': None,  # Table consolidée (DataScienceTable)
+}
+
+
+class _TamponFlux:
+    """Fichier en écriture seule dont le contenu est vidé à chaque lot envoyé"""
+
+    closed = False
+
+    def __init__(self):
+        self.morceaux = []
+        self.position = 0
+
+    def write(self, donnees):
+        donnees = bytes(donnees)
+        self.morceaux.append(donnees)
+        self.position += len(donnees)
+        return len(donnees)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vider(self):
+        donnees = b''.join(self.morceaux)
+        self.morceaux = []
+        return donnees
+
+
+class ColumnarExporter:
+    """Service d'export Parquet / Feather"""
+
+    @staticmethod
+    def _lignes(jeu, colonnes, chunk_size):
+        if jeu == 'data_science':
+            return DataScienceTable.iter_lignes(chunk_size)
+        return iter_values(JEUX[jeu].objects.order_by('id'), [champ for _, champ, _ in colonnes], chunk_size)
+
+    @staticmethod
+    def _nouveau_writer(format, sink, schema):
+        if format == 'parquet':
+            return pq.ParquetWriter(sink, schema, compression='zstd')
+        return pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+    @classmethod
+    def iter_lots(cls, jeu, format, sink, batch_size=CHUNK_SIZE):
+        """
+        Écrit le jeu de données dans sink, un lot de batch_size lignes à la fois
+
+        Yields:
+            int: Le nombre de lignes écrites après chaque lot
+        """
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("Export colonnaire indisponible : installez pyarrow.")
+        if jeu not in JEUX or format not in FORMATS:
+            raise ValueError(f"Export inconnu : {jeu} / {format}")
+
+        colonnes = _types()[jeu]
+        schema = pa.schema([(nom, type_arrow) for nom, _, type_arrow in colonnes])
+        writer = cls._nouveau_writer(format, sink, schema)
+        lot = []
+        ecrites = 0
+        try:
+            for ligne in cls._lignes(jeu, colonnes, batch_size):
+                lot.append(ligne)
+                if len(lot) >= batch_size:
+                    writer.write_batch(cls._record_batch(lot, schema))
+                    ecrites += len(lot)
+                    lot = []
+                    yield ecrites
+            if lot or not ecrites:
+                writer.write_batch(cls._record_batch(lot, schema))
+                ecrites += len(lot)
+        finally:
+            writer.close()
+        yield ecrites
+
+    @staticmethod
+    def _record_batch(lot, schema):
+        """Transpose les lignes en colonnes typées"""
+        colonnes = list(zip(*lot)) if lot else [()] * len(schema)
+        return pa.RecordBatch.from_arrays(
+            [pa.array(valeurs, type=champ.type) for valeurs, champ in zip(colonnes, schema)],
+            schema=schema
+        )
+
+    @classmethod
+    def ecrire(cls, jeu, format, fichier, batch_size=CHUNK_SIZE):
+        """
+        Écrit l'export complet dans un fichier binaire ouvert
+
+        Returns:
+            int: Le nombre de lignes écrites
+        """
+        ecrites = 0
+        for ecrites in cls.iter_lots(jeu, format, fichier, batch_size):
+            pass
+        return ecrites
+
+    @classmethod
+    def iter_octets(cls, jeu, format, batch_size=CHUNK_SIZE):
+        """Octets du fichier, lot par lot (pour une réponse en flux)"""
+        tampon = _TamponFlux()
+        for _ in cls.iter_lots(jeu, format, tampon, batch_size):
+            donnees = tampon.vider()
+            if donnees:
+                yield donnees
+        donnees = tampon.vider()
+        if donnees:
+            yield donnees
+
+    @classmethod
+    def reponse(cls, jeu, format):
+        """Téléchargement en flux de l'export"""
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("Export colonnaire indisponible : installez pyarrow.")
+        if jeu not in JEUX or format not in FORMATS:
+            raise ValueError(f"Export inconnu : {jeu} / {format}")
+        extension, content_type = FORMATS[format]
+        response = StreamingHttpResponse(cls.iter_octets(jeu, format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{nom_fichier(f"learnia_{jeu}", extension)}"'
+        return response
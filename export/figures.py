@@ -0,0 +1,77 @@
+"""
+Graphiques des rapports PDF
+
+Fonctions pures : elles reçoivent des tableaux (NumPy, listes) et renvoient
+l'image PNG du graphique. Ce module n'importe pas Django, ce qui permet de
+les exécuter dans des processus séparés (voir reports.py).
+"""
+from io import BytesIO
+import matplotlib
+matplotlib.use('Agg')  # Backend non-interactif
+import matplotlib.pyplot as plt
+
+TAILLE_PAGE = (11, 8.5)
+DPI = 120
+
+
+def _png(fig):
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=DPI, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def barres(labels, valeurs, titre, xlabel, ylabel, ylim=None, format_valeur=None):
+    """Diagramme en barres, valeurs affichées au-dessus des barres si format_valeur"""
+    fig, ax = plt.subplots(figsize=TAILLE_PAGE)
+    bars = ax.bar(list(labels), list(valeurs), color='steelblue')
+    ax.set_xlabel(xlabel, fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.set_title(titre, fontsize=14, fontweight='bold')
+    if ylim:
+        ax.set_ylim(*ylim)
+    if format_valeur:
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width() / 2., height,
+                    format_valeur.format(height), ha='center', va='bottom')
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return _png(fig)
+
+
+def courbe(dates, valeurs, titre, xlabel, ylabel, couleur='green', moyenne=None):
+    """Courbe temporelle, avec la ligne de la moyenne si fournie"""
+    fig, ax = plt.subplots(figsize=TAILLE_PAGE)
+    ax.plot(dates, valeurs, marker='o', linestyle='-', color=couleur)
+    if moyenne is not None:
+        ax.axhline(y=moyenne, color='r', linestyle='--', label=f'Moyenne: {moyenne:.1f}%')
+        ax.legend()
+    ax.set_xlabel(xlabel, fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.set_title(titre, fontsize=14, fontweight='bold')
+    ax.grid(True, alpha=0.3)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return _png(fig)
+
+
+def camembert(labels, tailles, couleurs, titre):
+    """Diagramme circulaire avec pourcentages"""
+    fig, ax = plt.subplots(figsize=TAILLE_PAGE)
+    ax.pie(list(tailles), labels=list(labels), colors=list(couleurs), autopct='%1.1f%%', startangle=90)
+    ax.set_title(titre, fontsize=14, fontweight='bold')
+    fig.tight_layout()
+    return _png(fig)
+
+
+FIGURES = {
+    'barres': barres,
+    'courbe': courbe,
+    'camembert': camembert,
+}
+
+
+def rendre(nom, parametres):
+    """Point d'entrée des processus de rendu"""
+    return FIGURES[nom](**parametres)
@@ -0,0 +1,145 @@
+"""
+Chaîne de rendu des rapports PDF
+
+- Les données d'un rapport sont lues une fois, en tableaux NumPy
+- Chaque graphique est décrit par une Figure (fonction de figures.py et
+  paramètres) ; l'empreinte SHA-256 des paramètres sert de clé de cache :
+  le PNG d'un graphique dont les données n'ont pas changé n'est pas
+  recalculé
+- Les graphiques manquants sont rendus en série, ou dans un pool de
+  processus si settings.EXPORT_RENDER_PROCESSES > 0
+- reportlab assemble le PDF : pages de texte vectorielles et images des
+  graphiques
+"""
+import hashlib
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from .figures import rendre
+
+VERSION = 1  # À incrémenter quand le rendu des graphiques change
+CACHE_TTL = 60 * 60 * 24
+
+Figure = namedtuple('Figure', ['nom', 'parametres'])
+PageTexte = namedtuple('PageTexte', ['titre', 'lignes', 'sous_titre'], defaults=[''])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _hacher(valeur, h):
+    """Alimente le hash avec une valeur (tableaux, listes, dictionnaires, scalaires)"""
+    if isinstance(valeur, np.ndarray):
+        h.update(f'nd:{valeur.dtype.str}:{valeur.shape}:'.encode())
+        if valeur.dtype == object:
+            _hacher(valeur.tolist(), h)
+        else:
+            h.update(np.ascontiguousarray(valeur).tobytes())
+    elif isinstance(valeur, (list, tuple)):
+        h.update(f'seq:{len(valeur)}:'.encode())
+        for element in valeur:
+            _hacher(element, h)
+    elif isinstance(valeur, dict):
+        h.update(f'dict:{len(valeur)}:'.encode())
+        for cle in sorted(valeur):
+            _hacher(cle, h)
+            _hacher(valeur[cle], h)
+    else:
+        h.update(f'{type(valeur).__name__}:{valeur!r};'.encode())
+
+
+def empreinte(figure):
+    """Clé de cache d'un graphique : fonction, paramètres et version du rendu"""
+    h = hashlib.sha256(f'v{VERSION}:{figure.nom}:'.encode())
+    _hacher(figure.parametres, h)
+    return f'export:figure:{h.hexdigest()}'
+
+
+def _get_pool(processus):
+    """Pool de processus de rendu, créé à la première utilisation puis réutilisé"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=processus, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+class ReportPipeline:
+    """Rendu des graphiques (avec cache) et assemblage du PDF"""
+
+    @staticmethod
+    def rendre_figures(figures):
+        """
+        PNG des graphiques, dans l'ordre
+
+        Seuls les graphiques absents du cache sont rendus.
+        """
+        cles = [empreinte(figure) for figure in figures]
+        images = cache.get_many(cles)
+        manquantes = [(cle, figure) for cle, figure in zip(cles, figures) if cle not in images]
+
+        if manquantes:
+            processus = getattr(settings, 'EXPORT_RENDER_PROCESSES', 0)
+            noms = [figure.nom for _, figure in manquantes]
+            parametres = [figure.parametres for _, figure in manquantes]
+            if processus > 0 and len(manquantes) > 1:
+                rendues = list(_get_pool(processus).map(rendre, noms, parametres))
+            else:
+                rendues = list(map(rendre, noms, parametres))
+            nouvelles = {cle: png for (cle, _), png in zip(manquantes, rendues)}
+            cache.set_many(nouvelles, CACHE_TTL)
+            images.update(nouvelles)
+
+        return [images[cle] for cle in cles]
+
+    @staticmethod
+    def assembler(pages):
+        """PDF paysage : PageTexte dessinées en texte, PNG mis à l'échelle de la page"""
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=landscape(letter))
+        largeur, hauteur = landscape(letter)
+        marge = 0.4 * inch
+
+        for page in pages:
+            if isinstance(page, PageTexte):
+                pdf.setFont('Helvetica-Bold', 16)
+                pdf.drawCentredString(largeur / 2, hauteur - 0.6 * inch, page.titre)
+                if page.sous_titre:
+                    pdf.setFont('Helvetica', 10)
+                    pdf.drawCentredString(largeur / 2, hauteur - 0.85 * inch, page.sous_titre)
+                texte = pdf.beginText(1 * inch, hauteur - 1.6 * inch)
+                texte.setFont('Courier', 12)
+                texte.setLeading(18)
+                for ligne in page.lignes:
+                    texte.textLine(ligne)
+                pdf.drawText(texte)
+            else:
+                image = ImageReader(BytesIO(page))
+                image_largeur, image_hauteur = image.getSize()
+                echelle = min((largeur - 2 * marge) / image_largeur, (hauteur - 2 * marge) / image_hauteur)
+                l, h = image_largeur * echelle, image_hauteur * echelle
+                pdf.drawImage(image, (largeur - l) / 2, (hauteur - h) / 2, l, h)
+            pdf.showPage()
+
+        pdf.save()
+        return buffer.getvalue()
+
+    @classmethod
+    def pdf(cls, pages):
+        """
+        Construit le PDF d'une liste de pages (PageTexte ou Figure)
+
+        Tous les graphiques sont rendus en une fois avant l'assemblage.
+        """
+        figures = [page for page in pages if isinstance(page, Figure)]
+        images = iter(cls.rendre_figures(figures))
+        return cls.assembler([next(images) if isinstance(page, Figure) else page for page in pages])
@@ -2,289 +2,371 @@
 Services d'export et import de données
 Support CSV et PDF pour la data science
 """
+import codecs
+import copy
 import csv
-import io
-from datetime import datetime
-from django.http import HttpResponse
+from collections import defaultdict
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
 from accounts.models import Matiere, Chapitre
 from qcm.models import QCM, ResultatQCM
 from flashcards.models import Deck, Flashcard, Revision
 from tutor.models import Conversation, Message
 from analytics.models import Performance, Activite
+from .streaming import CHUNK_SIZE, format_date, iter_values, reponse_csv
 import json
 
 User = get_user_model()
 
 
 class CSVExporter:
-    """Service d'export CSV"""
+    """
+    Service d'export CSV
+
+    Les exports lisent des projections values_list par paquets (voir
+    streaming.py). Avec streaming=True (vues), la réponse est une
+    StreamingHttpResponse ; sinon le CSV est construit en mémoire.
+    """
     
     @staticmethod
-    def export_users(queryset=None):
-        """Export des utilisateurs en CSV"""
+    def lignes_users(queryset=None):
+        """En-têtes et lignes de l'export des utilisateurs (première colonne : id)"""
         if queryset is None:
             queryset = User.objects.all()
         
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="users_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        # En-têtes
-        writer.writerow([
+        champs = (
+            'id', 'username', 'email', 'first_name', 'last_name', 'niveau_etude', 'classe',
+            'ecole', 'date_naissance', 'date_joined', 'last_login', 'is_active',
+        )
+        lignes = (
+            [
+                user_id, username, email, prenom or '', nom or '', niveau, classe or '', ecole or '',
+                format_date(naissance, '%Y-%m-%d'), format_date(inscription), format_date(connexion),
+                'Oui' if actif else 'Non',
+            ]
+            for (user_id, username, email, prenom, nom, niveau, classe, ecole,
+                 naissance, inscription, connexion, actif) in iter_values(queryset, champs)
+        )
+        return [
             'ID', 'Username', 'Email', 'Prénom', 'Nom',
             'Niveau d\'étude', 'Classe', 'École', 'Date de naissance',
             'Date d\'inscription', 'Dernière connexion', 'Actif'
-        ])
-        
-        # Données
-        for user in queryset:
-            writer.writerow([
-                user.id,
-                user.username,
-                user.email,
-                user.first_name or '',
-                user.last_name or '',
-                user.niveau_etude,
-                user.classe or '',
-                user.ecole or '',
-                user.date_naissance.strftime('%Y-%m-%d') if user.date_naissance else '',
-                user.date_joined.strftime('%Y-%m-%d %H:%M:%S'),
-                user.last_login.strftime('%Y-%m-%d %H:%M:%S') if user.last_login else '',
-                'Oui' if user.is_active else 'Non'
-            ])
-        
-        return response
+        ], lignes
     
     @staticmethod
-    def export_statistics(queryset=None):
-        """Export des statistiques en CSV"""
+    def export_users(queryset=None, streaming=False):
+        """Export des utilisateurs en CSV"""
+        return reponse_csv('users', *CSVExporter.lignes_users(queryset), streaming=streaming)
+    
+    @staticmethod
+    def lignes_statistics(queryset=None):
+        """En-têtes et lignes de l'export des statistiques (première colonne : id)"""
         if queryset is None:
             queryset = ResultatQCM.objects.all()
         
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="statistics_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        # En-têtes
-        writer.writerow([
+        champs = (
+            'id', 'user__username', 'qcm__titre', 'qcm__chapitre__matiere__nom',
+            'score', 'total', 'pourcentage', 'created_at',
+        )
+        lignes = (
+            [resultat_id, username, titre, matiere or 'N/A', score, total, f"{pourcentage:.2f}%", format_date(date)]
+            for resultat_id, username, titre, matiere, score, total, pourcentage, date in iter_values(queryset, champs)
+        )
+        return [
             'ID', 'Utilisateur', 'QCM', 'Matière', 'Score', 'Total',
             'Pourcentage', 'Date'
-        ])
-        
-        for resultat in queryset.select_related('user', 'qcm', 'qcm__chapitre__matiere'):
-            matiere = resultat.qcm.chapitre.matiere.nom if resultat.qcm.chapitre else 'N/A'
-            writer.writerow([
-                resultat.id,
-                resultat.user.username,
-                resultat.qcm.titre,
-                matiere,
-                resultat.score,
-                resultat.total,
-                f"{resultat.pourcentage:.2f}%",
-                resultat.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        return response
+        ], lignes
     
     @staticmethod
-    def export_flashcards_stats(queryset=None):
-        """Export des statistiques de flashcards en CSV"""
+    def export_statistics(queryset=None, streaming=False):
+        """Export des statistiques en CSV"""
+        return reponse_csv('statistics', *CSVExporter.lignes_statistics(queryset), streaming=streaming)
+    
+    @staticmethod
+    def lignes_flashcards_stats(queryset=None):
+        """En-têtes et lignes de l'export des statistiques de flashcards (première colonne : id)"""
         if queryset is None:
             queryset = Revision.objects.all()
         
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="flashcards_stats_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
+        champs = (
+            'id', 'user__username', 'flashcard__deck__titre', 'flashcard__recto', 'flashcard__verso',
+            'reussie', 'temps_reponse', 'created_at',
+        )
+        lignes = (
+            [revision_id, username, deck, recto[:50], verso[:50], 'Oui' if reussie else 'Non', temps, format_date(date)]
+            for revision_id, username, deck, recto, verso, reussie, temps, date in iter_values(queryset, champs)
+        )
+        return [
             'ID', 'Utilisateur', 'Deck', 'Question', 'Réponse',
             'Réussie', 'Temps (secondes)', 'Date'
-        ])
-        
-        for revision in queryset.select_related('user', 'flashcard', 'flashcard__deck'):
-            writer.writerow([
-                revision.id,
-                revision.user.username,
-                revision.flashcard.deck.titre,
-                revision.flashcard.recto[:50],
-                revision.flashcard.verso[:50],
-                'Oui' if revision.reussie else 'Non',
-                revision.temps_reponse,
-                revision.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        return response
+        ], lignes
     
     @staticmethod
-    def export_performances(queryset=None):
-        """Export des performances en CSV"""
+    def export_flashcards_stats(queryset=None, streaming=False):
+        """Export des statistiques de flashcards en CSV"""
+        return reponse_csv('flashcards_stats', *CSVExporter.lignes_flashcards_stats(queryset), streaming=streaming)
+    
+    @staticmethod
+    def lignes_performances(queryset=None):
+        """En-têtes et lignes de l'export des performances (première colonne : id)"""
         if queryset is None:
             queryset = Performance.objects.all()
         
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="performances_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
+        champs = (
+            'id', 'user__username', 'matiere__nom', 'score_moyen', 'nombre_qcm',
+            'nombre_flashcards', 'temps_etude_minutes', 'updated_at',
+        )
+        lignes = (
+            [perf_id, username, matiere, f"{score:.2f}", nombre_qcm, nombre_flashcards, temps, format_date(date)]
+            for (perf_id, username, matiere, score, nombre_qcm,
+                 nombre_flashcards, temps, date) in iter_values(queryset, champs)
+        )
+        return [
             'ID', 'Utilisateur', 'Matière', 'Score moyen',
             'Nombre QCM', 'Nombre flashcards', 'Temps étude (minutes)',
             'Dernière mise à jour'
-        ])
-        
-        for perf in queryset.select_related('user', 'matiere'):
-            writer.writerow([
-                perf.id,
-                perf.user.username,
-                perf.matiere.nom,
-                f"{perf.score_moyen:.2f}",
-                perf.nombre_qcm,
-                perf.nombre_flashcards,
-                perf.temps_etude_minutes,
-                perf.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        return response
+        ], lignes
     
     @staticmethod
-    def export_activities(queryset=None):
-        """Export des activités en CSV"""
+    def export_performances(queryset=None, streaming=False):
+        """Export des performances en CSV"""
+        return reponse_csv('performances', *CSVExporter.lignes_performances(queryset), streaming=streaming)
+    
+    @staticmethod
+    def lignes_activities(queryset=None):
+        """En-têtes et lignes de l'export des activités (première colonne : id)"""
         if queryset is None:
             queryset = Activite.objects.all()
         
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="activities_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
+        champs = ('id', 'user__username', 'type_activite', 'description', 'duree_minutes', 'created_at')
+        lignes = (
+            [activite_id, username, type_activite, description, duree, format_date(date)]
+            for activite_id, username, type_activite, description, duree, date in iter_values(queryset, champs)
+        )
+        return [
             'ID', 'Utilisateur', 'Type', 'Description',
             'Durée (minutes)', 'Date'
-        ])
-        
-        for activity in queryset.select_related('user'):
-            writer.writerow([
-                activity.id,
-                activity.user.username,
-                activity.type_activite,
-                activity.description,
-                activity.duree_minutes,
-                activity.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        return response
+        ], lignes
     
     @staticmethod
-    def export_for_data_science():
-        """Export consolidé pour la data science"""
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="learnia_data_science_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'user_id', 'username', 'niveau_etude', 'matiere', 'score_qcm',
-            'total_qcm', 'pourcentage_qcm', 'flashcards_reussies',
-            'flashcards_total', 'temps_etude_minutes', 'nombre_activites',
-            'date_inscription', 'derniere_connexion'
-        ])
-        
-        # Agrégation des données par utilisateur
-        for user in User.objects.all():
-            # Stats QCM
-            resultats_qcm = ResultatQCM.objects.filter(user=user)
-            score_total = sum(r.score for r in resultats_qcm)
-            total_qcm = sum(r.total for r in resultats_qcm)
-            pourcentage_moyen = (score_total / total_qcm * 100) if total_qcm > 0 else 0
-            
-            # Stats Flashcards
-            revisions = Revision.objects.filter(user=user)
-            flashcards_reussies = revisions.filter(reussie=True).count()
-            flashcards_total = revisions.count()
+    def export_activities(queryset=None, streaming=False):
+        """Export des activités en CSV"""
+        return reponse_csv('activities', *CSVExporter.lignes_activities(queryset), streaming=streaming)
+    
+    @staticmethod
+    def lignes_data_science(depuis=None):
+        """En-têtes et lignes de l'export data science (première colonne : user_id)"""
+        lignes = (
+            [
+                user_id, username, niveau, matiere, score, total, f"{pourcentage:.2f}",
+                reussies, revisions, temps, activites,
+                format_date(inscription, '%Y-%m-%d'), format_date(connexion, '%Y-%m-%d'),
+            ]
+            for (user_id, username, niveau, matiere, score, total, pourcentage, reussies,
+                 revisions, temps, activites, inscription, connexion) in DataScienceTable.iter_lignes(depuis=depuis)
+        )
+        return DataScienceTable.COLONNES, lignes
+    
+    @staticmethod
+    def export_for_data_science(streaming=False):
+        """Export consolidé pour la data science (voir DataScienceTable)"""
+        return reponse_csv('learnia_data_science', *CSVExporter.lignes_data_science(), streaming=streaming)
+
+
+class DataScienceTable:
+    """
+    Table consolidée élève × matière pour la data science
+
+    Une ligne par (élève, matière) ayant des résultats de QCM, avec les
+    totaux flashcards et activités de l'élève. Les élèves sont parcourus
+    par tranches d'identifiants ; chaque tranche coûte quatre requêtes
+    (élèves, puis agrégats groupés QCM par matière, révisions, activités),
+    quel que soit le nombre de matières.
+    """
+    
+    COLONNES = [
+        'user_id', 'username', 'niveau_etude', 'matiere', 'score_qcm',
+        'total_qcm', 'pourcentage_qcm', 'flashcards_reussies',
+        'flashcards_total', 'temps_etude_minutes', 'nombre_activites',
+        'date_inscription', 'derniere_connexion'
+    ]
+    
+    @staticmethod
+    def iter_lignes(batch_size=CHUNK_SIZE, depuis=None):
+        """
+        Lignes typées (nombres, dates), dans l'ordre des COLONNES, triées par
+        élève puis par nom de matière
+
+        Args:
+            depuis: Reprendre après cet id utilisateur
+        """
+        # Rang de chaque matière dans l'ordre alphabétique
+        matieres = {
+            matiere_id: (rang, nom)
+            for rang, (matiere_id, nom) in enumerate(Matiere.objects.order_by('nom').values_list('id', 'nom'))
+        }
+        users = User.objects.order_by('id').values_list('id', 'username', 'niveau_etude', 'date_joined', 'last_login')
+        dernier = depuis
+        while True:
+            tranche = list((users.filter(id__gt=dernier) if dernier is not None else users)[:batch_size])
+            if not tranche:
+                return
+            dernier = tranche[-1][0]
+            portee = {'user_id__gte': tranche[0][0], 'user_id__lte': dernier}
             
-            # Stats activités
-            activites = Activite.objects.filter(user=user)
-            temps_total = sum(a.duree_minutes for a in activites)
-            nombre_activites = activites.count()
+            qcm = defaultdict(list)
+            for user_id, matiere_id, score, total in (
+                ResultatQCM.objects.filter(qcm__chapitre__matiere__isnull=False, **portee).order_by()
+                .values('user_id', 'qcm__chapitre__matiere_id')
+                .annotate(score=Sum('score'), total=Sum('total'))
+                .values_list('user_id', 'qcm__chapitre__matiere_id', 'score', 'total')
+            ):
+                qcm[user_id].append((matieres[matiere_id], score, total))
             
-            # Par matière
-            for matiere in Matiere.objects.all():
-                resultats_matiere = resultats_qcm.filter(
-                    qcm__chapitre__matiere=matiere
+            revisions = {
+                user_id: (reussies, total)
+                for user_id, reussies, total in (
+                    Revision.objects.filter(**portee).order_by().values('user_id')
+                    .annotate(reussies=Count('id', filter=Q(reussie=True)), total=Count('id'))
+                    .values_list('user_id', 'reussies', 'total')
                 )
-                if resultats_matiere.exists():
-                    score_matiere = sum(r.score for r in resultats_matiere)
-                    total_matiere = sum(r.total for r in resultats_matiere)
-                    pourcentage_matiere = (score_matiere / total_matiere * 100) if total_matiere > 0 else 0
-                    
-                    writer.writerow([
-                        user.id,
-                        user.username,
-                        user.niveau_etude,
-                        matiere.nom,
-                        score_matiere,
-                        total_matiere,
-                        f"{pourcentage_matiere:.2f}",
-                        flashcards_reussies,
-                        flashcards_total,
-                        temps_total,
-                        nombre_activites,
-                        user.date_joined.strftime('%Y-%m-%d'),
-                        user.last_login.strftime('%Y-%m-%d') if user.last_login else ''
-                    ])
-        
-        return response
+            }
+            activites = {
+                user_id: (temps, nombre)
+                for user_id, temps, nombre in (
+                    Activite.objects.filter(**portee).order_by().values('user_id')
+                    .annotate(temps=Sum('duree_minutes'), nombre=Count('id'))
+                    .values_list('user_id', 'temps', 'nombre')
+                )
+            }
+            
+            for user_id, username, niveau, inscription, connexion in tranche:
+                reussies, total_revisions = revisions.get(user_id, (0, 0))
+                temps, nombre_activites = activites.get(user_id, (0, 0))
+                for (_, matiere), score, total in sorted(qcm.get(user_id, ())):
+                    yield (
+                        user_id, username, niveau, matiere, score, total,
+                        (score / total * 100) if total > 0 else 0.0,
+                        reussies, total_revisions, temps, nombre_activites, inscription, connexion,
+                    )
 
 
 class CSVImporter:
-    """Service d'import CSV"""
+    """
+    Service d'import CSV
+
+    Le fichier est décodé au fil de la lecture et traité par lots : une
+    requête par lot pour retrouver les utilisateurs existants, puis
+    bulk_create / bulk_update dans une transaction. Les lignes invalides
+    sont signalées individuellement sans interrompre l'import.
+    """
+    
+    CHAMPS_MIS_A_JOUR = ['email', 'first_name', 'last_name', 'niveau_etude', 'classe', 'ecole', 'updated_at']
     
     @staticmethod
-    def import_users(csv_file):
-        """Import des utilisateurs depuis un fichier CSV"""
-        decoded_file = csv_file.read().decode('utf-8')
-        io_string = io.StringIO(decoded_file)
-        reader = csv.DictReader(io_string)
+    def import_users(csv_file, batch_size=1000):
+        """
+        Import des utilisateurs depuis un fichier CSV
+        
+        Returns:
+            tuple: (nombre d'utilisateurs créés ou mis à jour, liste d'erreurs)
+        """
+        reader = csv.DictReader(codecs.iterdecode(csv_file, 'utf-8-sig'))
         
         imported = 0
         errors = []
+        lot = []
+        try:
+            for row in reader:
+                lot.append((reader.line_num, row))
+                if len(lot) >= batch_size:
+                    imported += CSVImporter._importer_lot(lot, errors)
+                    lot = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            errors.append(f"Ligne {reader.line_num + 1}: Fichier illisible ({e})")
+        if lot:
+            imported += CSVImporter._importer_lot(lot, errors)
         
-        for row in reader:
+        return imported, errors
+    
+    @staticmethod
+    def _valeur(row, *cles, defaut=''):
+        """Première valeur renseignée parmi les colonnes possibles"""
+        for cle in cles:
+            if row.get(cle):
+                return row[cle]
+        return defaut
+    
+    @staticmethod
+    def _importer_lot(lot, errors):
+        """Crée ou met à jour les utilisateurs d'un lot ; renvoie le nombre de lignes importées"""
+        valeur = CSVImporter._valeur
+        usernames = {valeur(row, 'Username', 'username').strip() for _, row in lot}
+        existants = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        
+        a_creer = {}
+        a_modifier = {}
+        lignes = {}  # username -> numéro de la dernière ligne, pour les erreurs
+        maintenant = timezone.now()
+        for line_num, row in lot:
+            username = valeur(row, 'Username', 'username').strip()
+            email = valeur(row, 'Email', 'email').strip()
+            if not username or not email:
+                errors.append(f"Ligne {line_num}: Username et Email requis")
+                continue
+            
+            precedent = a_creer.get(username) or existants.get(username)
+            if precedent is None:
+                user = User(username=username, niveau_etude='6e')
+                user.set_unusable_password()
+            else:
+                user = copy.copy(precedent)  # L'original reste intact si la ligne est invalide
+            user.email = email
+            user.first_name = valeur(row, 'Prénom', 'first_name')
+            user.last_name = valeur(row, 'Nom', 'last_name')
+            user.niveau_etude = valeur(row, 'Niveau d\'étude', 'niveau_etude', defaut=user.niveau_etude)
+            user.classe = valeur(row, 'Classe', 'classe', defaut=user.classe)
+            user.ecole = valeur(row, 'École', 'ecole', defaut=user.ecole)
+            user.updated_at = maintenant
+            
             try:
-                username = row.get('Username') or row.get('username')
-                email = row.get('Email') or row.get('email')
-                
-                if not username or not email:
-                    errors.append(f"Ligne {reader.line_num}: Username et Email requis")
-                    continue
-                
-                # Créer ou mettre à jour l'utilisateur
-                user, created = User.objects.get_or_create(
-                    username=username,
-                    defaults={
-                        'email': email,
-                        'first_name': row.get('Prénom', '') or row.get('first_name', ''),
-                        'last_name': row.get('Nom', '') or row.get('last_name', ''),
-                        'niveau_etude': row.get('Niveau d\'étude', '6e') or row.get('niveau_etude', '6e'),
-                        'classe': row.get('Classe', '') or row.get('classe', ''),
-                        'ecole': row.get('École', '') or row.get('ecole', ''),
-                    }
-                )
-                
-                if not created:
-                    # Mettre à jour les champs
-                    user.email = email
-                    user.first_name = row.get('Prénom', '') or row.get('first_name', '')
-                    user.last_name = row.get('Nom', '') or row.get('last_name', '')
-                    user.niveau_etude = row.get('Niveau d\'étude', user.niveau_etude) or row.get('niveau_etude', user.niveau_etude)
-                    user.classe = row.get('Classe', user.classe) or row.get('classe', user.classe)
-                    user.ecole = row.get('École', user.ecole) or row.get('ecole', user.ecole)
-                    user.save()
-                
-                imported += 1
-                
-            except Exception as e:
-                errors.append(f"Ligne {reader.line_num}: {str(e)}")
+                user.full_clean(exclude=['password'], validate_unique=False, validate_constraints=False)
+            except ValidationError as e:
+                errors.append(f"Ligne {line_num}: " + '; '.join(
+                    f"{champ}: {' '.join(messages)}" for champ, messages in e.message_dict.items()
+                ))
+                continue
+            
+            if user.pk is None:
+                a_creer[username] = user
+            else:
+                a_modifier[username] = existants[username] = user
+            lignes[username] = line_num
         
-        return imported, errors
-
-
-
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(a_creer.values())
+                User.objects.bulk_update(a_modifier.values(), CSVImporter.CHAMPS_MIS_A_JOUR)
+            return len(a_creer) + len(a_modifier)
+        except DatabaseError:
+            # Conflit au niveau de la base : ligne par ligne pour isoler les erreurs
+            return CSVImporter._importer_ligne_par_ligne(a_creer, a_modifier, lignes, errors)
+    
+    @staticmethod
+    def _importer_ligne_par_ligne(a_creer, a_modifier, lignes, errors):
+        imported = 0
+        for username, user in [*a_creer.items(), *a_modifier.items()]:
+            try:
+                with transaction.atomic():
+                    if username in a_creer:
+                        user.pk = None
+                        user.save(force_insert=True)
+                    else:
+                        user.save(update_fields=CSVImporter.CHAMPS_MIS_A_JOUR)
+                imported += 1
+            except DatabaseError as e:
+                errors.append(f"Ligne {lignes[username]}: {str(e)}")
+        return imported
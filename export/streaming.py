@@ -0,0 +1,91 @@
+"""
+Export CSV en flux
+
+Les lignes sont lues par projections values_list parcourues avec
+iterator(chunk_size) (pas de cache de modèles), formatées par un
+csv.writer sur un pseudo-tampon et envoyées par paquets dans une
+StreamingHttpResponse : la mémoire reste constante quelle que soit la
+taille de l'export.
+
+Les lignes sont lues pendant l'envoi, après le retour de la vue : une
+erreur en cours d'export ne peut plus devenir un message ou une
+redirection. Elle est journalisée puis interrompt la connexion, ce qui
+fait échouer le téléchargement au lieu de livrer un fichier tronqué. Les
+gros exports passent par la tâche export.fichier (reprise possible).
+"""
+import csv
+import logging
+from datetime import datetime
+from django.http import HttpResponse, StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000  # Lignes lues par aller-retour en base
+LIGNES_PAR_PAQUET = 500  # Lignes CSV envoyées par morceau de réponse
+
+
+class Echo:
+    """Pseudo-fichier : write() renvoie la ligne au lieu de la stocker"""
+
+    def write(self, value):
+        return value
+
+
+def iter_values(queryset, champs, chunk_size=CHUNK_SIZE):
+    """Tuples des champs demandés, lus par paquets sans cache de modèles"""
+    return queryset.values_list(*champs).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(entetes, lignes, lignes_par_paquet=LIGNES_PAR_PAQUET):
+    """
+    Génère le CSV par morceaux de texte
+
+    Args:
+        entetes: Ligne d'en-têtes
+        lignes: Itérable de lignes (listes ou tuples)
+    """
+    writer = csv.writer(Echo())
+    paquet = [writer.writerow(entetes)]
+    for ligne in lignes:
+        paquet.append(writer.writerow(ligne))
+        if len(paquet) >= lignes_par_paquet:
+            yield ''.join(paquet)
+            paquet = []
+    if paquet:
+        yield ''.join(paquet)
+
+
+def journaliser_erreurs(morceaux, nom):
+    """Relaie les morceaux d'un export en flux en journalisant une erreur de lecture"""
+    try:
+        yield from morceaux
+    except Exception:
+        logger.exception("Export CSV %s interrompu", nom)
+        raise
+
+
+def nom_fichier(prefixe, extension='csv'):
+    """Nom de fichier daté, ex. users_20240315.csv"""
+    return f'{prefixe}_{datetime.now().strftime("%Y%m%d")}.{extension}'
+
+
+def reponse_csv(prefixe, entetes, lignes, streaming=True):
+    """
+    Réponse HTTP de téléchargement CSV
+
+    Avec streaming=False le contenu est construit en mémoire (petits
+    exports, tests) à partir du même générateur.
+    """
+    nom = nom_fichier(prefixe)
+    morceaux = iter_csv(entetes, lignes)
+    if streaming:
+        response = StreamingHttpResponse(journaliser_erreurs(morceaux, nom), content_type='text/csv; charset=utf-8')
+    else:
+        response = HttpResponse(''.join(morceaux), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nom}"'
+    return response
+
+
+def format_date(valeur, format='%Y-%m-%d %H:%M:%S'):
+    """Date formatée, chaîne vide si absente"""
+    return valeur.strftime(format) if valeur else ''
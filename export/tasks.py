@@ -0,0 +1,147 @@
+"""
+Tâches en arrière-plan de l'application export
+
+Un export demandé depuis le tableau de bord est écrit par un worker dans
+MEDIA_ROOT/exports/ puis servi en téléchargement : aucune requête web ne
+construit le fichier. Les exports CSV sont repris là où ils s'étaient
+arrêtés (checkpoint : dernier id écrit et taille du fichier) ; les
+fichiers Parquet / Feather, dont le pied de fichier n'est écrit qu'à la
+fin, sont régénérés depuis le début.
+"""
+import csv
+import os
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from jobs.models import Job
+from jobs.registry import register
+from qcm.models import ResultatQCM
+from flashcards.models import Revision
+from analytics.models import Performance, Activite
+from .columnar import FORMATS as FORMATS_COLONNAIRES, ColumnarExporter
+from .services import CSVExporter
+from .streaming import Echo, nom_fichier
+
+User = get_user_model()
+
+# Exports disponibles : nom -> (libellé, modèle parcouru par id, fonction des lignes CSV)
+EXPORTS = {
+    'users': ('Utilisateurs', User, CSVExporter.lignes_users),
+    'statistics': ('Résultats QCM', ResultatQCM, CSVExporter.lignes_statistics),
+    'flashcards': ('Révisions flashcards', Revision, CSVExporter.lignes_flashcards_stats),
+    'performances': ('Performances', Performance, CSVExporter.lignes_performances),
+    'activities': ('Activités', Activite, CSVExporter.lignes_activities),
+    'data_science': ('Data science (élève × matière)', None, None),
+}
+
+# Correspondance avec les jeux de l'export colonnaire
+JEUX_COLONNAIRES = {
+    'statistics': 'resultats',
+    'flashcards': 'revisions',
+    'activities': 'activites',
+    'data_science': 'data_science',
+}
+
+LIGNES_PAR_CHECKPOINT = 5000
+
+
+def formats_disponibles(export):
+    """Formats proposés pour un export"""
+    return ['csv'] + (list(FORMATS_COLONNAIRES) if export in JEUX_COLONNAIRES else [])
+
+
+class ExportFichier:
+    """Écriture reprenable du fichier d'un export"""
+
+    def __init__(self, job):
+        self.job = job
+        self.export = job.parametres['export']
+        self.format = job.parametres.get('format', 'csv')
+        if self.export not in EXPORTS or self.format not in formats_disponibles(self.export):
+            raise ValueError(f"Export inconnu : {self.export} / {self.format}")
+
+        self.relatif = f'exports/job_{job.id}.{self.format}'
+        self.chemin = Path(settings.MEDIA_ROOT) / self.relatif
+        self.partiel = self.chemin.with_name(self.chemin.name + '.part')
+
+    def executer(self):
+        self.chemin.parent.mkdir(parents=True, exist_ok=True)
+        total = self._total()
+        if self.format == 'csv':
+            lignes = self._ecrire_csv(total)
+        else:
+            lignes = self._ecrire_colonnaire(total)
+
+        os.replace(self.partiel, self.chemin)
+        Job.objects.filter(id=self.job.id).update(fichier=self.relatif)
+        prefixe = f'learnia_{self.export}'
+        return {'fichier': self.relatif, 'nom': nom_fichier(prefixe, self.format), 'lignes': lignes}
+
+    def _total(self):
+        """Nombre de lignes attendu, pour l'avancement"""
+        if self.export == 'data_science':
+            return (
+                ResultatQCM.objects.filter(qcm__chapitre__matiere__isnull=False)
+                .values('user_id', 'qcm__chapitre__matiere_id').distinct().count()
+            )
+        return EXPORTS[self.export][1].objects.count()
+
+    def _lignes(self, depuis):
+        """En-têtes et lignes CSV, triées par clé (première colonne) à partir de `depuis`"""
+        if self.export == 'data_science':
+            return CSVExporter.lignes_data_science(depuis=depuis)
+        _, modele, fonction = EXPORTS[self.export]
+        queryset = modele.objects.order_by('id')
+        if depuis is not None:
+            queryset = queryset.filter(id__gt=depuis)
+        return fonction(queryset)
+
+    def _ecrire_csv(self, total):
+        checkpoint = self.job.checkpoint or {}
+        reprise = bool(checkpoint) and self.partiel.exists()
+        if reprise:
+            # Retirer ce qui a été écrit après le dernier checkpoint
+            with open(self.partiel, 'r+b') as fichier:
+                fichier.truncate(checkpoint['octets'])
+            depuis, ecrites = checkpoint['dernier'], checkpoint['lignes']
+        else:
+            depuis, ecrites = None, 0
+
+        entetes, lignes = self._lignes(depuis)
+        writer = csv.writer(Echo())
+        with open(self.partiel, 'ab' if reprise else 'wb') as fichier:
+            if not reprise:
+                fichier.write(writer.writerow(entetes).encode('utf-8'))
+            paquet = []
+            for ligne in lignes:
+                # Un checkpoint ne coupe jamais les lignes d'une même clé
+                if len(paquet) >= LIGNES_PAR_CHECKPOINT and ligne[0] != paquet[-1][0]:
+                    ecrites = self._ecrire_paquet(fichier, writer, paquet, ecrites, total)
+                    paquet = []
+                paquet.append(ligne)
+            if paquet:
+                ecrites = self._ecrire_paquet(fichier, writer, paquet, ecrites, total)
+        return ecrites
+
+    def _ecrire_paquet(self, fichier, writer, paquet, ecrites, total):
+        fichier.write(''.join(writer.writerow(ligne) for ligne in paquet).encode('utf-8'))
+        fichier.flush()
+        ecrites += len(paquet)
+        avancement = min(99, int(ecrites * 100 / total)) if total else 99
+        self.job.sauver_checkpoint(
+            {'dernier': paquet[-1][0], 'lignes': ecrites, 'octets': fichier.tell()}, avancement
+        )
+        return ecrites
+
+    def _ecrire_colonnaire(self, total):
+        ecrites = 0
+        with open(self.partiel, 'wb') as fichier:
+            for ecrites in ColumnarExporter.iter_lots(JEUX_COLONNAIRES[self.export], self.format, fichier):
+                self.job.maj_progression(min(99, ecrites * 100 / total) if total else 99)
+        return ecrites
+
+
+@register('export.fichier')
+def exporter_fichier(job):
+    """Écrit le fichier d'un export dans MEDIA_ROOT/exports/"""
+    return ExportFichier(job).executer()
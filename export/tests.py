@@ -1,13 +1,27 @@
 """
 Tests unitaires pour l'application export
 """
-from django.test import TestCase, Client
+import io
+import tempfile
+from unittest import mock
+import numpy as np
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.contrib.auth.models import Permission
 from accounts.models import Matiere, Chapitre, User
 from qcm.models import QCM, ResultatQCM
-from .services import CSVExporter, CSVImporter
+from analytics.models import Activite
+from jobs.models import Job
+from jobs.services import JobService
+from .services import CSVExporter, CSVImporter, DataScienceTable
+from .columnar import ColumnarExporter
+from .figures import rendre
+from .reports import Figure, ReportPipeline, empreinte
+from .streaming import iter_csv, reponse_csv
 from .pdf_services import PDFExporter
 
 User = get_user_model()
@@ -76,6 +90,197 @@ class CSVExporterTest(TestCase):
         content = response.content.decode('utf-8')
         self.assertIn('user_id', content)
         self.assertIn('username', content)
+    
+    def test_export_data_science_agregats(self):
+        """Test la table élève × matière calculée par requêtes groupées"""
+        from flashcards.models import Deck, Flashcard, Revision
+        from analytics.models import Activite
+        physique = Matiere.objects.create(nom='Physique', code='PHY', niveau='college')
+        chapitre_physique = Chapitre.objects.create(matiere=physique, titre='Forces', numero=1, contenu='Contenu')
+        qcm_maths = QCM.objects.create(user=self.user, titre='Maths', chapitre=self.chapitre, texte_source='T')
+        qcm_physique = QCM.objects.create(user=self.user, titre='Physique', chapitre=chapitre_physique, texte_source='T')
+        qcm_libre = QCM.objects.create(user=self.user, titre='Libre', texte_source='T')
+        for qcm, score in ((qcm_physique, 3), (qcm_maths, 8), (qcm_maths, 6), (qcm_libre, 1)):
+            ResultatQCM.objects.create(user=self.user, qcm=qcm, score=score, total=10, pourcentage=score * 10)
+        autre = User.objects.create_user(username='autre', password='pass')
+        ResultatQCM.objects.create(user=autre, qcm=qcm_maths, score=5, total=5, pourcentage=100)
+        deck = Deck.objects.create(user=self.user, titre='Deck', chapitre=self.chapitre)
+        flashcard = Flashcard.objects.create(deck=deck, recto='Q', verso='R')
+        Revision.objects.create(user=self.user, flashcard=flashcard, reussie=True)
+        Revision.objects.create(user=self.user, flashcard=flashcard, reussie=False)
+        Activite.objects.create(user=self.user, type_activite='qcm', description='A', duree_minutes=15)
+        Activite.objects.create(user=self.user, type_activite='qcm', description='B', duree_minutes=5)
+        User.objects.create_user(username='inactif', password='pass')  # Sans résultat : aucune ligne
+        
+        with self.assertNumQueries(6):  # Matières, une tranche (4 requêtes), tranche vide
+            lignes = [ligne[:11] for ligne in DataScienceTable.iter_lignes()]
+        self.assertEqual(lignes, [
+            (self.user.id, 'testuser', self.user.niveau_etude, 'Mathématiques', 14, 20, 70.0, 1, 2, 20, 2),
+            (self.user.id, 'testuser', self.user.niveau_etude, 'Physique', 3, 10, 30.0, 1, 2, 20, 2),
+            (autre.id, 'autre', autre.niveau_etude, 'Mathématiques', 5, 5, 100.0, 0, 0, 0, 0),
+        ])
+        self.assertEqual([ligne[0] for ligne in DataScienceTable.iter_lignes(batch_size=1)], [l[0] for l in lignes])
+        
+        content = CSVExporter.export_for_data_science().content.decode('utf-8')
+        self.assertIn('testuser,6e,Mathématiques,14,20,70.00,1,2,20,2,', content)
+
+
+class StreamingExportTest(TestCase):
+    """Tests pour l'export CSV en flux"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', password='admin123', email='admin@example.com')
+        self.user.is_staff = True
+        self.user.save()
+    
+    def test_iter_csv_par_paquets(self):
+        """Test le découpage du CSV en morceaux"""
+        morceaux = list(iter_csv(['a', 'b'], [[1, 2], [3, 4], [5, 6]], lignes_par_paquet=2))
+        self.assertEqual(morceaux, ['a,b\r\n1,2\r\n', '3,4\r\n5,6\r\n'])
+    
+    def test_erreur_en_cours_de_flux(self):
+        """Test qu'une erreur pendant l'envoi est journalisée et interrompt le téléchargement"""
+        def lignes():
+            yield [1, 2]
+            raise DatabaseError('connexion perdue')
+        
+        response = reponse_csv('test', ['a', 'b'], lignes())
+        with self.assertLogs('export.streaming', 'ERROR') as logs, self.assertRaises(DatabaseError):
+            b''.join(response.streaming_content)
+        self.assertIn('interrompu', logs.output[0])
+    
+    def test_export_une_requete(self):
+        """Test que l'export lit toutes les lignes en une requête, sans instancier de modèles"""
+        Activite.objects.bulk_create([
+            Activite(user=self.user, type_activite='qcm', description=f'Activité {i}', duree_minutes=i)
+            for i in range(20)
+        ])
+        with self.assertNumQueries(1):
+            response = CSVExporter.export_activities()
+        self.assertEqual(response.content.decode('utf-8').count('admin'), 20)
+    
+    def test_vue_export_en_flux(self):
+        """Test que la vue renvoie une réponse en flux"""
+        qcm = QCM.objects.create(user=self.user, titre='QCM Test', texte_source='Texte')
+        ResultatQCM.objects.create(user=self.user, qcm=qcm, score=8, total=10, pourcentage=80.0)
+        self.client.login(username='admin', password='admin123')
+        
+        response = self.client.get(reverse('export:export_statistics_csv'))
+        self.assertTrue(response.streaming)
+        self.assertIn('statistics_', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('admin,QCM Test,N/A,8,10,80.00%', content)
+
+
+class ColumnarExportTest(TestCase):
+    """Tests pour l'export Parquet / Feather"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin', password='admin123', email='admin@example.com')
+        self.user.is_staff = True
+        self.user.save()
+        qcm = QCM.objects.create(user=self.user, titre='QCM Test', texte_source='Texte')
+        for score in range(5):
+            ResultatQCM.objects.create(user=self.user, qcm=qcm, score=score, total=4, pourcentage=score * 25)
+    
+    def test_parquet_par_lots(self):
+        """Test les colonnes typées et l'écriture par lots"""
+        import pyarrow.parquet as pq
+        fichier = io.BytesIO()
+        lignes = ColumnarExporter.ecrire('resultats', 'parquet', fichier, batch_size=2)
+        self.assertEqual(lignes, 5)
+        fichier.seek(0)
+        table = pq.read_table(fichier)
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(str(table.schema.field('pourcentage').type), 'double')
+        self.assertEqual(table.column('pourcentage').to_pylist(), [0.0, 25.0, 50.0, 75.0, 100.0])
+        self.assertEqual(table.column('matiere').to_pylist(), [None] * 5)
+    
+    def test_vue_feather_en_flux(self):
+        """Test le téléchargement Feather de la table consolidée"""
+        import pyarrow as pa
+        self.client.login(username='admin', password='admin123')
+        response = self.client.get(reverse('export:export_columnar', args=['data_science', 'feather']))
+        self.assertTrue(response.streaming)
+        table = pa.ipc.open_file(pa.BufferReader(b''.join(response.streaming_content))).read_all()
+        self.assertEqual(table.column_names, DataScienceTable.COLONNES)
+        
+        response = self.client.get(reverse('export:export_columnar', args=['inconnu', 'feather']))
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportJobTest(TestCase):
+    """Tests pour les exports en arrière-plan"""
+    
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.user = User.objects.create_user(username='admin', password='admin123', email='admin@example.com')
+        self.user.is_staff = True
+        self.user.save()
+        qcm = QCM.objects.create(user=self.user, titre='QCM Test', texte_source='Texte')
+        for score in range(7):
+            ResultatQCM.objects.create(user=self.user, qcm=qcm, score=score, total=10, pourcentage=score * 10)
+        self.client.login(username='admin', password='admin123')
+    
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+    
+    def _executer(self):
+        JobService.executer(JobService.reclamer('test')[0])
+    
+    def test_export_csv_en_arriere_plan(self):
+        """Test la mise en file, l'écriture du fichier et le téléchargement"""
+        response = self.client.post(reverse('export:export_job_create'), {'export': 'statistics', 'format': 'csv'})
+        self.assertRedirects(response, reverse('export:dashboard'))
+        job = Job.objects.get(type_job='export.fichier')
+        self.assertEqual(job.statut, 'en_attente')
+        
+        self._executer()
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'termine')
+        self.assertEqual(job.resultat['lignes'], 7)
+        
+        response = self.client.get(reverse('export:export_job_download', args=[job.id]))
+        self.assertIn('learnia_statistics_', response['Content-Disposition'])
+        attendu = CSVExporter.export_statistics(ResultatQCM.objects.order_by('id')).content
+        self.assertEqual(b''.join(response.streaming_content), attendu)
+    
+    def test_reprise_apres_interruption(self):
+        """Test la reprise au dernier checkpoint après un arrêt du worker"""
+        job = JobService.enqueue('export.fichier', {'export': 'statistics', 'format': 'csv'})
+        original = Job.sauver_checkpoint
+        checkpoints = []
+        
+        def interrompre(instance, checkpoint, progression=None):
+            checkpoints.append(checkpoint)
+            if len(checkpoints) == 2:
+                raise RuntimeError('Worker arrêté')  # Deuxième paquet écrit mais non enregistré
+            return original(instance, checkpoint, progression)
+        
+        with mock.patch('export.tasks.LIGNES_PAR_CHECKPOINT', 3), \
+                mock.patch.object(Job, 'sauver_checkpoint', autospec=True, side_effect=interrompre), \
+                self.assertLogs('jobs.services', level='ERROR'):
+            self._executer()
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'en_attente')
+        self.assertEqual(job.checkpoint['lignes'], 3)
+        
+        with mock.patch('export.tasks.LIGNES_PAR_CHECKPOINT', 3):
+            self._executer()
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'termine')
+        self.assertEqual(job.resultat['lignes'], 7)
+        with job.fichier.open('rb') as fichier:
+            contenu = fichier.read()
+        self.assertEqual(contenu, CSVExporter.export_statistics(ResultatQCM.objects.order_by('id')).content)
+    
+    def test_export_inconnu_refuse(self):
+        """Test qu'un format non proposé pour l'export n'est pas mis en file"""
+        self.client.post(reverse('export:export_job_create'), {'export': 'users', 'format': 'parquet'})
+        self.assertFalse(Job.objects.exists())
 
 
 class CSVImporterTest(TestCase):
@@ -122,6 +327,49 @@ existinguser,newemail@example.com,John,Doe,6e,6ème A,École Test"""
         self.assertEqual(user.email, 'newemail@example.com')
 
 
+class BulkCSVImporterTest(TestCase):
+    """Tests pour l'import par lots"""
+    
+    ENTETES = "Username,Email,Prénom,Nom,Niveau d'étude,Classe,École\n"
+    
+    def _fichier(self, lignes, bom=False):
+        contenu = ('\ufeff' if bom else '') + self.ENTETES + ''.join(lignes)
+        return io.BytesIO(contenu.encode('utf-8'))
+    
+    def test_import_par_lots_requetes_constantes(self):
+        """Test que le nombre de requêtes dépend du nombre de lots, pas de lignes"""
+        User.objects.create_user(username='eleve0', email='ancien@example.com', password='pass')
+        lignes = [f"eleve{i},eleve{i}@example.com,Prénom{i},Nom{i},5e,5ème A,École\n" for i in range(250)]
+        
+        # Par lot : lecture des existants, transaction, insertions (découpées selon la base), mise à jour
+        with CaptureQueriesContext(connection) as requetes:
+            imported, errors = CSVImporter.import_users(self._fichier(lignes, bom=True), batch_size=100)
+        self.assertLessEqual(len(requetes), 3 * 6)
+        self.assertEqual((imported, errors), (250, []))
+        self.assertEqual(User.objects.filter(username__startswith='eleve').count(), 250)
+        ancien = User.objects.get(username='eleve0')
+        self.assertEqual((ancien.email, ancien.niveau_etude), ('eleve0@example.com', '5e'))
+        self.assertTrue(ancien.check_password('pass'))
+        self.assertFalse(User.objects.get(username='eleve1').has_usable_password())
+    
+    def test_erreurs_par_ligne(self):
+        """Test que les lignes invalides sont signalées sans bloquer les autres"""
+        imported, errors = CSVImporter.import_users(self._fichier([
+            "valide,valide@example.com,A,B,6e,,\n",
+            ",sans-username@example.com,A,B,6e,,\n",
+            "mauvais,pas-un-email,A,B,6e,,\n",
+            "niveau,niveau@example.com,A,B,licence,,\n",
+            "valide,valide2@example.com,A,B,3e,,\n",  # Doublon : la dernière ligne l'emporte
+        ]))
+        self.assertEqual(imported, 1)
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(errors[0].startswith('Ligne 3:'))
+        self.assertIn('email', errors[1])
+        self.assertIn('niveau_etude', errors[2])
+        user = User.objects.get(username='valide')
+        self.assertEqual((user.email, user.niveau_etude), ('valide2@example.com', '3e'))
+
+
 class PDFExporterTest(TestCase):
     """Tests pour l'export PDF"""
     
@@ -181,6 +429,47 @@ class PDFExporterTest(TestCase):
         self.assertEqual(response['Content-Type'], 'application/pdf')
 
 
+class ReportPipelineTest(TestCase):
+    """Tests pour le rendu des rapports PDF"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        qcm = QCM.objects.create(user=self.user, titre='QCM Test', texte_source='Texte')
+        for score in (4, 8):
+            ResultatQCM.objects.create(user=self.user, qcm=qcm, score=score, total=10, pourcentage=score * 10)
+    
+    def test_empreinte_depend_des_donnees(self):
+        """Test que la clé de cache suit les données du graphique"""
+        figure = Figure('barres', {'labels': np.array(['A', 'B']), 'valeurs': np.array([1.0, 2.0])})
+        meme = Figure('barres', {'valeurs': np.array([1.0, 2.0]), 'labels': np.array(['A', 'B'])})
+        autre = Figure('barres', {'labels': np.array(['A', 'B']), 'valeurs': np.array([1.0, 2.5])})
+        self.assertEqual(empreinte(figure), empreinte(meme))
+        self.assertNotEqual(empreinte(figure), empreinte(autre))
+    
+    def test_graphiques_en_cache(self):
+        """Test qu'un rapport inchangé ne recalcule aucun graphique"""
+        with mock.patch('export.reports.rendre', wraps=rendre) as rendu:
+            premier = PDFExporter.export_statistics_pdf()
+            self.assertEqual(rendu.call_count, 3)  # Matières, distribution, évolution
+            PDFExporter.export_statistics_pdf()
+            self.assertEqual(rendu.call_count, 3)
+            
+            ResultatQCM.objects.create(user=self.user, qcm=QCM.objects.first(), score=1, total=10, pourcentage=10)
+            PDFExporter.export_statistics_pdf()
+            self.assertEqual(rendu.call_count, 6)
+        self.assertTrue(premier.content.startswith(b'%PDF'))
+    
+    @override_settings(EXPORT_RENDER_PROCESSES=2)
+    def test_rendu_dans_un_pool(self):
+        """Test le rendu des graphiques dans des processus séparés"""
+        images = ReportPipeline.rendre_figures([
+            Figure('barres', {'labels': ['A'], 'valeurs': [1], 'titre': 'T', 'xlabel': 'x', 'ylabel': 'y'}),
+            Figure('camembert', {'labels': ['A', 'B'], 'tailles': [1, 2], 'couleurs': ['r', 'g'], 'titre': 'T'}),
+        ])
+        self.assertEqual([image[:4] for image in images], [b'\x89PNG'] * 2)
+
+
 class ExportViewsTest(TestCase):
     """Tests pour les vues d'export"""
     
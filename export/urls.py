@@ -11,6 +11,9 @@ urlpatterns = [
     path('performances/csv/', views.export_performances_csv, name='export_performances_csv'),
     path('activities/csv/', views.export_activities_csv, name='export_activities_csv'),
     path('data-science/csv/', views.export_data_science_csv, name='export_data_science_csv'),
+    path('columnar/<str:jeu>/<str:format>/', views.export_columnar, name='export_columnar'),
+    path('jobs/', views.export_job_create, name='export_job_create'),
+    path('jobs/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
     path('statistics/pdf/', views.export_statistics_pdf, name='export_statistics_pdf'),
     path('user/<int:user_id>/pdf/', views.export_user_report_pdf, name='export_user_report_pdf'),
     path('data-science/pdf/', views.export_data_science_pdf, name='export_data_science_pdf'),
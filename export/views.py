@@ -1,98 +1,118 @@
 """
 Vues pour l'export et import de données
 """
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404, FileResponse
 from django.views.decorators.http import require_http_methods
 from .services import CSVExporter, CSVImporter
 from .pdf_services import PDFExporter
+from .columnar import ARROW_AVAILABLE, FORMATS, JEUX, ColumnarExporter
+from .tasks import EXPORTS, formats_disponibles
+from jobs.models import Job
+from jobs.services import JobService
 
 
 @staff_member_required
 def export_dashboard(request):
     """Tableau de bord pour l'export/import"""
-    return render(request, 'export/dashboard.html')
+    return render(request, 'export/dashboard.html', {
+        'jeux_colonnaires': [
+            ('resultats', 'Résultats QCM'),
+            ('revisions', 'Révisions flashcards'),
+            ('activites', 'Activités'),
+            ('data_science', 'Table consolidée élève × matière'),
+        ],
+        'exports_arriere_plan': [
+            (nom, libelle, formats_disponibles(nom)) for nom, (libelle, _, _) in EXPORTS.items()
+        ],
+        'export_jobs': Job.objects.filter(type_job='export.fichier').select_related('user')[:10],
+    })
+
+
+@staff_member_required
+@require_http_methods(["POST"])
+def export_job_create(request):
+    """Met un export en file : le fichier est écrit par le worker de tâches"""
+    export = request.POST.get('export')
+    format = request.POST.get('format', 'csv')
+    if export not in EXPORTS or format not in formats_disponibles(export):
+        messages.error(request, 'Export ou format inconnu.')
+        return redirect('export:dashboard')
+    
+    JobService.enqueue('export.fichier', {'export': export, 'format': format}, user=request.user)
+    messages.success(request, 'Export lancé en arrière-plan. Le fichier sera disponible ci-dessous.')
+    return redirect('export:dashboard')
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def export_job_download(request, job_id):
+    """Téléchargement du fichier produit par un export en arrière-plan"""
+    job = get_object_or_404(Job, id=job_id, type_job='export.fichier', statut='termine')
+    if not job.fichier:
+        raise Http404("Fichier introuvable")
+    try:
+        fichier = job.fichier.open('rb')
+    except FileNotFoundError:
+        raise Http404("Fichier introuvable")
+    return FileResponse(fichier, as_attachment=True, filename=job.resultat.get('nom') or job.fichier.name)
 
 
 @staff_member_required
 @require_http_methods(["GET"])
 def export_users_csv(request):
     """Export des utilisateurs en CSV"""
-    try:
-        response = CSVExporter.export_users()
-        messages.success(request, 'Export des utilisateurs réussi.')
-        return response
-    except Exception as e:
-        messages.error(request, f'Erreur lors de l\'export: {str(e)}')
-        return redirect('export:dashboard')
+    return CSVExporter.export_users(streaming=True)
 
 
 @staff_member_required
 @require_http_methods(["GET"])
 def export_statistics_csv(request):
     """Export des statistiques en CSV"""
-    try:
-        response = CSVExporter.export_statistics()
-        messages.success(request, 'Export des statistiques réussi.')
-        return response
-    except Exception as e:
-        messages.error(request, f'Erreur lors de l\'export: {str(e)}')
-        return redirect('export:dashboard')
+    return CSVExporter.export_statistics(streaming=True)
 
 
 @staff_member_required
 @require_http_methods(["GET"])
 def export_flashcards_csv(request):
     """Export des statistiques flashcards en CSV"""
-    try:
-        response = CSVExporter.export_flashcards_stats()
-        messages.success(request, 'Export des flashcards réussi.')
-        return response
-    except Exception as e:
-        messages.error(request, f'Erreur lors de l\'export: {str(e)}')
-        return redirect('export:dashboard')
+    return CSVExporter.export_flashcards_stats(streaming=True)
 
 
 @staff_member_required
 @require_http_methods(["GET"])
 def export_performances_csv(request):
     """Export des performances en CSV"""
-    try:
-        response = CSVExporter.export_performances()
-        messages.success(request, 'Export des performances réussi.')
-        return response
-    except Exception as e:
-        messages.error(request, f'Erreur lors de l\'export: {str(e)}')
-        return redirect('export:dashboard')
+    return CSVExporter.export_performances(streaming=True)
 
 
 @staff_member_required
 @require_http_methods(["GET"])
 def export_activities_csv(request):
     """Export des activités en CSV"""
-    try:
-        response = CSVExporter.export_activities()
-        messages.success(request, 'Export des activités réussi.')
-        return response
-    except Exception as e:
-        messages.error(request, f'Erreur lors de l\'export: {str(e)}')
-        return redirect('export:dashboard')
+    return CSVExporter.export_activities(streaming=True)
 
 
 @staff_member_required
 @require_http_methods(["GET"])
 def export_data_science_csv(request):
     """Export consolidé pour la data science en CSV"""
-    try:
-        response = CSVExporter.export_for_data_science()
-        messages.success(request, 'Export data science réussi.')
-        return response
-    except Exception as e:
-        messages.error(request, f'Erreur lors de l\'export: {str(e)}')
+    return CSVExporter.export_for_data_science(streaming=True)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def export_columnar(request, jeu, format):
+    """Export colonnaire (Parquet ou Feather) d'un jeu de données"""
+    if jeu not in JEUX or format not in FORMATS:
+        raise Http404("Export inconnu")
+    if not ARROW_AVAILABLE:
+        messages.error(request, 'Export colonnaire indisponible : pyarrow n\'est pas installé.')
         return redirect('export:dashboard')
+    return ColumnarExporter.reponse(jeu, format)
 
 
 @staff_member_required
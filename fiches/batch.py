@@ -0,0 +1,196 @@
+"""
+Packs de fiches : génération en lot pour une classe ou une matière
+
+Les documents (fiches enregistrées, chapitres ou decks) sont chargés en
+quelques requêtes, relations préchargées. Seuls ceux absents de
+FicheStore sont rendus, en parallèle dans un pool de processus : les
+workers reçoivent des fiches déjà complètes et renvoient les octets du
+PDF, sans accès à la base de données. Le processus principal enregistre
+chaque PDF dans FicheStore puis écrit le pack, dans l'ordre des
+documents : une archive ZIP, ou un seul PDF fusionné (pypdf).
+"""
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from accounts.models import Chapitre
+from flashcards.models import Deck
+from .models import FicheRevision
+from .services import FichePDFGenerator
+from .store import FicheStore
+
+try:
+    from pypdf import PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+SOURCES = {
+    'fiches': 'Fiches enregistrées',
+    'chapitres': 'Chapitres',
+    'decks': 'Decks de flashcards',
+}
+
+FICHES_PAR_ENVOI = 4  # Fiches transmises à un worker par envoi (chunksize)
+
+
+def formats_disponibles():
+    """Formats de pack proposés : le PDF fusionné nécessite pypdf"""
+    return ['zip'] + (['pdf'] if PYPDF_AVAILABLE else [])
+
+
+def nom_document(position, titre):
+    """Nom d'un PDF dans l'archive, préfixé par sa position pour garder l'ordre"""
+    base = re.sub(r'[^\w-]+', '_', titre).strip('_')[:60] or 'fiche'
+    return f'{position:03d}_{base}.pdf'
+
+
+def processus_par_defaut():
+    """Taille du pool de rendu : settings.FICHES_BATCH_PROCESSES, sinon un processus par processeur"""
+    return getattr(settings, 'FICHES_BATCH_PROCESSES', 0) or os.cpu_count() or 1
+
+
+def _rendre(fiche):
+    """Rendu d'une fiche dans un worker (octets du PDF)"""
+    return FichePDFGenerator.generate_fiche(fiche).getvalue()
+
+
+class FichePack:
+    """Génération de packs de fiches"""
+
+    @staticmethod
+    def documents(source, ids=None, matiere_id=None, classe=None, user=None):
+        """
+        Fiches d'un pack, dans l'ordre d'impression
+
+        Au moins un critère de sélection est requis.
+
+        Args:
+            source: 'fiches', 'chapitres' ou 'decks'
+            ids: Identifiants des objets de la source
+            matiere_id: Tous les objets d'une matière
+            classe: Fiches ou decks des élèves d'une classe (User.classe)
+            user: Auteur des fiches construites depuis des chapitres
+
+        Returns:
+            list: FicheRevision (enregistrées, ou construites et non enregistrées)
+        """
+        if source not in SOURCES:
+            raise ValueError(f"Source inconnue : {source}")
+        if not (ids or matiere_id or classe):
+            raise ValueError("Indiquer des identifiants, une matière ou une classe")
+        if source == 'chapitres' and classe:
+            raise ValueError("Les chapitres ne dépendent pas d'une classe")
+
+        if source == 'fiches':
+            queryset = FicheRevision.objects.select_related('chapitre__matiere').order_by(
+                'user__username', 'chapitre__matiere__nom', 'chapitre__numero', 'id'
+            )
+            filtres = {'chapitre__matiere_id': matiere_id, 'user__classe': classe}
+        elif source == 'chapitres':
+            queryset = Chapitre.objects.select_related('matiere').order_by('matiere__nom', 'numero', 'id')
+            filtres = {'matiere_id': matiere_id}
+        else:
+            queryset = Deck.objects.select_related('user', 'chapitre__matiere').prefetch_related(
+                'flashcards'
+            ).order_by('user__username', 'titre', 'id')
+            filtres = {'chapitre__matiere_id': matiere_id, 'user__classe': classe}
+
+        if ids:
+            queryset = queryset.filter(id__in=ids)
+        queryset = queryset.filter(**{champ: valeur for champ, valeur in filtres.items() if valeur})
+
+        if source == 'fiches':
+            return list(queryset)
+        if source == 'chapitres':
+            return [FichePDFGenerator.build_from_chapitre(chapitre, user) for chapitre in queryset]
+        return [FichePDFGenerator.build_from_flashcards(deck, deck.user) for deck in queryset]
+
+    @staticmethod
+    def rendre(fiches, processus=None, progression=None):
+        """
+        Chemins des PDF des fiches dans FicheStore, rendus si nécessaire
+
+        Args:
+            fiches: Fiches à rendre
+            processus: Taille du pool (settings.FICHES_BATCH_PROCESSES, puis
+                le nombre de processeurs, par défaut) ; 1 : rendu sur place
+            progression: Fonction appelée avec (documents prêts, total)
+
+        Returns:
+            list: Chemins, dans l'ordre des fiches
+        """
+        empreintes = [FicheStore.empreinte(fiche) for fiche in fiches]
+        chemins = [FicheStore.chemin(empreinte) for empreinte in empreintes]
+        manquants = [i for i, chemin in enumerate(chemins) if not chemin.exists()]
+        prets = len(fiches) - len(manquants)
+
+        processus = processus or processus_par_defaut()
+        processus = min(processus, len(manquants))
+        a_rendre = [fiches[i] for i in manquants]
+        if processus > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=processus,
+                mp_context=multiprocessing.get_context('spawn'),
+                # Avant tout import de modèles : configurer Django dans le worker
+                initializer=django.setup,
+            )
+            with pool:
+                FichePack._enregistrer(
+                    pool.map(_rendre, a_rendre, chunksize=FICHES_PAR_ENVOI),
+                    manquants, empreintes, prets, len(fiches), progression,
+                )
+        else:
+            FichePack._enregistrer(
+                map(_rendre, a_rendre), manquants, empreintes, prets, len(fiches), progression,
+            )
+        return chemins
+
+    @staticmethod
+    def _enregistrer(rendus, manquants, empreintes, prets, total, progression):
+        """Enregistre les PDF au fur et à mesure qu'ils arrivent des workers"""
+        if progression:
+            progression(prets, total)
+        for i, contenu in zip(manquants, rendus):
+            FicheStore.enregistrer(empreintes[i], contenu)
+            prets += 1
+            if progression:
+                progression(prets, total)
+
+    @staticmethod
+    def ecrire(fiches, chemins, format, sink):
+        """
+        Écrit le pack dans `sink` (fichier binaire ouvert en écriture)
+
+        zip : un PDF par fiche (stockés sans recompression, déjà compressés) ;
+        pdf : un seul document, avec un signet par fiche
+        """
+        if format not in formats_disponibles():
+            raise ValueError(f"Format indisponible : {format}")
+
+        if format == 'zip':
+            with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+                for position, (fiche, chemin) in enumerate(zip(fiches, chemins), 1):
+                    archive.write(chemin, nom_document(position, fiche.titre))
+        else:
+            writer = PdfWriter()
+            for fiche, chemin in zip(fiches, chemins):
+                writer.append(str(chemin), outline_item=fiche.titre)
+            writer.write(sink)
+
+    @classmethod
+    def generer(cls, fiches, format, sink, processus=None, progression=None):
+        """
+        Rend les fiches (en parallèle) puis écrit le pack
+
+        Returns:
+            int: Nombre de documents du pack
+        """
+        if format not in formats_disponibles():
+            raise ValueError(f"Format indisponible : {format}")
+        chemins = cls.rendre(fiches, processus, progression)
+        cls.ecrire(fiches, chemins, format, sink)
+        return len(fiches)
@@ -0,0 +1,27 @@
+"""
+Commande supprimant les PDF de fiches qui ne sont plus référencés
+Usage: python manage.py clean_fiches_pdf [--jours 7]
+
+Un PDF de FicheStore n'est plus référencé quand sa fiche a été modifiée
+ou supprimée. Idempotente : à planifier (cron), par exemple chaque nuit.
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from fiches.store import FicheStore
+
+
+class Command(BaseCommand):
+    help = "Supprime les PDF de fiches qu'aucune fiche enregistrée ne référence plus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=float, default=7,
+                            help="Âge minimal (en jours) d'un PDF non référencé avant suppression")
+
+    def handle(self, *args, **options):
+        if options['jours'] < 0:
+            raise CommandError("--jours ne peut pas être négatif")
+
+        supprimes, octets = FicheStore.nettoyer(timedelta(days=options['jours']))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {supprimes} fichier(s) supprimé(s), {octets / (1024 * 1024):.1f} Mo libéré(s)"
+        ))
@@ -0,0 +1,58 @@
+"""
+Commande générant un pack de fiches imprimable
+Usage: python manage.py generate_fiches_pack --source chapitres --matiere 3 --format pdf -o pack.pdf
+       python manage.py generate_fiches_pack --source fiches --classe "3e A" -o classe.zip [--processus 8]
+
+Les fiches sont rendues en parallèle (voir fiches/batch.py) ; un document
+déjà rendu (FicheStore) n'est pas recalculé.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from fiches.batch import SOURCES, FichePack, formats_disponibles
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Génère un pack de fiches (ZIP ou PDF fusionné) pour une classe, une matière ou une liste d'objets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=list(SOURCES), default='fiches', help="Documents du pack")
+        parser.add_argument('--ids', type=int, nargs='+', help="Identifiants des objets de la source")
+        parser.add_argument('--matiere', type=int, help="Id de la matière")
+        parser.add_argument('--classe', help="Classe des élèves (fiches et decks)")
+        parser.add_argument('--user', help="Auteur des fiches construites depuis des chapitres (username)")
+        parser.add_argument('--format', default='zip', help="zip ou pdf (PDF fusionné, nécessite pypdf)")
+        parser.add_argument('-o', '--output', required=True, help="Fichier à écrire")
+        parser.add_argument('--processus', type=int, help="Processus de rendu (défaut : FICHES_BATCH_PROCESSES)")
+
+    def handle(self, *args, **options):
+        if options['format'] not in formats_disponibles():
+            raise CommandError(f"Format indisponible : {options['format']} (disponibles : {', '.join(formats_disponibles())})")
+        if options['processus'] is not None and options['processus'] < 1:
+            raise CommandError("--processus doit être positif")
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur introuvable : {options['user']}")
+
+        try:
+            fiches = FichePack.documents(
+                options['source'], ids=options['ids'], matiere_id=options['matiere'],
+                classe=options['classe'], user=user,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        def progression(prets, total):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"{prets}/{total} fiche(s) prête(s)")
+
+        with open(options['output'], 'wb') as fichier:
+            documents = FichePack.generer(
+                fiches, options['format'], fichier, processus=options['processus'], progression=progression,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Pack écrit : {options['output']} ({documents} fiche(s))"))
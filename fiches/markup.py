@@ -0,0 +1,72 @@
+"""
+Analyse du contenu des fiches
+
+Le contenu d'une fiche (lignes « # titre », paragraphes séparés par une
+ligne vide, **gras**) est analysé en une passe avec des expressions
+compilées, puis converti en flowables ReportLab. Le résultat est mis en
+cache par (contenu, police) : une fiche déjà vue n'est ni ré-analysée, ni
+ses paragraphes reconstruits. Chaque appel reçoit des copies, car
+ReportLab enregistre l'état de mise en page sur les flowables.
+"""
+import copy
+import re
+from functools import lru_cache
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer
+from .styles import styles_corps
+
+TITRE = re.compile(r'#+\s*')
+GRAS = re.compile(r'\*\*(.+?)\*\*')
+
+
+def analyser(contenu):
+    """
+    Blocs du contenu d'une fiche
+
+    Returns:
+        list: ('titre', texte) ou ('paragraphe', texte) dans l'ordre ; les
+        lignes consécutives d'un paragraphe sont jointes par une espace
+    """
+    blocs = []
+    paragraphe = []
+
+    def terminer():
+        if paragraphe:
+            blocs.append(('paragraphe', ' '.join(paragraphe)))
+            paragraphe.clear()
+
+    for ligne in contenu.split('\n'):
+        ligne = ligne.strip()
+        if not ligne:
+            terminer()
+            continue
+        titre = TITRE.match(ligne)
+        if titre:
+            terminer()
+            blocs.append(('titre', ligne[titre.end():].strip()))
+        else:
+            paragraphe.append(GRAS.sub(r'<b>\1</b>', ligne))
+    terminer()
+    return blocs
+
+
+@lru_cache(maxsize=128)
+def _flowables(contenu, police):
+    intertitre, corps = styles_corps(police)
+    blocs = analyser(contenu)
+    story = []
+    for i, (nature, texte) in enumerate(blocs):
+        if nature == 'titre':
+            story.append(Paragraph(f'<b>{texte}</b>', intertitre))
+            story.append(Spacer(1, 0.1 * inch))
+        else:
+            story.append(Paragraph(texte, corps))
+            # Pas d'espace après le dernier paragraphe de la fiche
+            if i < len(blocs) - 1:
+                story.append(Spacer(1, 0.1 * inch))
+    return tuple(story)
+
+
+def flowables(contenu, police):
+    """Flowables du contenu d'une fiche, prêts à être ajoutés à un document"""
+    return [copy.copy(flowable) for flowable in _flowables(contenu, police)]
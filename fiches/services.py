@@ -2,14 +2,12 @@
 Service de génération de fiches de révision PDF
 """
 from io import BytesIO
-from datetime import datetime
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import A4, letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from .markup import flowables
+from .styles import styles_fiche
 
 
 class FichePDFGenerator:
@@ -46,6 +44,13 @@ class FichePDFGenerator:
         # Par défaut, utiliser Helvetica (sans-serif, similaire à Arial)
         return 'Helvetica'
     
+    @staticmethod
+    def date_fiche(fiche):
+        """Date affichée sur la fiche : dernière modification, ou aujourd'hui si non enregistrée"""
+        if fiche.updated_at:
+            return timezone.localtime(fiche.updated_at).date()
+        return timezone.localdate()
+    
     @staticmethod
     def generate_fiche(fiche):
         """Génère un PDF pour une fiche"""
@@ -61,99 +66,30 @@ class FichePDFGenerator:
             bottomMargin=18
         )
         
-        # Styles
-        styles = getSampleStyleSheet()
-        
-        # Obtenir la police compatible avec ReportLab
+        # Styles partagés par les fiches de même police et couleur de titre
         reportlab_font = FichePDFGenerator._get_reportlab_font(fiche.police)
-        
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor(fiche.couleur_titre),
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            fontName=reportlab_font
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=16,
-            spaceAfter=12,
-            fontName=reportlab_font
-        )
-        
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['BodyText'],
-            fontSize=11,
-            spaceAfter=12,
-            fontName=reportlab_font,
-            alignment=TA_LEFT
-        )
+        styles = styles_fiche(reportlab_font, fiche.couleur_titre)
         
         # Contenu
         story = []
         
         # Titre
-        story.append(Paragraph(fiche.titre, title_style))
+        story.append(Paragraph(fiche.titre, styles.titre))
         story.append(Spacer(1, 0.3*inch))
         
         # Informations
         if fiche.chapitre:
             info_text = f"<b>Matière:</b> {fiche.chapitre.matiere.nom}<br/>"
             info_text += f"<b>Chapitre:</b> {fiche.chapitre.titre}<br/>"
-            info_text += f"<b>Date:</b> {datetime.now().strftime('%d/%m/%Y')}"
-            story.append(Paragraph(info_text, body_style))
+            info_text += f"<b>Date:</b> {FichePDFGenerator.date_fiche(fiche).strftime('%d/%m/%Y')}"
+            story.append(Paragraph(info_text, styles.corps))
             story.append(Spacer(1, 0.2*inch))
         
         # Ligne séparatrice
         story.append(Spacer(1, 0.1*inch))
         
-        # Contenu de la fiche (convertir les sauts de ligne)
-        lines = fiche.contenu.split('\n')
-        current_para = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                if current_para:
-                    para_text = ' '.join(current_para)
-                    story.append(Paragraph(para_text, body_style))
-                    story.append(Spacer(1, 0.1*inch))
-                    current_para = []
-                continue
-            
-            # Détecter les titres (lignes avec #)
-            if line.startswith('##'):
-                if current_para:
-                    para_text = ' '.join(current_para)
-                    story.append(Paragraph(para_text, body_style))
-                    story.append(Spacer(1, 0.1*inch))
-                    current_para = []
-                title_text = line.lstrip('#').strip()
-                story.append(Paragraph(f"<b>{title_text}</b>", heading_style))
-                story.append(Spacer(1, 0.1*inch))
-            elif line.startswith('#'):
-                if current_para:
-                    para_text = ' '.join(current_para)
-                    story.append(Paragraph(para_text, body_style))
-                    story.append(Spacer(1, 0.1*inch))
-                    current_para = []
-                title_text = line.lstrip('#').strip()
-                story.append(Paragraph(f"<b>{title_text}</b>", heading_style))
-                story.append(Spacer(1, 0.1*inch))
-            else:
-                # Convertir **bold** en HTML
-                line = line.replace('**', '<b>', 1).replace('**', '</b>', 1)
-                current_para.append(line)
-        
-        # Ajouter le dernier paragraphe
-        if current_para:
-            para_text = ' '.join(current_para)
-            story.append(Paragraph(para_text, body_style))
+        # Contenu de la fiche (analysé une fois, puis servi depuis le cache)
+        story.extend(flowables(fiche.contenu, reportlab_font))
         
         # Générer le PDF
         doc.build(story)
@@ -162,8 +98,8 @@ class FichePDFGenerator:
         return buffer
     
     @staticmethod
-    def generate_from_chapitre(chapitre, user, titre_custom=None):
-        """Génère une fiche depuis un chapitre"""
+    def build_from_chapitre(chapitre, user, titre_custom=None):
+        """Fiche (non enregistrée) construite depuis un chapitre"""
         titre = titre_custom or f"Fiche - {chapitre.titre}"
         
         # Extraire le contenu structuré
@@ -172,7 +108,7 @@ class FichePDFGenerator:
         
         # Créer la fiche temporaire
         from .models import FicheRevision
-        fiche = FicheRevision(
+        return FicheRevision(
             user=user,
             titre=titre,
             chapitre=chapitre,
@@ -180,12 +116,15 @@ class FichePDFGenerator:
             police='Helvetica',  # Police par défaut compatible ReportLab
             couleur_titre='#000000'  # Couleur par défaut
         )
-        
-        return FichePDFGenerator.generate_fiche(fiche)
     
     @staticmethod
-    def generate_from_flashcards(deck, user):
-        """Génère une fiche depuis un deck de flashcards"""
+    def generate_from_chapitre(chapitre, user, titre_custom=None):
+        """Génère une fiche depuis un chapitre"""
+        return FichePDFGenerator.generate_fiche(FichePDFGenerator.build_from_chapitre(chapitre, user, titre_custom))
+    
+    @staticmethod
+    def build_from_flashcards(deck, user):
+        """Fiche (non enregistrée) construite depuis un deck de flashcards"""
         titre = f"Fiche Flashcards - {deck.titre}"
         
         contenu = f"## {deck.titre}\n\n"
@@ -196,7 +135,7 @@ class FichePDFGenerator:
             contenu += f"   → {flashcard.verso}\n\n"
         
         from .models import FicheRevision
-        fiche = FicheRevision(
+        return FicheRevision(
             user=user,
             titre=titre,
             chapitre=deck.chapitre,
@@ -204,6 +143,8 @@ class FichePDFGenerator:
             police='Helvetica',  # Police par défaut compatible ReportLab
             couleur_titre='#000000'  # Couleur par défaut
         )
-        
-        return FichePDFGenerator.generate_fiche(fiche)
-
+    
+    @staticmethod
+    def generate_from_flashcards(deck, user):
+        """Génère une fiche depuis un deck de flashcards"""
+        return FichePDFGenerator.generate_fiche(FichePDFGenerator.build_from_flashcards(deck, user))
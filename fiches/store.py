@@ -0,0 +1,131 @@
+"""
+Stockage des PDF de fiches déjà rendus
+
+Le PDF d'une fiche ne dépend que de ce qu'il affiche (titre, contenu,
+police, couleur du titre, chapitre et date) : l'empreinte SHA-256 de ces
+valeurs nomme le fichier sous MEDIA_ROOT/fiches/pdf/ et sert d'ETag. Une
+fiche inchangée est servie depuis le disque (un 304 si le navigateur a
+déjà la bonne version) ; la modifier change l'empreinte, le PDF est alors
+rendu à nouveau.
+
+L'ancien PDF n'est plus référencé par aucune fiche : la commande
+clean_fiches_pdf (à planifier) supprime ces fichiers, ainsi que les
+écritures interrompues, au-delà d'un âge minimal.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from .models import FicheRevision
+from .services import FichePDFGenerator
+
+VERSION = 2  # À incrémenter quand la mise en page des fiches change
+AGE_PARTIEL = timedelta(hours=1)  # Au-delà, un fichier .part est une écriture interrompue
+
+
+class FicheStore:
+    """PDF de fiches rendus, adressés par contenu"""
+
+    DOSSIER = 'fiches/pdf'
+
+    @staticmethod
+    def empreinte(fiche):
+        """Empreinte hexadécimale de tout ce qui est affiché dans le PDF"""
+        chapitre = fiche.chapitre
+        valeurs = [
+            VERSION,
+            fiche.titre,
+            fiche.contenu,
+            FichePDFGenerator._get_reportlab_font(fiche.police),
+            fiche.couleur_titre,
+            [chapitre.id, chapitre.titre, chapitre.matiere.nom] if chapitre else None,
+            FichePDFGenerator.date_fiche(fiche).isoformat() if chapitre else None,
+        ]
+        return hashlib.sha256(json.dumps(valeurs, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def etag(empreinte):
+        return f'"{empreinte}"'
+
+    @classmethod
+    def chemin(cls, empreinte):
+        """Fichier du PDF, réparti en sous-dossiers par les deux premiers caractères"""
+        return Path(settings.MEDIA_ROOT) / cls.DOSSIER / empreinte[:2] / f'{empreinte}.pdf'
+
+    @classmethod
+    def obtenir(cls, fiche, empreinte=None):
+        """
+        Chemin du PDF de la fiche, rendu puis enregistré s'il n'existe pas
+
+        Returns:
+            tuple: (chemin, empreinte)
+        """
+        empreinte = empreinte or cls.empreinte(fiche)
+        chemin = cls.chemin(empreinte)
+        if not chemin.exists():
+            cls.enregistrer(empreinte, FichePDFGenerator.generate_fiche(fiche).getvalue())
+        return chemin, empreinte
+
+    @classmethod
+    def enregistrer(cls, empreinte, contenu):
+        """Écrit le PDF correspondant à une empreinte ; retourne son chemin"""
+        chemin = cls.chemin(empreinte)
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        # Écriture atomique : un téléchargement concurrent ne lit jamais un fichier partiel
+        descripteur, temporaire = tempfile.mkstemp(dir=chemin.parent, suffix='.part')
+        try:
+            with os.fdopen(descripteur, 'wb') as fichier:
+                fichier.write(contenu)
+            os.replace(temporaire, chemin)
+        except OSError:
+            Path(temporaire).unlink(missing_ok=True)
+            raise
+        return chemin
+
+    @classmethod
+    def empreintes_courantes(cls):
+        """Empreintes de toutes les fiches enregistrées"""
+        fiches = FicheRevision.objects.select_related('chapitre__matiere').order_by()
+        return {cls.empreinte(fiche) for fiche in fiches.iterator(chunk_size=1000)}
+
+    @classmethod
+    def nettoyer(cls, age=timedelta(days=7)):
+        """
+        Supprime les PDF qu'aucune fiche enregistrée ne référence
+
+        Seuls les fichiers écrits il y a plus de `age` sont supprimés : les
+        documents des packs (chapitres, decks), qui ne correspondent à
+        aucune fiche enregistrée, restent ainsi réutilisables un temps.
+
+        Returns:
+            tuple: (nombre de fichiers supprimés, octets libérés)
+        """
+        racine = Path(settings.MEDIA_ROOT) / cls.DOSSIER
+        if not racine.is_dir():
+            return 0, 0
+        empreintes = cls.empreintes_courantes()
+        maintenant = time.time()
+        limites = {
+            '.pdf': maintenant - age.total_seconds(),
+            '.part': maintenant - AGE_PARTIEL.total_seconds(),
+        }
+
+        supprimes = octets = 0
+        for chemin in racine.glob('*/*'):
+            limite = limites.get(chemin.suffix)
+            if limite is None or (chemin.suffix == '.pdf' and chemin.stem in empreintes):
+                continue
+            try:
+                infos = chemin.stat()
+                if infos.st_mtime > limite:
+                    continue
+                chemin.unlink()
+            except FileNotFoundError:
+                continue  # Supprimé entre-temps
+            supprimes += 1
+            octets += infos.st_size
+        return supprimes, octets
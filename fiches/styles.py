@@ -0,0 +1,67 @@
+"""
+Registre des styles ReportLab des fiches
+
+La feuille de styles de base et les trois styles d'une fiche (titre,
+intertitre, corps) sont construits une fois par couple (police, couleur du
+titre) puis réutilisés : ils ne sont jamais modifiés après création.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+StylesFiche = namedtuple('StylesFiche', ['titre', 'intertitre', 'corps'])
+
+
+@lru_cache(maxsize=1)
+def feuille_de_base():
+    """Feuille de styles d'exemple de ReportLab (parents des styles des fiches)"""
+    return getSampleStyleSheet()
+
+
+@lru_cache(maxsize=64)
+def styles_fiche(police, couleur_titre):
+    """
+    Styles d'une fiche
+
+    Args:
+        police: Police ReportLab (déjà convertie, voir FichePDFGenerator._get_reportlab_font)
+        couleur_titre: Couleur hexadécimale du titre
+    """
+    intertitre, corps = styles_corps(police)
+    return StylesFiche(
+        titre=ParagraphStyle(
+            'CustomTitle',
+            parent=feuille_de_base()['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor(couleur_titre),
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            fontName=police,
+        ),
+        intertitre=intertitre,
+        corps=corps,
+    )
+
+
+@lru_cache(maxsize=16)
+def styles_corps(police):
+    """Styles de l'intertitre et du corps, qui ne dépendent que de la police"""
+    base = feuille_de_base()
+    intertitre = ParagraphStyle(
+        'CustomHeading',
+        parent=base['Heading2'],
+        fontSize=16,
+        spaceAfter=12,
+        fontName=police,
+    )
+    corps = ParagraphStyle(
+        'CustomBody',
+        parent=base['BodyText'],
+        fontSize=11,
+        spaceAfter=12,
+        fontName=police,
+        alignment=TA_LEFT,
+    )
+    return intertitre, corps
@@ -0,0 +1,59 @@
+"""
+Tâches en arrière-plan de l'application fiches
+
+Un pack demandé depuis la liste des fiches est généré par un worker dans
+MEDIA_ROOT/fiches/packs/ puis servi en téléchargement. Le rendu peut
+lui-même utiliser un pool de processus : dans un pool run_jobs, sa taille
+est limitée à la part de processeurs de la tâche (jobs.worker), pour ne
+pas multiplier les processus par ceux des autres tâches en cours.
+"""
+import os
+from pathlib import Path
+from django.conf import settings
+from django.utils import timezone
+from jobs.models import Job
+from jobs.registry import register
+from jobs.worker import processus_par_tache
+from .batch import FichePack, processus_par_defaut
+
+
+@register('fiches.pack')
+def generer_pack(job):
+    """
+    Génère un pack de fiches (ZIP ou PDF fusionné)
+
+    Paramètre optionnel ``processus`` : taille du pool de rendu (1 : rendu
+    sur place) ; par défaut celle de FichePack, plafonnée dans un pool run_jobs.
+    """
+    parametres = job.parametres
+    format = parametres.get('format', 'zip')
+    processus = parametres.get('processus')
+    if not processus:
+        processus = processus_par_defaut()
+        plafond = processus_par_tache()
+        if plafond:
+            processus = min(processus, plafond)
+    fiches = FichePack.documents(
+        parametres['source'],
+        ids=parametres.get('ids'),
+        matiere_id=parametres.get('matiere_id'),
+        classe=parametres.get('classe'),
+        user=job.user,
+    )
+
+    relatif = f'fiches/packs/job_{job.id}.{format}'
+    chemin = Path(settings.MEDIA_ROOT) / relatif
+    partiel = chemin.with_name(chemin.name + '.part')
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+
+    def progression(prets, total):
+        # Le rendu représente l'essentiel du travail ; l'écriture du pack, la fin
+        job.maj_progression(prets * 95 / total if total else 95)
+
+    with open(partiel, 'wb') as fichier:
+        documents = FichePack.generer(fiches, format, fichier, processus=processus, progression=progression)
+    os.replace(partiel, chemin)
+    Job.objects.filter(id=job.id).update(fichier=relatif)
+
+    nom = f"pack_{parametres['source']}_{timezone.localdate().strftime('%Y%m%d')}.{format}"
+    return {'fichier': relatif, 'nom': nom, 'documents': documents}
@@ -1,13 +1,26 @@
 """
 Tests unitaires pour l'application fiches
 """
-from django.test import TestCase, Client
+import io
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from accounts.models import Matiere, Chapitre
-from flashcards.models import Deck
+from flashcards.models import Deck, Flashcard
+from jobs.models import Job
+from .batch import PYPDF_AVAILABLE, FichePack
 from .models import FicheRevision
 from .services import FichePDFGenerator
+from .markup import analyser, flowables, _flowables
+from .store import FicheStore
+from .styles import styles_fiche
 
 User = get_user_model()
 
@@ -108,10 +121,56 @@ class FichePDFGeneratorTest(TestCase):
         self.assertGreater(len(buffer.getvalue()), 0)
 
 
+class FicheMarkupTest(TestCase):
+    """Tests pour l'analyse du contenu et le registre de styles"""
+    
+    def test_analyser(self):
+        """Test les titres, paragraphes et le gras"""
+        contenu = "# Titre\nPremière **ligne**\n  suite **a** et **b**\n\n## Sous-titre\nFin ** seule"
+        self.assertEqual(analyser(contenu), [
+            ('titre', 'Titre'),
+            ('paragraphe', 'Première <b>ligne</b> suite <b>a</b> et <b>b</b>'),
+            ('titre', 'Sous-titre'),
+            ('paragraphe', 'Fin ** seule'),
+        ])
+        self.assertEqual(analyser('\n\n'), [])
+    
+    def test_flowables_en_cache(self):
+        """Test qu'un contenu déjà vu n'est pas ré-analysé, et que chaque appel reçoit des copies"""
+        _flowables.cache_clear()
+        premiers = flowables('# Titre\nTexte', 'Helvetica')
+        seconds = flowables('# Titre\nTexte', 'Helvetica')
+        self.assertEqual(_flowables.cache_info().hits, 1)
+        self.assertEqual(len(premiers), 3)
+        self.assertIsNot(premiers[0], seconds[0])
+        self.assertIs(premiers[0].frags, seconds[0].frags)
+    
+    def test_styles_partages(self):
+        """Test le registre de styles par (police, couleur)"""
+        styles = styles_fiche('Helvetica', '#007bff')
+        self.assertIs(styles_fiche('Helvetica', '#007bff'), styles)
+        autres = styles_fiche('Helvetica', '#ff0000')
+        self.assertIsNot(autres.titre, styles.titre)
+        self.assertIs(autres.corps, styles.corps)
+        self.assertEqual(styles.titre.fontName, 'Helvetica')
+    
+    def test_fiche_longue_reconstruite(self):
+        """Test qu'une fiche de plusieurs pages se reconstruit à l'identique depuis le cache"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        fiche = FicheRevision(user=user, titre='Longue', contenu='\n\n'.join(['**Mot** ' * 300] * 5))
+        tailles = {len(FichePDFGenerator.generate_fiche(fiche).getvalue()) for _ in range(3)}
+        self.assertEqual(len(tailles), 1)
+
+
 class FichesViewsTest(TestCase):
     """Tests pour les vues fiches"""
     
     def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -190,6 +249,230 @@ class FichesViewsTest(TestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/pdf')
+    
+    def test_fiche_download_etag(self):
+        """Test le PDF servi depuis le disque et la revalidation par ETag"""
+        self.client.login(username='testuser', password='testpass123')
+        fiche = FicheRevision.objects.create(user=self.user, titre='Fiche test', contenu='Contenu')
+        url = reverse('fiches:download', kwargs={'fiche_id': fiche.id})
+        
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        
+        with mock.patch.object(FichePDFGenerator, 'generate_fiche') as generation:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            generation.assert_not_called()
+        
+        fiche.contenu = 'Nouveau contenu'
+        fiche.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
 
 
+class FicheStoreTest(TestCase):
+    """Tests pour le stockage des PDF rendus"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        matiere = Matiere.objects.create(nom='Mathématiques', code='MATH', niveau='college')
+        self.chapitre = Chapitre.objects.create(matiere=matiere, titre='Les équations', numero=1, contenu='Contenu')
+        self.fiche = FicheRevision.objects.create(
+            user=self.user, titre='Fiche', contenu='# Titre\n**Gras** texte', chapitre=self.chapitre
+        )
+    
+    def test_empreinte(self):
+        """Test que l'empreinte suit tout ce qui est affiché"""
+        empreinte = FicheStore.empreinte(self.fiche)
+        copie = FicheRevision.objects.get(id=self.fiche.id)
+        self.assertEqual(FicheStore.empreinte(copie), empreinte)
+        
+        for champ, valeur in (('titre', 'Autre'), ('contenu', 'Autre'), ('police', 'Courier'),
+                              ('couleur_titre', '#ff0000'), ('chapitre', None)):
+            modifiee = FicheRevision.objects.get(id=self.fiche.id)
+            setattr(modifiee, champ, valeur)
+            self.assertNotEqual(FicheStore.empreinte(modifiee), empreinte, champ)
+        
+        # Polices équivalentes pour ReportLab : même rendu
+        copie.police = 'Helvetica'
+        self.assertEqual(FicheStore.empreinte(copie), empreinte)
+    
+    def test_rendu_unique(self):
+        """Test qu'une fiche inchangée n'est rendue qu'une fois"""
+        with mock.patch.object(FichePDFGenerator, 'generate_fiche', wraps=FichePDFGenerator.generate_fiche) as generation:
+            chemin, empreinte = FicheStore.obtenir(self.fiche)
+            self.assertEqual(FicheStore.obtenir(self.fiche), (chemin, empreinte))
+        self.assertEqual(generation.call_count, 1)
+        self.assertEqual(chemin.name, f'{empreinte}.pdf')
+        self.assertTrue(chemin.read_bytes().startswith(b'%PDF'))
+        self.assertEqual(list(chemin.parent.glob('*.part')), [])
+    
+    def test_nettoyer(self):
+        """Test la suppression des PDF non référencés, au-delà de l'âge minimal"""
+        courant, _ = FicheStore.obtenir(self.fiche)
+        ancien = FicheStore.enregistrer('ab' * 32, b'%PDF ancienne version')
+        recent = FicheStore.enregistrer('cd' * 32, b'%PDF document de pack')
+        partiel = ancien.with_name('interrompu.part')
+        partiel.write_bytes(b'%PDF')
+        il_y_a_huit_jours = time.time() - 8 * 24 * 3600
+        for chemin in (courant, ancien, partiel):
+            os.utime(chemin, (il_y_a_huit_jours, il_y_a_huit_jours))
+        
+        sortie = io.StringIO()
+        call_command('clean_fiches_pdf', stdout=sortie)
+        
+        self.assertIn('2 fichier(s)', sortie.getvalue())
+        self.assertTrue(courant.exists())
+        self.assertTrue(recent.exists())
+        self.assertFalse(ancien.exists())
+        self.assertFalse(partiel.exists())
+        
+        call_command('clean_fiches_pdf', jours=0, stdout=io.StringIO())
+        self.assertFalse(recent.exists())
+        self.assertTrue(courant.exists())
+
 
+class FichePackTest(TestCase):
+    """Tests pour la génération de packs de fiches"""
+    
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = Path(media.name)
+        self.prof = User.objects.create_user(username='prof', password='testpass123', is_staff=True)
+        self.matiere = Matiere.objects.create(nom='Mathématiques', code='MATH', niveau='college')
+        autre = Matiere.objects.create(nom='Histoire', code='HIST', niveau='college')
+        self.chapitres = [
+            Chapitre.objects.create(matiere=self.matiere, titre=f'Chapitre {i}', numero=i, contenu=f'# Partie {i}\nTexte')
+            for i in (2, 1, 3)
+        ]
+        Chapitre.objects.create(matiere=autre, titre='Révolution', numero=1, contenu='Texte')
+        for i in range(2):
+            eleve = User.objects.create_user(username=f'eleve{i}', password='testpass123', classe='3e A')
+            deck = Deck.objects.create(user=eleve, titre=f'Deck {i}', chapitre=self.chapitres[0])
+            Flashcard.objects.create(deck=deck, recto='Question', verso='Réponse')
+            FicheRevision.objects.create(user=eleve, titre=f'Fiche {i}', contenu='Contenu', chapitre=self.chapitres[0])
+        User.objects.create_user(username='autre', password='testpass123', classe='4e B')
+    
+    def test_documents(self):
+        """Test la sélection des documents par matière, classe ou identifiants"""
+        with self.assertNumQueries(1):
+            fiches = FichePack.documents('chapitres', matiere_id=self.matiere.id, user=self.prof)
+        self.assertEqual([fiche.titre for fiche in fiches], ['Fiche - Chapitre 1', 'Fiche - Chapitre 2', 'Fiche - Chapitre 3'])
+        
+        with self.assertNumQueries(2):  # Decks, puis flashcards préchargées
+            fiches = FichePack.documents('decks', classe='3e A')
+        self.assertEqual([fiche.user.username for fiche in fiches], ['eleve0', 'eleve1'])
+        self.assertIn('Question', fiches[0].contenu)
+        
+        fiche = FicheRevision.objects.first()
+        self.assertEqual(FichePack.documents('fiches', ids=[fiche.id]), [fiche])
+        self.assertEqual(len(FichePack.documents('fiches', classe='3e A', matiere_id=self.matiere.id)), 2)
+        
+        for arguments in ({'source': 'fiches'}, {'source': 'chapitres', 'classe': '3e A'}, {'source': 'inconnue', 'ids': [1]}):
+            with self.assertRaises(ValueError):
+                FichePack.documents(**arguments)
+    
+    def test_pack_zip(self):
+        """Test l'archive ZIP, dans l'ordre, et la réutilisation des PDF déjà rendus"""
+        fiches = FichePack.documents('chapitres', matiere_id=self.matiere.id)
+        sink = io.BytesIO()
+        self.assertEqual(FichePack.generer(fiches, 'zip', sink, processus=1), 3)
+        with zipfile.ZipFile(sink) as archive:
+            self.assertEqual(archive.namelist(), [
+                '001_Fiche_-_Chapitre_1.pdf', '002_Fiche_-_Chapitre_2.pdf', '003_Fiche_-_Chapitre_3.pdf',
+            ])
+            self.assertTrue(all(archive.read(nom).startswith(b'%PDF') for nom in archive.namelist()))
+        
+        with mock.patch('fiches.batch._rendre') as rendu:
+            progression = mock.Mock()
+            FichePack.generer(fiches, 'zip', io.BytesIO(), processus=1, progression=progression)
+        rendu.assert_not_called()
+        progression.assert_called_once_with(3, 3)
+    
+    def test_rendu_dans_un_pool(self):
+        """Test le rendu dans des processus séparés"""
+        fiches = FichePack.documents('decks', classe='3e A') + FichePack.documents('chapitres', matiere_id=self.matiere.id)
+        chemins = FichePack.rendre(fiches, processus=2)
+        self.assertEqual(len(chemins), 5)
+        self.assertTrue(all(chemin.read_bytes().startswith(b'%PDF') for chemin in chemins))
+    
+    @skipUnless(PYPDF_AVAILABLE, "pypdf non installé")
+    def test_pack_pdf_fusionne(self):
+        """Test le PDF unique, avec un signet par fiche"""
+        from pypdf import PdfReader
+        fiches = FichePack.documents('fiches', classe='3e A')
+        sink = io.BytesIO()
+        FichePack.generer(fiches, 'pdf', sink, processus=1)
+        sink.seek(0)
+        lecteur = PdfReader(sink)
+        self.assertEqual(len(lecteur.pages), 2)
+        self.assertEqual([signet.title for signet in lecteur.outline], ['Fiche 0', 'Fiche 1'])
+    
+    def test_commande(self):
+        """Test la commande generate_fiches_pack"""
+        sortie = self.media / 'pack.zip'
+        out = io.StringIO()
+        call_command('generate_fiches_pack', '--source', 'decks', '--classe', '3e A',
+                     '-o', str(sortie), '--processus', '1', stdout=out)
+        self.assertIn('2 fiche(s)', out.getvalue())
+        with zipfile.ZipFile(sortie) as archive:
+            self.assertEqual(len(archive.namelist()), 2)
+    
+    @override_settings(JOBS_EAGER=True, FICHES_BATCH_PROCESSES=0)
+    def test_pack_processus_dans_run_jobs(self):
+        """Test que le pool de rendu d'une tâche est plafonné dans un pool run_jobs"""
+        from jobs.services import JobService
+        parametres = {'source': 'chapitres', 'matiere_id': self.matiere.id, 'format': 'zip'}
+        with mock.patch.object(FichePack, 'generer', return_value=3) as generer, \
+                mock.patch('jobs.worker.os.cpu_count', return_value=8), \
+                mock.patch('fiches.batch.os.cpu_count', return_value=8):
+            with mock.patch('jobs.worker.PROCESSUS_POOL', 8):
+                JobService.enqueue('fiches.pack', parametres, user=self.prof)
+                self.assertEqual(generer.call_args.kwargs['processus'], 1)
+            with mock.patch('jobs.worker.PROCESSUS_POOL', 2):
+                JobService.enqueue('fiches.pack', parametres, user=self.prof)
+                self.assertEqual(generer.call_args.kwargs['processus'], 4)
+            # Hors pool (exécution immédiate, run_jobs --processes 0) : pas de plafond
+            JobService.enqueue('fiches.pack', parametres, user=self.prof)
+            self.assertEqual(generer.call_args.kwargs['processus'], 8)
+            JobService.enqueue('fiches.pack', dict(parametres, processus=1), user=self.prof)
+            self.assertEqual(generer.call_args.kwargs['processus'], 1)
+    
+    @override_settings(JOBS_EAGER=True)
+    def test_pack_en_arriere_plan(self):
+        """Test la génération par une tâche et le téléchargement"""
+        self.client.login(username='prof', password='testpass123')
+        with override_settings(FICHES_BATCH_PROCESSES=1):
+            response = self.client.post(reverse('fiches:pack_create'), {
+                'source': 'chapitres', 'matiere_id': self.matiere.id, 'format': 'zip',
+            })
+        self.assertRedirects(response, reverse('fiches:list'))
+        job = Job.objects.get(type_job='fiches.pack')
+        self.assertEqual(job.statut, 'termine', job.erreur)
+        self.assertEqual(job.resultat['documents'], 3)
+        
+        response = self.client.get(reverse('fiches:pack_download', args=[job.id]))
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 3)
+        
+        response = self.client.post(reverse('fiches:pack_create'), {'source': 'chapitres', 'classe': '3e A'})
+        self.assertEqual(Job.objects.filter(type_job='fiches.pack').count(), 1)
+        
+        self.client.login(username='eleve0', password='testpass123')
+        response = self.client.get(reverse('fiches:pack_download', args=[job.id]))
+        self.assertEqual(response.status_code, 302)
@@ -10,6 +10,8 @@ urlpatterns = [
     path('from-deck/<int:deck_id>/', views.fiche_from_deck, name='from_deck'),
     path('<int:fiche_id>/download/', views.fiche_download, name='download'),
     path('<int:fiche_id>/delete/', views.fiche_delete, name='delete'),
+    path('packs/', views.pack_create, name='pack_create'),
+    path('packs/<int:job_id>/download/', views.pack_download, name='pack_download'),
 ]
 
 
@@ -1,19 +1,55 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_http_methods
 from datetime import datetime
 from .models import FicheRevision
+from .batch import SOURCES, formats_disponibles
 from .services import FichePDFGenerator
-from accounts.models import Chapitre
+from .store import FicheStore
+from accounts.models import Chapitre, Matiere
 from flashcards.models import Deck
+from jobs.models import Job
+from jobs.services import JobService
+
+
+def _reponse_fiche(request, fiche, filename):
+    """
+    PDF d'une fiche servi depuis FicheStore
+
+    L'empreinte du contenu sert d'ETag : si le navigateur a déjà cette
+    version (If-None-Match), la réponse est un 304 sans lecture du fichier.
+    """
+    empreinte = FicheStore.empreinte(fiche)
+    etag = FicheStore.etag(empreinte)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        chemin, _ = FicheStore.obtenir(fiche, empreinte)
+        response = FileResponse(
+            open(chemin, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf'
+        )
+    response['ETag'] = etag
+    # Fiches personnelles : pas de cache partagé, revalidation à chaque téléchargement
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @login_required
 def fiches_list(request):
     """Liste des fiches"""
     fiches = FicheRevision.objects.filter(user=request.user)
-    return render(request, 'fiches/list.html', {'fiches': fiches})
+    contexte = {'fiches': fiches}
+    if request.user.is_staff:
+        contexte.update({
+            'pack_sources': SOURCES,
+            'pack_formats': formats_disponibles(),
+            'matieres': Matiere.objects.all(),
+            'pack_jobs': Job.objects.filter(type_job='fiches.pack').select_related('user')[:10],
+        })
+    return render(request, 'fiches/list.html', contexte)
 
 
 @login_required
@@ -55,12 +91,9 @@ def fiche_from_chapitre(request, chapitre_id):
     if request.method == 'POST':
         titre = request.POST.get('titre', f"Fiche - {chapitre.titre}")
         
-        buffer = FichePDFGenerator.generate_from_chapitre(chapitre, request.user, titre)
-        
-        response = HttpResponse(buffer.read(), content_type='application/pdf')
+        fiche = FichePDFGenerator.build_from_chapitre(chapitre, request.user, titre)
         filename = f"fiche_{chapitre.titre.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+        return _reponse_fiche(request, fiche, filename)
     
     return render(request, 'fiches/from_chapitre.html', {'chapitre': chapitre})
 
@@ -70,26 +103,19 @@ def fiche_from_deck(request, deck_id):
     """Générer une fiche depuis un deck"""
     deck = get_object_or_404(Deck, id=deck_id, user=request.user)
     
-    buffer = FichePDFGenerator.generate_from_flashcards(deck, request.user)
-    
-    response = HttpResponse(buffer.read(), content_type='application/pdf')
+    fiche = FichePDFGenerator.build_from_flashcards(deck, request.user)
     filename = f"fiche_flashcards_{deck.titre.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    return _reponse_fiche(request, fiche, filename)
 
 
 @login_required
 def fiche_download(request, fiche_id):
     """Télécharger une fiche en PDF"""
-    from datetime import datetime
-    fiche = get_object_or_404(FicheRevision, id=fiche_id, user=request.user)
-    
-    buffer = FichePDFGenerator.generate_fiche(fiche)
-    
-    response = HttpResponse(buffer.read(), content_type='application/pdf')
+    fiche = get_object_or_404(
+        FicheRevision.objects.select_related('chapitre__matiere'), id=fiche_id, user=request.user
+    )
     filename = f"fiche_{fiche.titre.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    return _reponse_fiche(request, fiche, filename)
 
 
 @login_required
@@ -104,3 +130,42 @@ def fiche_delete(request, fiche_id):
     
     return render(request, 'fiches/delete.html', {'fiche': fiche})
 
+
+@staff_member_required
+@require_http_methods(["POST"])
+def pack_create(request):
+    """Met en file la génération d'un pack de fiches pour une matière ou une classe"""
+    source = request.POST.get('source')
+    format = request.POST.get('format', 'zip')
+    matiere_id = request.POST.get('matiere_id', '')
+    matiere_id = int(matiere_id) if matiere_id.isdigit() else None
+    classe = request.POST.get('classe', '').strip() or None
+    if source not in SOURCES or format not in formats_disponibles():
+        messages.error(request, 'Source ou format inconnu.')
+        return redirect('fiches:list')
+    if not (matiere_id or classe) or (source == 'chapitres' and classe):
+        messages.error(request, 'Choisissez une matière, ou une classe pour les fiches et les decks.')
+        return redirect('fiches:list')
+    
+    JobService.enqueue('fiches.pack', {
+        'source': source,
+        'format': format,
+        'matiere_id': matiere_id,
+        'classe': classe,
+    }, user=request.user)
+    messages.success(request, 'Pack lancé en arrière-plan. Il sera disponible ci-dessous.')
+    return redirect('fiches:list')
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def pack_download(request, job_id):
+    """Téléchargement d'un pack généré en arrière-plan"""
+    job = get_object_or_404(Job, id=job_id, type_job='fiches.pack', statut='termine')
+    if not job.fichier:
+        raise Http404("Fichier introuvable")
+    try:
+        fichier = job.fichier.open('rb')
+    except FileNotFoundError:
+        raise Http404("Fichier introuvable")
+    return FileResponse(fichier, as_attachment=True, filename=job.resultat.get('nom') or job.fichier.name)
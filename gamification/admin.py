@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Badge, UserBadge, UserProgress, Leaderboard
+from .models import Badge, UserBadge, UserProgress, Leaderboard, XPEvent
 
 
 @admin.register(Badge)
@@ -8,6 +8,14 @@ class BadgeAdmin(admin.ModelAdmin):
     list_filter = ['condition_type']
     search_fields = ['nom', 'description']
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            # Attribuer le nouveau badge aux utilisateurs qui le méritent déjà
+            from jobs.services import JobService
+            JobService.enqueue('gamification.verifier_badges', user=request.user)
+            self.message_user(request, "Attribution du badge aux utilisateurs existants mise en file")
+
 
 @admin.register(UserBadge)
 class UserBadgeAdmin(admin.ModelAdmin):
@@ -25,6 +33,14 @@ class UserProgressAdmin(admin.ModelAdmin):
     readonly_fields = ['updated_at']
 
 
+@admin.register(XPEvent)
+class XPEventAdmin(admin.ModelAdmin):
+    list_display = ['user', 'type_evenement', 'points', 'created_at']
+    list_filter = ['type_evenement', 'created_at']
+    search_fields = ['user__username']
+    date_hierarchy = 'created_at'
+
+
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     list_display = ['user', 'position', 'score', 'periode', 'date']
@@ -5,5 +5,5 @@ class GamificationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gamification'
 
-
-
+    def ready(self):
+        from . import badges
@@ -0,0 +1,155 @@
+"""
+Moteur de règles des badges
+
+Chaque condition_type à seuil est décrite par (compteur, seuil). Les badges
+sont compilés en un index trié par seuil pour chaque compteur : trouver les
+badges atteints après une action est une recherche dichotomique (bisect),
+pas un parcours de la table des badges. L'index compilé est conservé dans
+le cache Django et invalidé quand un badge est modifié (voir apps.py).
+"""
+from bisect import bisect_right
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Badge, UserBadge, UserProgress
+
+# condition_type -> (compteur de UserProgress, seuil)
+REGLES = {
+    'qcm_first': ('qcm_completes', 1),
+    'qcm_10': ('qcm_completes', 10),
+    'qcm_50': ('qcm_completes', 50),
+    'flashcard_10': ('flashcards_creees', 10),
+    'flashcard_50': ('flashcards_creees', 50),
+    'study_streak_3': ('jours_streak', 3),
+    'study_streak_7': ('jours_streak', 7),
+    'study_streak_30': ('jours_streak', 30),
+    'tutor_10': ('questions_tuteur', 10),
+}
+
+COMPTEURS = ('qcm_completes', 'flashcards_creees', 'jours_streak', 'questions_tuteur')
+
+# Badges liés à un événement (ex. QCM à 100%) qui ne rapportent pas d'XP
+SANS_BONUS_XP = {'qcm_perfect'}
+
+
+class BadgeIndex:
+    """Index compilé des badges"""
+
+    CACHE_KEY = 'gamification:badge_index'
+    CACHE_TIMEOUT = 60 * 60
+
+    def __init__(self, badges):
+        """
+        Args:
+            badges: Itérable de Badge
+        """
+        par_compteur = {compteur: [] for compteur in COMPTEURS}
+        self.evenements = {}
+        for badge in badges:
+            points = 0 if badge.condition_type in SANS_BONUS_XP else badge.points_xp
+            if badge.condition_type in REGLES:
+                compteur, seuil = REGLES[badge.condition_type]
+                par_compteur[compteur].append((seuil, badge.id, points))
+            else:
+                self.evenements.setdefault(badge.condition_type, []).append((badge.id, points))
+
+        # Pour chaque compteur : seuils croissants et badges correspondants
+        self.seuils = {}
+        self.badges = {}
+        for compteur, regles in par_compteur.items():
+            regles.sort()
+            self.seuils[compteur] = [seuil for seuil, _, _ in regles]
+            self.badges[compteur] = [(badge_id, points) for _, badge_id, points in regles]
+
+    @classmethod
+    def get(cls):
+        """Index des badges, depuis le cache si possible"""
+        index = cache.get(cls.CACHE_KEY)
+        if index is None:
+            index = cls(Badge.objects.all())
+            cache.set(cls.CACHE_KEY, index, cls.CACHE_TIMEOUT)
+        return index
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.CACHE_KEY)
+
+    def gagnes(self, compteurs, obtenus=(), anciens=None, evenements=()):
+        """
+        Badges atteints au vu des compteurs d'un utilisateur
+
+        Args:
+            compteurs: dict compteur -> nouvelle valeur
+            obtenus: ids des badges déjà obtenus (exclus du résultat)
+            anciens: dict compteur -> valeur avant l'action ; seuls les seuils
+                franchis par l'action sont alors examinés
+            evenements: conditions événementielles réalisées (ex. 'qcm_perfect')
+
+        Returns:
+            list: (badge_id, points_xp) des badges gagnés
+        """
+        gagnes = []
+        for compteur, valeur in compteurs.items():
+            seuils = self.seuils.get(compteur)
+            if not seuils:
+                continue
+            debut = bisect_right(seuils, anciens[compteur]) if anciens and compteur in anciens else 0
+            fin = bisect_right(seuils, valeur)
+            gagnes.extend(self.badges[compteur][debut:fin])
+        for condition in evenements:
+            gagnes.extend(self.evenements.get(condition, ()))
+        return [(badge_id, points) for badge_id, points in gagnes if badge_id not in obtenus]
+
+
+def attribuer_badges(user_id, gagnes):
+    """Enregistre les badges gagnés et met à jour le compteur de badges"""
+    UserBadge.objects.bulk_create(
+        [UserBadge(user_id=user_id, badge_id=badge_id) for badge_id, _ in gagnes],
+        ignore_conflicts=True
+    )
+    recompter_badges([user_id])
+
+
+def recompter_badges(user_ids):
+    """Recalcule UserProgress.nombre_badges (affiché dans les classements)"""
+    compte = (
+        UserBadge.objects.filter(user_id=OuterRef('user_id'))
+        .values('user_id').annotate(n=Count('id')).values('n')
+    )
+    UserProgress.objects.filter(user_id__in=user_ids).update(nombre_badges=Coalesce(Subquery(compte), 0))
+
+
+def verifier_badges_existants(user_min=0, user_max=None, batch_size=1000, progression=None):
+    """
+    Réévalue les badges de tous les utilisateurs ayant une progression
+
+    À lancer après l'ajout de badges : un badge créé après coup n'est sinon
+    attribué qu'au prochain franchissement de son seuil par chaque
+    utilisateur (commande verifier_badges, tâche gamification.verifier_badges).
+
+    Args:
+        user_min, user_max: Tranche d'identifiants utilisateur [min, max)
+        batch_size: Nombre de progressions lues par requête
+        progression: Rappel optionnel (traites, total)
+
+    Returns:
+        int: Nombre de badges attribués
+    """
+    progressions = UserProgress.objects.filter(user_id__gte=user_min).order_by('user_id')
+    if user_max is not None:
+        progressions = progressions.filter(user_id__lt=user_max)
+    total = progressions.count()
+
+    attribues = 0
+    for traites, progress in enumerate(progressions.iterator(chunk_size=batch_size), start=1):
+        attribues += len(progress.verifier_badges())
+        if progression and traites % batch_size == 0:
+            progression(traites, total)
+    return attribues
+
+
+@receiver([post_save, post_delete], sender=Badge)
+def invalider_index_badges(sender, **kwargs):
+    BadgeIndex.invalidate()
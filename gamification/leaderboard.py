@@ -0,0 +1,250 @@
+"""
+Classements matérialisés
+
+- all_time : lu directement dans UserProgress, trié sur points_xp (indexé)
+- daily / weekly / monthly : une ligne Leaderboard par utilisateur et par
+  période (date = premier jour de la période), dont le score est incrémenté
+  à chaque gain d'XP
+
+Les scores et positions stockés dans Leaderboard sont reconstruits depuis
+le journal XPEvent par la commande build_leaderboards : le rang d'un
+utilisateur sur une période est la position stockée à la dernière
+exécution. En all_time, le rang est compté (scores strictement supérieurs
+plus un) : un parcours d'index dont le coût croît avec le nombre
+d'utilisateurs mieux classés.
+"""
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+from .models import Leaderboard, UserProgress, XPEvent
+
+PERIODES = ('daily', 'weekly', 'monthly', 'all_time')
+PERIODES_GLISSANTES = ('daily', 'weekly', 'monthly')
+
+
+class LeaderboardService:
+    """Service de lecture et de mise à jour des classements"""
+
+    @staticmethod
+    def debut_periode(periode, jour=None):
+        """Premier jour de la période contenant `jour` (aujourd'hui par défaut)"""
+        jour = jour or timezone.localdate()
+        if periode == 'weekly':
+            return jour - timedelta(days=jour.weekday())
+        if periode == 'monthly':
+            return jour.replace(day=1)
+        return jour
+
+    @staticmethod
+    def fenetre(periode, jour=None):
+        """
+        Bornes [début, fin) de la période contenant `jour`
+
+        Returns:
+            tuple: (date de la période, début, fin) ; début et fin sont des
+            datetimes du fuseau courant
+        """
+        debut = LeaderboardService.debut_periode(periode, jour)
+        if periode == 'daily':
+            fin = debut + timedelta(days=1)
+        elif periode == 'weekly':
+            fin = debut + timedelta(days=7)
+        else:
+            fin = (debut.replace(day=28) + timedelta(days=4)).replace(day=1)
+        tz = timezone.get_current_timezone()
+        return (
+            debut,
+            timezone.make_aware(datetime.combine(debut, time.min), tz),
+            timezone.make_aware(datetime.combine(fin, time.min), tz),
+        )
+
+    @staticmethod
+    def reconstruire_scores(periode, jour=None, user_min=0, user_max=None):
+        """
+        Recalcule depuis le journal XPEvent les scores d'une période pour les
+        utilisateurs dont l'id est dans [user_min, user_max)
+
+        Une requête groupée pour l'agrégation, puis création et mise à jour
+        en masse des lignes. Idempotent : relancer donne le même résultat.
+
+        Returns:
+            int: Le nombre de lignes créées ou modifiées
+        """
+        date, debut, fin = LeaderboardService.fenetre(periode, jour)
+
+        evenements = XPEvent.objects.filter(created_at__gte=debut, created_at__lt=fin, user_id__gte=user_min)
+        lignes = Leaderboard.objects.filter(periode=periode, date=date, user_id__gte=user_min)
+        if user_max is not None:
+            evenements = evenements.filter(user_id__lt=user_max)
+            lignes = lignes.filter(user_id__lt=user_max)
+
+        scores = dict(
+            evenements.order_by().values('user_id').annotate(total=Sum('points')).values_list('user_id', 'total')
+        )
+        existantes = {user_id: (ligne_id, score) for ligne_id, user_id, score in lignes.values_list('id', 'user_id', 'score')}
+
+        a_creer = [
+            Leaderboard(user_id=user_id, periode=periode, date=date, score=score, position=0)
+            for user_id, score in scores.items()
+            if user_id not in existantes
+        ]
+        a_modifier = [
+            Leaderboard(id=ligne_id, score=scores.get(user_id, 0))
+            for user_id, (ligne_id, score) in existantes.items()
+            if scores.get(user_id, 0) != score
+        ]
+
+        with transaction.atomic():
+            Leaderboard.objects.bulk_create(a_creer, ignore_conflicts=True)
+            Leaderboard.objects.bulk_update(a_modifier, ['score'])
+        return len(a_creer) + len(a_modifier)
+
+    @staticmethod
+    def calculer_positions(periode, jour=None, batch_size=5000):
+        """
+        Recalcule les positions stockées d'une période (ex aequo : même position)
+
+        Les lignes sont parcourues par score décroissant ; seules les
+        positions qui changent sont écrites, par lots.
+
+        Returns:
+            int: Le nombre de positions modifiées
+        """
+        date = LeaderboardService.debut_periode(periode, jour)
+        lignes = (
+            Leaderboard.objects.filter(periode=periode, date=date)
+            .order_by('-score', 'user_id')
+            .values_list('id', 'score', 'position')
+        )
+
+        modifiees = 0
+        lot = []
+        precedent = None
+        position = 0
+        for rang, (ligne_id, score, ancienne) in enumerate(lignes.iterator(chunk_size=batch_size), 1):
+            if score != precedent:
+                position, precedent = rang, score
+            if position != ancienne:
+                lot.append(Leaderboard(id=ligne_id, position=position))
+            if len(lot) >= batch_size:
+                Leaderboard.objects.bulk_update(lot, ['position'])
+                modifiees += len(lot)
+                lot = []
+        if lot:
+            Leaderboard.objects.bulk_update(lot, ['position'])
+            modifiees += len(lot)
+        return modifiees
+
+    @staticmethod
+    def enregistrer_gains(gains, jour=None):
+        """
+        Ajoute des XP aux classements des périodes en cours
+
+        Deux requêtes quel que soit le nombre d'utilisateurs : création des
+        lignes manquantes (ignorée si elles existent), puis incrément des scores.
+
+        Args:
+            gains: dict user_id -> XP gagnés
+        """
+        gains = {user_id: points for user_id, points in gains.items() if points}
+        if not gains:
+            return
+
+        dates = {periode: LeaderboardService.debut_periode(periode, jour) for periode in PERIODES_GLISSANTES}
+        Leaderboard.objects.bulk_create(
+            [
+                Leaderboard(user_id=user_id, periode=periode, date=date, score=0, position=0)
+                for user_id in gains
+                for periode, date in dates.items()
+            ],
+            ignore_conflicts=True
+        )
+
+        if len(gains) == 1:
+            [(user_id, points)] = gains.items()
+            increment = Value(points)
+        else:
+            increment = Case(
+                *[When(user_id=user_id, then=Value(points)) for user_id, points in gains.items()],
+                default=Value(0)
+            )
+
+        lignes = Leaderboard.objects.none()
+        for periode, date in dates.items():
+            lignes |= Leaderboard.objects.filter(user_id__in=gains, periode=periode, date=date)
+        lignes.update(score=F('score') + increment)
+
+    @staticmethod
+    def classement(periode='all_time', limit=10, jour=None):
+        """
+        Tête du classement d'une période
+
+        Returns:
+            list: {"position", "user", "points_xp", "niveau", "badges_count"}
+            (points_xp : XP gagnés sur la période)
+        """
+        if periode == 'all_time':
+            lignes = [
+                (progress.user, progress.points_xp, progress.niveau, progress.nombre_badges)
+                for progress in UserProgress.objects.select_related('user').order_by('-points_xp', 'user_id')[:limit]
+            ]
+        else:
+            date = LeaderboardService.debut_periode(periode, jour)
+            entrees = (
+                Leaderboard.objects.filter(periode=periode, date=date, score__gt=0)
+                .select_related('user__progress')
+                .order_by('-score', 'user_id')[:limit]
+            )
+            lignes = []
+            for entree in entrees:
+                progress = getattr(entree.user, 'progress', None)
+                lignes.append((
+                    entree.user,
+                    entree.score,
+                    progress.niveau if progress else 1,
+                    progress.nombre_badges if progress else 0,
+                ))
+
+        # Ex aequo : même position (comme rang())
+        classement = []
+        for i, (user, points, niveau, badges_count) in enumerate(lignes, 1):
+            position = classement[-1]['position'] if classement and classement[-1]['points_xp'] == points else i
+            classement.append({
+                'position': position,
+                'user': user,
+                'points_xp': points,
+                'niveau': niveau,
+                'badges_count': badges_count,
+            })
+        return classement
+
+    @staticmethod
+    def rang(user, periode='all_time', jour=None):
+        """
+        Rang d'un utilisateur, None s'il n'est pas classé
+
+        daily / weekly / monthly : position calculée par calculer_positions
+        (build_leaderboards), lue en une requête sur la ligne de
+        l'utilisateur. Une ligne créée depuis la dernière exécution n'a pas
+        encore de position : son rang est alors compté comme en all_time.
+
+        all_time : nombre de progressions ayant plus d'XP, plus un ; parcours
+        de l'index points_xp proportionnel au nombre d'utilisateurs mieux
+        classés.
+        """
+        if periode == 'all_time':
+            score = UserProgress.objects.filter(user=user).values_list('points_xp', flat=True).first()
+            if score is None:
+                return None
+            return UserProgress.objects.filter(points_xp__gt=score).count() + 1
+
+        date = LeaderboardService.debut_periode(periode, jour)
+        lignes = Leaderboard.objects.filter(periode=periode, date=date)
+        ligne = lignes.filter(user=user).values_list('score', 'position').first()
+        if not ligne or not ligne[0]:
+            return None
+        score, position = ligne
+        if position:
+            return position
+        return lignes.filter(score__gt=score).count() + 1
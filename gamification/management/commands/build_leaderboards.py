@@ -0,0 +1,103 @@
+"""
+Commande reconstruisant les classements depuis le journal XP
+Usage: python manage.py build_leaderboards [--date AAAA-MM-JJ] [--periodes daily,weekly]
+       [--user-min N --user-max M] [--checkpoint fichier.json] [--skip-positions]
+
+Idempotente : à planifier (cron) autant que nécessaire. Les scores se
+calculent par tranches d'identifiants utilisateur, ce qui permet de
+répartir le travail entre plusieurs processus (--user-min/--user-max,
+avec --skip-positions) puis de calculer les positions en une passe
+(--positions-only). Avec --checkpoint, une exécution interrompue reprend
+à la dernière tranche terminée.
+"""
+import json
+import os
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from gamification.leaderboard import LeaderboardService, PERIODES_GLISSANTES
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Reconstruit les classements quotidien, hebdomadaire et mensuel depuis le journal XP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Jour de référence (AAAA-MM-JJ, aujourd'hui par défaut)")
+        parser.add_argument('--periodes', default=','.join(PERIODES_GLISSANTES),
+                            help="Périodes à reconstruire, séparées par des virgules")
+        parser.add_argument('--user-min', type=int, default=0, help="Premier id utilisateur traité")
+        parser.add_argument('--user-max', type=int, help="Id utilisateur de fin (exclu)")
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help="Nombre d'ids utilisateur par tranche")
+        parser.add_argument('--checkpoint', help="Fichier JSON de reprise")
+        parser.add_argument('--skip-positions', action='store_true',
+                            help="Ne pas recalculer les positions (exécution partielle)")
+        parser.add_argument('--positions-only', action='store_true',
+                            help="Recalculer uniquement les positions")
+
+    def handle(self, *args, **options):
+        try:
+            jour = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError("Date invalide, format attendu : AAAA-MM-JJ")
+
+        periodes = [p.strip() for p in options['periodes'].split(',') if p.strip()]
+        inconnues = set(periodes) - set(PERIODES_GLISSANTES)
+        if inconnues:
+            raise CommandError(f"Périodes inconnues : {', '.join(sorted(inconnues))}")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être positif")
+
+        checkpoint = self._lire_checkpoint(options['checkpoint'])
+
+        for periode in periodes:
+            date_periode = LeaderboardService.debut_periode(periode, jour)
+            if not options['positions_only']:
+                self._reconstruire(periode, jour, date_periode, options, checkpoint)
+            if not options['skip_positions']:
+                modifiees = LeaderboardService.calculer_positions(periode, jour, options['batch_size'])
+                self.stdout.write(f"{periode} {date_periode} : {modifiees} position(s) mise(s) à jour")
+
+        self.stdout.write(self.style.SUCCESS("Classements à jour"))
+
+    def _reconstruire(self, periode, jour, date_periode, options, checkpoint):
+        user_max = options['user_max']
+        if user_max is None:
+            user_max = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+        cle = f"{periode}:{date_periode}:{options['user_min']}-{options['user_max'] or ''}"
+        debut = checkpoint.get(cle, options['user_min'])
+        if debut > options['user_min']:
+            self.stdout.write(f"{periode} : reprise à l'utilisateur {debut}")
+
+        lignes = 0
+        while debut < user_max:
+            fin = min(debut + options['batch_size'], user_max)
+            lignes += LeaderboardService.reconstruire_scores(periode, jour, debut, fin)
+            debut = fin
+            checkpoint[cle] = debut
+            self._ecrire_checkpoint(options['checkpoint'], checkpoint)
+
+        # Tranche terminée : la prochaine exécution planifiée repart du début
+        checkpoint.pop(cle, None)
+        self._ecrire_checkpoint(options['checkpoint'], checkpoint)
+        self.stdout.write(f"{periode} {date_periode} : {lignes} score(s) écrit(s)")
+
+    @staticmethod
+    def _lire_checkpoint(chemin):
+        if not chemin or not os.path.exists(chemin):
+            return {}
+        with open(chemin, encoding='utf-8') as fichier:
+            return json.load(fichier)
+
+    @staticmethod
+    def _ecrire_checkpoint(chemin, checkpoint):
+        if not chemin:
+            return
+        temporaire = f"{chemin}.tmp"
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump(checkpoint, fichier)
+        os.replace(temporaire, chemin)
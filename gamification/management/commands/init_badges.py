@@ -1,7 +1,11 @@
 """
 Commande pour initialiser les badges par défaut
 Usage: python manage.py init_badges
+
+Les badges nouvellement créés sont ensuite attribués aux utilisateurs
+existants qui en remplissent déjà les conditions (verifier_badges).
 """
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from gamification.models import Badge
 
@@ -116,6 +120,6 @@ class Command(BaseCommand):
         self.stdout.write(
             self.style.SUCCESS(f'\n✓ {created} nouveau(x) badge(s) créé(s)')
         )
-
-
-
+        
+        if created:
+            call_command('verifier_badges', stdout=self.stdout)
@@ -0,0 +1,32 @@
+"""
+Commande réévaluant les badges des utilisateurs existants
+Usage: python manage.py verifier_badges [--user-min N --user-max M] [--batch-size N]
+
+À lancer après l'ajout de badges (init_badges le fait quand il en crée ;
+depuis l'admin, la réévaluation est mise en file). Idempotente : un badge
+déjà obtenu n'est ni réattribué, ni crédité deux fois.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from gamification.badges import verifier_badges_existants
+
+
+class Command(BaseCommand):
+    help = 'Attribue aux utilisateurs existants les badges dont ils remplissent déjà les conditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-min', type=int, default=0, help="Premier id utilisateur traité")
+        parser.add_argument('--user-max', type=int, help="Id utilisateur de fin (exclu)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Nombre de progressions lues par requête")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être positif")
+
+        def progression(traites, total):
+            self.stdout.write(f"{traites}/{total} utilisateur(s) vérifié(s)")
+
+        attribues = verifier_badges_existants(
+            options['user_min'], options['user_max'], options['batch_size'], progression
+        )
+        self.stdout.write(self.style.SUCCESS(f"✓ {attribues} badge(s) attribué(s)"))
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('gamification', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XPEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_evenement', models.CharField(choices=[('qcm', 'QCM complété'), ('flashcard', 'Flashcard créée'), ('tuteur', 'Question au tuteur'), ('streak', 'Bonus de série'), ('badge', 'Badge obtenu')], max_length=20)),
+                ('points', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='xp_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='gamificatio_user_id_a78f12_idx'), models.Index(fields=['created_at'], name='gamificatio_created_644063_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def compter_badges(apps, schema_editor):
+    UserProgress = apps.get_model('gamification', 'UserProgress')
+    UserBadge = apps.get_model('gamification', 'UserBadge')
+    compte = (
+        UserBadge.objects.filter(user_id=OuterRef('user_id'))
+        .values('user_id').annotate(n=Count('id')).values('n')
+    )
+    UserProgress.objects.update(nombre_badges=Coalesce(Subquery(compte), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0002_xpevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprogress',
+            name='nombre_badges',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userprogress',
+            name='points_xp',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['periode', 'date', 'score'], name='gamificatio_periode_e27427_idx'),
+        ),
+        migrations.RunPython(compter_badges, migrations.RunPython.noop),
+    ]
@@ -56,13 +56,14 @@ class UserBadge(models.Model):
 class UserProgress(models.Model):
     """Progression et points XP de l'utilisateur"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='progress')
-    points_xp = models.IntegerField(default=0)
+    points_xp = models.IntegerField(default=0, db_index=True)
     niveau = models.IntegerField(default=1)
     jours_streak = models.IntegerField(default=0)
     dernier_activite = models.DateField(null=True, blank=True)
     qcm_completes = models.IntegerField(default=0)
     flashcards_creees = models.IntegerField(default=0)
     questions_tuteur = models.IntegerField(default=0)
+    nombre_badges = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -76,35 +77,73 @@ class UserProgress(models.Model):
         self.save()
 
     def verifier_badges(self):
-        """Vérifie et attribue les badges automatiquement"""
-        badges_obtenus = UserBadge.objects.filter(user=self.user).values_list('badge_id', flat=True)
+        """
+        Vérifie et attribue les badges automatiquement
         
-        # Vérifier chaque badge disponible
-        for badge in Badge.objects.exclude(id__in=badages_obtenus):
-            attribue = False
-            
-            if badge.condition_type == 'qcm_first' and self.qcm_completes >= 1:
-                attribue = True
-            elif badge.condition_type == 'qcm_10' and self.qcm_completes >= 10:
-                attribue = True
-            elif badge.condition_type == 'qcm_50' and self.qcm_completes >= 50:
-                attribue = True
-            elif badge.condition_type == 'flashcard_10' and self.flashcards_creees >= 10:
-                attribue = True
-            elif badge.condition_type == 'flashcard_50' and self.flashcards_creees >= 50:
-                attribue = True
-            elif badge.condition_type == 'study_streak_3' and self.jours_streak >= 3:
-                attribue = True
-            elif badge.condition_type == 'study_streak_7' and self.jours_streak >= 7:
-                attribue = True
-            elif badge.condition_type == 'study_streak_30' and self.jours_streak >= 30:
-                attribue = True
-            elif badge.condition_type == 'tutor_10' and self.questions_tuteur >= 10:
-                attribue = True
-            
-            if attribue:
-                UserBadge.objects.create(user=self.user, badge=badge)
-                self.ajouter_xp(badge.points_xp)
+        Réévalue tous les seuils (utile après l'ajout de nouveaux badges).
+        Les XP des badges sont crédités par un UPDATE atomique (expressions F),
+        comme dans GamificationService.enregistrer_action, et ajoutés aux
+        classements des périodes en cours.
+        """
+        from django.db import transaction
+        from django.db.models import F
+        from .badges import BadgeIndex, COMPTEURS, attribuer_badges
+        from .leaderboard import LeaderboardService
+        
+        obtenus = set(UserBadge.objects.filter(user_id=self.user_id).values_list('badge_id', flat=True))
+        gagnes = BadgeIndex.get().gagnes(
+            {champ: getattr(self, champ) for champ in COMPTEURS}, obtenus
+        )
+        if not gagnes:
+            return []
+        
+        now = timezone.now()
+        points = [points for _, points in gagnes if points]
+        total = sum(points)
+        with transaction.atomic():
+            attribuer_badges(self.user_id, gagnes)
+            if total:
+                XPEvent.objects.bulk_create([
+                    XPEvent(user_id=self.user_id, type_evenement='badge', points=p, created_at=now) for p in points
+                ])
+                UserProgress.objects.filter(pk=self.pk).update(
+                    points_xp=F('points_xp') + total,
+                    niveau=(F('points_xp') + total) / 100 + 1,
+                    updated_at=now,
+                )
+                LeaderboardService.enregistrer_gains({self.user_id: total}, timezone.localdate(now))
+        
+        # Progression à jour en mémoire
+        self.points_xp += total
+        self.niveau = (self.points_xp // 100) + 1
+        self.nombre_badges = len(obtenus) + len(gagnes)
+        return gagnes
+
+
+class XPEvent(models.Model):
+    """Journal des points XP gagnés (une ligne par gain, jamais modifiée)"""
+    TYPE_CHOICES = [
+        ('qcm', 'QCM complété'),
+        ('flashcard', 'Flashcard créée'),
+        ('tuteur', 'Question au tuteur'),
+        ('streak', 'Bonus de série'),
+        ('badge', 'Badge obtenu'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='xp_events')
+    type_evenement = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    points = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} +{self.points} XP ({self.get_type_evenement_display()})"
 
 
 class Leaderboard(models.Model):
@@ -127,6 +166,9 @@ class Leaderboard(models.Model):
     class Meta:
         ordering = ['periode', 'position']
         unique_together = ['user', 'periode', 'date']
+        indexes = [
+            models.Index(fields=['periode', 'date', 'score']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.position}ème ({self.periode})"
@@ -1,102 +1,235 @@
 """
 Services pour la gamification
+
+Chaque action (QCM, flashcard, question au tuteur) ajoute ses gains au
+journal XPEvent puis met à jour UserProgress en une seule requête UPDATE
+(expressions F) ; les badges sont déterminés en mémoire par le moteur de
+règles de badges.py à partir des compteurs mis à jour.
 """
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from datetime import timedelta
-from .models import UserProgress, UserBadge, Badge
+from .badges import BadgeIndex, COMPTEURS, attribuer_badges, recompter_badges
+from .leaderboard import LeaderboardService
+from .models import UserProgress, UserBadge, XPEvent
 
 
 class GamificationService:
     """Service pour gérer la gamification"""
     
+    BONUS_STREAK = 5
+    
     @staticmethod
-    def mettre_a_jour_streak(user):
-        """Met à jour la série de jours consécutifs"""
+    def calculer_streak(dernier_activite, jours_streak, today):
+        """
+        Nouvelle série de jours consécutifs après une activité aujourd'hui
+        
+        Returns:
+            tuple: (série, bonus XP)
+        """
+        if dernier_activite is None:
+            return 1, 0
+        jours_diff = (today - dernier_activite).days
+        if jours_diff == 0:
+            # Déjà mis à jour aujourd'hui
+            return jours_streak, 0
+        if jours_diff == 1:
+            # Jour consécutif
+            return jours_streak + 1, GamificationService.BONUS_STREAK
+        # Série cassée
+        return 1, 0
+    
+    @staticmethod
+    def enregistrer_action(user, type_evenement=None, points=0, compteur=None, streak=False, parfait=False):
+        """
+        Enregistre une action gamifiée en un nombre fixe de requêtes
+        
+        Args:
+            user: L'utilisateur
+            type_evenement: Type de l'événement XP (None : aucun gain propre)
+            points: XP gagnés par l'action
+            compteur: Champ de UserProgress à incrémenter
+            streak: True si l'action compte pour la série de jours consécutifs
+            parfait: True pour un QCM à 100% (badge QCM parfait)
+        
+        Returns:
+            UserProgress: La progression, à jour en mémoire
+        """
         progress, created = UserProgress.objects.get_or_create(user=user)
-        today = timezone.now().date()
+        now = timezone.now()
+        today = timezone.localdate(now)
+        anciens = {champ: getattr(progress, champ) for champ in COMPTEURS}
         
-        if progress.dernier_activite:
-            jours_diff = (today - progress.dernier_activite).days
-            
-            if jours_diff == 0:
-                # Déjà mis à jour aujourd'hui
-                return
-            elif jours_diff == 1:
-                # Jour consécutif
-                progress.jours_streak += 1
-                progress.ajouter_xp(5)  # Bonus streak
-            else:
-                # Série cassée
-                progress.jours_streak = 1
+        evenements = []
+        if type_evenement and points:
+            evenements.append(XPEvent(user=user, type_evenement=type_evenement, points=points, created_at=now))
         
-        progress.dernier_activite = today
-        progress.save()
-        progress.verifier_badges()
+        champs = {}
+        if compteur:
+            setattr(progress, compteur, getattr(progress, compteur) + 1)
+            champs[compteur] = F(compteur) + 1
+        
+        if streak:
+            progress.jours_streak, bonus = GamificationService.calculer_streak(
+                progress.dernier_activite, progress.jours_streak, today
+            )
+            progress.dernier_activite = today
+            champs['jours_streak'] = progress.jours_streak
+            champs['dernier_activite'] = today
+            if bonus:
+                evenements.append(XPEvent(user=user, type_evenement='streak', points=bonus, created_at=now))
+        
+        # Badges : seuls les seuils franchis par cette action sont examinés
+        badges = BadgeIndex.get().gagnes(
+            {champ: getattr(progress, champ) for champ in COMPTEURS},
+            anciens=anciens,
+            evenements=['qcm_perfect'] if parfait else [],
+        )
+        if badges:
+            obtenus = set(UserBadge.objects.filter(user=user).values_list('badge_id', flat=True))
+            badges = [(badge_id, points_badge) for badge_id, points_badge in badges if badge_id not in obtenus]
+        for badge_id, points_badge in badges:
+            if points_badge:
+                evenements.append(XPEvent(user=user, type_evenement='badge', points=points_badge, created_at=now))
+        
+        total = sum(evenement.points for evenement in evenements)
+        progress.points_xp += total
+        progress.niveau = (progress.points_xp // 100) + 1
+        
+        if not (evenements or champs or badges):
+            return progress
+        
+        with transaction.atomic():
+            if evenements:
+                XPEvent.objects.bulk_create(evenements)
+            # Niveau : 100 XP par niveau (division entière en SQL)
+            UserProgress.objects.filter(pk=progress.pk).update(
+                points_xp=F('points_xp') + total,
+                niveau=(F('points_xp') + total) / 100 + 1,
+                updated_at=now,
+                **champs
+            )
+            if badges:
+                attribuer_badges(user.id, badges)
+            LeaderboardService.enregistrer_gains({user.id: total}, today)
+        
+        return progress
+    
+    @staticmethod
+    def mettre_a_jour_streak(user):
+        """Met à jour la série de jours consécutifs"""
+        return GamificationService.enregistrer_action(user, streak=True)
     
     @staticmethod
     def ajouter_xp_qcm(user, score_percentage):
         """Ajoute des XP après un QCM"""
-        progress, created = UserProgress.objects.get_or_create(user=user)
-        progress.qcm_completes += 1
-        
-        # Points basés sur le score
+        return GamificationService.enregistrer_action(
+            user, 'qcm', GamificationService.points_qcm(score_percentage),
+            compteur='qcm_completes', streak=True, parfait=score_percentage >= 100
+        )
+    
+    @staticmethod
+    def points_qcm(score_percentage):
+        """Points XP gagnés pour un QCM selon le score"""
         if score_percentage >= 100:
-            points = 50  # QCM parfait
-            # Vérifier badge QCM parfait
-            badge = Badge.objects.filter(condition_type='qcm_perfect').first()
-            if badge:
-                UserBadge.objects.get_or_create(user=user, badge=badge)
+            return 50  # QCM parfait
         elif score_percentage >= 80:
-            points = 30
+            return 30
         elif score_percentage >= 60:
-            points = 20
-        else:
-            points = 10
+            return 20
+        return 10
+    
+    @staticmethod
+    def ajouter_xp_qcm_batch(scores):
+        """
+        Ajoute les XP d'un lot de QCM complétés (correction groupée d'une classe)
+        
+        Même barème que ajouter_xp_qcm, mais les progressions, séries et badges
+        de tous les élèves sont écrits en quelques requêtes groupées.
+        
+        Args:
+            scores: Liste de (user_id, pourcentage)
+        """
+        pourcentages = defaultdict(list)
+        for user_id, pourcentage in scores:
+            pourcentages[user_id].append(pourcentage)
+        if not pourcentages:
+            return
         
-        progress.ajouter_xp(points)
-        progress.save()
-        progress.verifier_badges()
-        GamificationService.mettre_a_jour_streak(user)
+        now = timezone.now()
+        today = timezone.localdate(now)
+        index = BadgeIndex.get()
+        
+        with transaction.atomic():
+            UserProgress.objects.bulk_create(
+                [UserProgress(user_id=user_id) for user_id in pourcentages],
+                ignore_conflicts=True
+            )
+            progresses = list(
+                UserProgress.objects.select_for_update().filter(user_id__in=pourcentages)
+            )
+            obtenus = defaultdict(set)
+            for user_id, badge_id in UserBadge.objects.filter(user_id__in=pourcentages).values_list('user_id', 'badge_id'):
+                obtenus[user_id].add(badge_id)
+            evenements = []
+            nouveaux_badges = []
+            
+            for progress in progresses:
+                scores_user = pourcentages[progress.user_id]
+                anciens = {champ: getattr(progress, champ) for champ in COMPTEURS}
+                progress.qcm_completes += len(scores_user)
+                for pourcentage in scores_user:
+                    evenements.append(XPEvent(
+                        user_id=progress.user_id, type_evenement='qcm',
+                        points=GamificationService.points_qcm(pourcentage), created_at=now
+                    ))
+                
+                progress.jours_streak, bonus = GamificationService.calculer_streak(
+                    progress.dernier_activite, progress.jours_streak, today
+                )
+                progress.dernier_activite = today
+                if bonus:
+                    evenements.append(XPEvent(user_id=progress.user_id, type_evenement='streak', points=bonus, created_at=now))
+                
+                for badge_id, points_badge in index.gagnes(
+                    {champ: getattr(progress, champ) for champ in COMPTEURS},
+                    obtenus[progress.user_id],
+                    anciens=anciens,
+                    evenements=['qcm_perfect'] if max(scores_user) >= 100 else [],
+                ):
+                    nouveaux_badges.append(UserBadge(user_id=progress.user_id, badge_id=badge_id))
+                    if points_badge:
+                        evenements.append(XPEvent(user_id=progress.user_id, type_evenement='badge', points=points_badge, created_at=now))
+            
+            gains = defaultdict(int)
+            for evenement in evenements:
+                gains[evenement.user_id] += evenement.points
+            for progress in progresses:
+                progress.points_xp += gains[progress.user_id]
+                progress.niveau = (progress.points_xp // 100) + 1
+                progress.updated_at = now
+            
+            XPEvent.objects.bulk_create(evenements)
+            UserProgress.objects.bulk_update(progresses, [
+                'points_xp', 'niveau', 'qcm_completes', 'jours_streak', 'dernier_activite', 'updated_at'
+            ])
+            if nouveaux_badges:
+                UserBadge.objects.bulk_create(nouveaux_badges, ignore_conflicts=True)
+                recompter_badges({badge.user_id for badge in nouveaux_badges})
+            LeaderboardService.enregistrer_gains(gains, today)
     
     @staticmethod
     def ajouter_xp_flashcard(user):
         """Ajoute des XP après création d'une flashcard"""
-        progress, created = UserProgress.objects.get_or_create(user=user)
-        progress.flashcards_creees += 1
-        progress.ajouter_xp(5)
-        progress.save()
-        progress.verifier_badges()
+        return GamificationService.enregistrer_action(user, 'flashcard', 5, compteur='flashcards_creees')
     
     @staticmethod
     def ajouter_xp_tuteur(user):
         """Ajoute des XP après une question au tuteur"""
-        progress, created = UserProgress.objects.get_or_create(user=user)
-        progress.questions_tuteur += 1
-        progress.ajouter_xp(3)
-        progress.save()
-        progress.verifier_badges()
+        return GamificationService.enregistrer_action(user, 'tuteur', 3, compteur='questions_tuteur')
     
     @staticmethod
     def get_leaderboard(periode='all_time', limit=10):
-        """Récupère le classement"""
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        
-        progresses = UserProgress.objects.all().order_by('-points_xp')[:limit]
-        
-        leaderboard = []
-        position = 1
-        for progress in progresses:
-            leaderboard.append({
-                'position': position,
-                'user': progress.user,
-                'points_xp': progress.points_xp,
-                'niveau': progress.niveau,
-                'badges_count': UserBadge.objects.filter(user=progress.user).count()
-            })
-            position += 1
-        
-        return leaderboard
-
-
-
+        """Récupère le classement (voir LeaderboardService.classement)"""
+        return LeaderboardService.classement(periode, limit)
@@ -0,0 +1,14 @@
+"""
+Tâches en arrière-plan de l'application gamification
+"""
+from jobs.registry import register
+from .badges import verifier_badges_existants
+
+
+@register('gamification.verifier_badges')
+def verifier_badges(job):
+    """Attribue aux utilisateurs existants les badges qu'ils ont déjà mérités"""
+    def progression(traites, total):
+        job.maj_progression(traites * 100 / total)
+
+    return {'badges': verifier_badges_existants(progression=progression)}
@@ -1,11 +1,21 @@
 """
 Tests unitaires pour l'application gamification
 """
+from datetime import timedelta
+import json
+import os
+import tempfile
+from io import StringIO
 from django.test import TestCase, Client
+from django.core.management import call_command
+from django.core.cache import cache
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from .models import Badge, UserBadge, UserProgress, Leaderboard
+from .models import Badge, UserBadge, UserProgress, Leaderboard, XPEvent
 from .services import GamificationService
+from .badges import BadgeIndex
+from .leaderboard import LeaderboardService
 
 User = get_user_model()
 
@@ -154,6 +164,276 @@ class GamificationServiceTest(TestCase):
         self.assertEqual(leaderboard[2]['points_xp'], 50)
 
 
+class XPLedgerTest(TestCase):
+    """Tests pour le journal XP et la mise à jour consolidée"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.badge_premier = Badge.objects.create(
+            nom='Premier Pas', description='Premier QCM', condition_type='qcm_first', points_xp=10
+        )
+        self.badge_parfait = Badge.objects.create(
+            nom='Parfait', description='100%', condition_type='qcm_perfect', points_xp=50
+        )
+    
+    def test_ajouter_xp_qcm_journal(self):
+        """Test les événements XP, les compteurs et les badges d'un QCM parfait"""
+        GamificationService.ajouter_xp_qcm(self.user, 100)
+        
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual(progress.qcm_completes, 1)
+        self.assertEqual(progress.jours_streak, 1)
+        self.assertEqual(progress.points_xp, 60)  # 50 (QCM parfait) + 10 (badge Premier Pas)
+        self.assertEqual(progress.niveau, 1)
+        self.assertEqual(
+            sorted(XPEvent.objects.filter(user=self.user).values_list('type_evenement', 'points')),
+            [('badge', 10), ('qcm', 50)]
+        )
+        self.assertEqual(
+            set(UserBadge.objects.filter(user=self.user).values_list('badge_id', flat=True)),
+            {self.badge_premier.id, self.badge_parfait.id}
+        )
+    
+    def test_nombre_de_requetes_fixe(self):
+        """Test qu'une action coûte un nombre fixe de requêtes"""
+        GamificationService.ajouter_xp_qcm(self.user, 85)  # Badge Premier Pas
+        # Progression, puis journal, UPDATE et classements dans une transaction
+        # (index des badges en cache)
+        with self.assertNumQueries(7):
+            GamificationService.ajouter_xp_qcm(self.user, 85)
+        with self.assertNumQueries(7):
+            GamificationService.ajouter_xp_qcm(self.user, 40)
+    
+    def test_niveau(self):
+        """Test le calcul du niveau en SQL"""
+        UserProgress.objects.create(user=self.user, points_xp=95)
+        GamificationService.ajouter_xp_flashcard(self.user)
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual(progress.points_xp, 100)
+        self.assertEqual(progress.niveau, 2)
+    
+    def test_streak(self):
+        """Test les règles de la série de jours consécutifs"""
+        today = timezone.now().date()
+        calculer = GamificationService.calculer_streak
+        self.assertEqual(calculer(None, 0, today), (1, 0))
+        self.assertEqual(calculer(today, 4, today), (4, 0))
+        self.assertEqual(calculer(today - timedelta(days=1), 4, today), (5, GamificationService.BONUS_STREAK))
+        self.assertEqual(calculer(today - timedelta(days=3), 4, today), (1, 0))
+        
+        UserProgress.objects.create(user=self.user, jours_streak=2, dernier_activite=today - timedelta(days=1))
+        GamificationService.mettre_a_jour_streak(self.user)
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual(progress.jours_streak, 3)
+        self.assertEqual(progress.points_xp, 5)
+        self.assertTrue(XPEvent.objects.filter(user=self.user, type_evenement='streak').exists())
+
+
+class BadgeIndexTest(TestCase):
+    """Tests pour le moteur de règles des badges"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.qcm_1 = Badge.objects.create(nom='Q1', description='', condition_type='qcm_first', points_xp=10)
+        self.qcm_10 = Badge.objects.create(nom='Q10', description='', condition_type='qcm_10', points_xp=25)
+        self.streak_3 = Badge.objects.create(nom='S3', description='', condition_type='study_streak_3', points_xp=15)
+        self.parfait = Badge.objects.create(nom='P', description='', condition_type='qcm_perfect', points_xp=50)
+    
+    def test_gagnes_seuils_franchis(self):
+        """Test que seuls les seuils franchis par l'action sont retenus"""
+        index = BadgeIndex.get()
+        self.assertEqual(index.gagnes({'qcm_completes': 10}), [(self.qcm_1.id, 10), (self.qcm_10.id, 25)])
+        self.assertEqual(
+            index.gagnes({'qcm_completes': 10}, anciens={'qcm_completes': 9}),
+            [(self.qcm_10.id, 25)]
+        )
+        self.assertEqual(index.gagnes({'jours_streak': 1}, anciens={'jours_streak': 5}), [])
+        self.assertEqual(index.gagnes({'qcm_completes': 10}, obtenus={self.qcm_1.id, self.qcm_10.id}), [])
+        self.assertEqual(index.gagnes({}, evenements=['qcm_perfect']), [(self.parfait.id, 0)])
+    
+    def test_index_invalide_par_signal(self):
+        """Test que l'index en cache suit les modifications des badges"""
+        BadgeIndex.get()
+        badge = Badge.objects.create(nom='T10', description='', condition_type='tutor_10', points_xp=20)
+        self.assertEqual(BadgeIndex.get().gagnes({'questions_tuteur': 10}), [(badge.id, 20)])
+    
+    def test_verifier_badges(self):
+        """Test la réévaluation complète des badges d'un utilisateur"""
+        progress = UserProgress.objects.create(user=self.user, qcm_completes=12, jours_streak=3)
+        gagnes = progress.verifier_badges()
+        
+        self.assertEqual(len(gagnes), 3)
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 3)
+        progress.refresh_from_db()
+        self.assertEqual(progress.points_xp, 50)
+        self.assertEqual(progress.verifier_badges(), [])
+    
+    def test_verifier_badges_increment_atomique(self):
+        """Test que les XP des badges n'écrasent pas un gain concurrent et alimentent les classements"""
+        progress = UserProgress.objects.create(user=self.user, qcm_completes=12, jours_streak=3)
+        # Gain enregistré par une autre requête après le chargement de progress
+        UserProgress.objects.filter(pk=progress.pk).update(points_xp=7)
+        
+        progress.verifier_badges()
+        
+        progress.refresh_from_db()
+        self.assertEqual((progress.points_xp, progress.nombre_badges), (57, 3))
+        self.assertEqual(
+            Leaderboard.objects.get(user=self.user, periode='daily', date=LeaderboardService.debut_periode('daily')).score,
+            50
+        )
+    
+    def test_commande_verifier_badges(self):
+        """Test l'attribution après coup des badges aux utilisateurs existants"""
+        autre = User.objects.create_user(username='autre', password='testpass123')
+        UserProgress.objects.create(user=self.user, qcm_completes=12)
+        UserProgress.objects.create(user=autre, questions_tuteur=10)
+        Badge.objects.create(nom='T10', description='', condition_type='tutor_10', points_xp=20)
+        
+        call_command('verifier_badges', batch_size=1, stdout=StringIO())
+        
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(UserProgress.objects.get(user=autre).nombre_badges, 1)
+        self.assertEqual(UserProgress.objects.get(user=autre).points_xp, 20)
+        # Idempotente
+        call_command('verifier_badges', stdout=StringIO())
+        self.assertEqual(UserBadge.objects.count(), 3)
+    
+    def test_init_badges_attribue_aux_existants(self):
+        """Test qu'init_badges attribue les nouveaux badges aux utilisateurs existants"""
+        UserProgress.objects.create(user=self.user, flashcards_creees=10)
+        call_command('init_badges', stdout=StringIO())
+        self.assertTrue(UserBadge.objects.filter(
+            user=self.user, badge__condition_type='flashcard_10'
+        ).exists())
+
+
+class LeaderboardServiceTest(TestCase):
+    """Tests pour les classements matérialisés"""
+    
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(3)]
+    
+    def test_gains_par_periode(self):
+        """Test l'incrément des classements quotidien, hebdomadaire et mensuel"""
+        GamificationService.ajouter_xp_tuteur(self.users[0])
+        GamificationService.ajouter_xp_flashcard(self.users[0])
+        today = timezone.now().date()
+        
+        lignes = Leaderboard.objects.filter(user=self.users[0])
+        self.assertEqual(
+            sorted(lignes.values_list('periode', 'score')),
+            [('daily', 8), ('monthly', 8), ('weekly', 8)]
+        )
+        self.assertEqual(lignes.get(periode='weekly').date.weekday(), 0)
+        self.assertEqual(lignes.get(periode='monthly').date, today.replace(day=1))
+    
+    def test_enregistrer_gains_groupes(self):
+        """Test l'enregistrement des gains de plusieurs utilisateurs"""
+        LeaderboardService.enregistrer_gains({self.users[0].id: 10, self.users[1].id: 30})
+        LeaderboardService.enregistrer_gains({self.users[0].id: 5})
+        classement = LeaderboardService.classement('daily')
+        self.assertEqual([(e['user'], e['points_xp']) for e in classement], [(self.users[1], 30), (self.users[0], 15)])
+    
+    def test_rang(self):
+        """Test le rang d'un utilisateur, ex aequo compris"""
+        for user, points in zip(self.users, [100, 200, 100]):
+            UserProgress.objects.create(user=user, points_xp=points)
+        with self.assertNumQueries(2):
+            self.assertEqual(LeaderboardService.rang(self.users[0]), 2)
+        self.assertEqual(LeaderboardService.rang(self.users[1]), 1)
+        self.assertEqual([e['position'] for e in LeaderboardService.classement()], [1, 2, 2])
+        self.assertIsNone(LeaderboardService.rang(self.users[0], 'weekly'))
+    
+    def test_rang_periode_position_stockee(self):
+        """Test que le rang d'une période est la position calculée par build_leaderboards"""
+        LeaderboardService.enregistrer_gains({self.users[0].id: 10, self.users[1].id: 30})
+        LeaderboardService.calculer_positions('daily')
+        with self.assertNumQueries(1):
+            self.assertEqual(LeaderboardService.rang(self.users[0], 'daily'), 2)
+        
+        # Ligne pas encore positionnée : rang compté
+        LeaderboardService.enregistrer_gains({self.users[2].id: 50})
+        self.assertEqual(LeaderboardService.rang(self.users[2], 'daily'), 1)
+        # Position stockée jusqu'à la prochaine exécution
+        self.assertEqual(LeaderboardService.rang(self.users[1], 'daily'), 1)
+        LeaderboardService.calculer_positions('daily')
+        self.assertEqual(LeaderboardService.rang(self.users[1], 'daily'), 2)
+    
+    def test_classement_nombre_badges(self):
+        """Test que le nombre de badges est précalculé"""
+        Badge.objects.create(nom='Q1', description='', condition_type='qcm_first', points_xp=10)
+        GamificationService.ajouter_xp_qcm(self.users[0], 50)
+        with self.assertNumQueries(1):
+            classement = LeaderboardService.classement()
+        self.assertEqual(classement[0]['badges_count'], 1)
+
+
+class BuildLeaderboardsTest(TestCase):
+    """Tests pour la commande build_leaderboards"""
+    
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='pass') for i in range(4)]
+        self.today = timezone.localdate()
+        now = timezone.now()
+        for user, points in zip(self.users, [30, 50, 30, 0]):
+            if points:
+                XPEvent.objects.create(user=user, type_evenement='qcm', points=points, created_at=now)
+        # Hors de la fenêtre quotidienne
+        XPEvent.objects.create(user=self.users[3], type_evenement='qcm', points=99,
+                               created_at=now - timedelta(days=40))
+    
+    def _scores(self, periode='daily'):
+        return dict(
+            Leaderboard.objects.filter(periode=periode, date=LeaderboardService.debut_periode(periode))
+            .values_list('user__username', 'position')
+        )
+    
+    def test_build_leaderboards(self):
+        """Test l'agrégation par période et le calcul des positions"""
+        call_command('build_leaderboards', stdout=StringIO())
+        self.assertEqual(self._scores(), {'user1': 1, 'user0': 2, 'user2': 2})
+        self.assertEqual(
+            Leaderboard.objects.get(user=self.users[1], periode='monthly').score, 50
+        )
+        # Idempotente
+        call_command('build_leaderboards', stdout=StringIO())
+        self.assertEqual(Leaderboard.objects.filter(periode='daily').count(), 3)
+    
+    def test_corrige_les_scores_incrementaux(self):
+        """Test que la reconstruction remplace les scores dérivés"""
+        LeaderboardService.enregistrer_gains({self.users[0].id: 500})
+        LeaderboardService.reconstruire_scores('daily')
+        self.assertEqual(Leaderboard.objects.get(user=self.users[0], periode='daily').score, 30)
+    
+    def test_shards_puis_positions(self):
+        """Test la répartition par tranches d'identifiants"""
+        milieu = self.users[2].id
+        options = {'periodes': 'daily', 'skip_positions': True, 'stdout': StringIO()}
+        call_command('build_leaderboards', user_max=milieu, **options)
+        call_command('build_leaderboards', user_min=milieu, **options)
+        call_command('build_leaderboards', periodes='daily', positions_only=True, stdout=StringIO())
+        self.assertEqual(self._scores(), {'user1': 1, 'user0': 2, 'user2': 2})
+    
+    def test_reprise_checkpoint(self):
+        """Test la reprise d'une exécution interrompue"""
+        with tempfile.TemporaryDirectory() as tmp:
+            chemin = os.path.join(tmp, 'checkpoint.json')
+            cle = f"daily:{self.today}:0-"
+            with open(chemin, 'w') as fichier:
+                json.dump({cle: self.users[1].id}, fichier)
+            
+            call_command('build_leaderboards', periodes='daily', checkpoint=chemin, batch_size=1, stdout=StringIO())
+            
+            self.assertNotIn('user0', self._scores())
+            self.assertIn('user1', self._scores())
+            with open(chemin) as fichier:
+                self.assertEqual(json.load(fichier), {})
+
+
 class GamificationViewsTest(TestCase):
     """Tests pour les vues de gamification"""
     
@@ -180,6 +460,15 @@ class GamificationViewsTest(TestCase):
         self.assertTemplateUsed(response, 'gamification/dashboard.html')
         self.assertContains(response, 'Progression')
     
+    def test_gamification_dashboard_periode(self):
+        """Test le classement d'une période"""
+        self.client.login(username='testuser', password='testpass123')
+        GamificationService.ajouter_xp_tuteur(self.user)
+        response = self.client.get(reverse('gamification:dashboard'), {'periode': 'weekly'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['periode'], 'weekly')
+        self.assertEqual(response.context['user_position'], 1)
+    
     def test_badges_list_authenticated(self):
         """Test la liste des badges"""
         self.client.login(username='testuser', password='testpass123')
@@ -1,8 +1,9 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from .models import UserProgress, UserBadge, Badge
+from .models import UserProgress, UserBadge, Badge, Leaderboard
 from .services import GamificationService
+from .leaderboard import LeaderboardService, PERIODES
 
 User = get_user_model()
 
@@ -24,13 +25,12 @@ def gamification_dashboard(request):
     xp_needed = xp_prochain_niveau - xp_actuel
     pourcentage = (xp_progression / (xp_prochain_niveau - xp_niveau_actuel)) * 100
     
-    # Classement
-    leaderboard = GamificationService.get_leaderboard(limit=10)
-    user_position = None
-    for i, entry in enumerate(leaderboard, 1):
-        if entry['user'].id == request.user.id:
-            user_position = i
-            break
+    # Classement de la période choisie
+    periode = request.GET.get('periode', 'all_time')
+    if periode not in PERIODES:
+        periode = 'all_time'
+    leaderboard = GamificationService.get_leaderboard(periode, limit=10)
+    user_position = LeaderboardService.rang(request.user, periode)
     
     return render(request, 'gamification/dashboard.html', {
         'progress': progress,
@@ -40,6 +40,8 @@ def gamification_dashboard(request):
         'xp_needed': xp_needed,
         'leaderboard': leaderboard,
         'user_position': user_position,
+        'periode': periode,
+        'periodes': Leaderboard._meta.get_field('periode').choices,
     })
 
 
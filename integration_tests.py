@@ -1,7 +1,9 @@
 """
 Tests d'intégration pour vérifier que les fonctionnalités travaillent ensemble
 """
+from io import StringIO
 from django.test import TestCase, Client
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from accounts.models import Matiere, Chapitre
@@ -216,6 +218,9 @@ class IntegrationWorkflowTest(TestCase):
         response = self.client.post(qcm_url, qcm_data)
         qcm = QCM.objects.get(titre='QCM équations')
         
+        # Les questions sont générées par le worker de tâches
+        call_command('run_jobs', processes=0, once=True, stdout=StringIO())
+        
         # 5. Vérifier que tout est créé
         self.assertTrue(Note.objects.filter(user=self.user).exists())
         self.assertTrue(Deck.objects.filter(user=self.user).exists())
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'type_job', 'user', 'statut', 'progression', 'tentatives', 'created_at', 'finished_at']
+    list_filter = ['statut', 'type_job', 'created_at']
+    search_fields = ['type_job', 'user__username', 'erreur']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'updated_at']
+    date_hierarchy = 'created_at'
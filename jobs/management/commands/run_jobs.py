@@ -0,0 +1,86 @@
+"""
+Commande exécutant les tâches en arrière-plan
+Usage: python manage.py run_jobs [--processes 2] [--sleep 2] [--once]
+"""
+import os
+import socket
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from django.core.management.base import BaseCommand
+from jobs.services import JobService
+from jobs.worker import initialiser_processus, executer_dans_processus
+
+
+class Command(BaseCommand):
+    help = 'Exécute les tâches en attente dans un pool de processus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help="Nombre de processus du pool (0 : exécution dans le processus courant)")
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help="Attente entre deux interrogations de la file (secondes)")
+        parser.add_argument('--once', action='store_true',
+                            help="Traite les tâches en attente puis s'arrête")
+
+    def handle(self, *args, **options):
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.sleep = options['sleep']
+        self.once = options['once']
+
+        self.stdout.write(f"Worker {self.worker} démarré ({options['processes']} processus)")
+        try:
+            if options['processes'] > 0:
+                traites = self._boucle_pool(options['processes'])
+            else:
+                traites = self._boucle_locale()
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt du worker")
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"{traites} tâche(s) traitée(s)"))
+
+    def _boucle_locale(self):
+        traites = 0
+        while True:
+            JobService.relancer_bloques()
+            job_ids = JobService.reclamer(self.worker, limite=1)
+            for job_id in job_ids:
+                JobService.executer(job_id)
+                traites += 1
+            if not job_ids:
+                if self.once:
+                    return traites
+                time.sleep(self.sleep)
+
+    def _boucle_pool(self, processes):
+        traites = 0
+        en_cours = set()
+        settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'learnia.settings')
+
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=initialiser_processus,
+            initargs=(settings_module, processes),
+        ) as executor:
+            while True:
+                JobService.relancer_bloques()
+                places = processes - len(en_cours)
+                job_ids = JobService.reclamer(self.worker, limite=places) if places else []
+                for job_id in job_ids:
+                    en_cours.add(executor.submit(executer_dans_processus, job_id))
+
+                if not en_cours:
+                    if self.once:
+                        return traites
+                    time.sleep(self.sleep)
+                    continue
+
+                finis, en_cours = wait(en_cours, timeout=self.sleep, return_when=FIRST_COMPLETED)
+                for future in finis:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.stderr.write(f"Erreur du processus : {e}")
+                    traites += 1
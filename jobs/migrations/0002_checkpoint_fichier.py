@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='checkpoint',
+            field=models.JSONField(blank=True, default=dict, help_text='État de reprise après un arrêt du worker'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='fichier',
+            field=models.FileField(blank=True, help_text='Fichier produit par la tâche', upload_to='jobs/'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+User = get_user_model()
+
+
+class Job(models.Model):
+    """Tâche exécutée en arrière-plan par la commande run_jobs"""
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('termine', 'Terminé'),
+        ('echec', 'Échec'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    type_job = models.CharField(max_length=100)
+    parametres = models.JSONField(default=dict, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    progression = models.IntegerField(default=0, help_text="Avancement en pourcentage")
+    resultat = models.JSONField(default=dict, blank=True)
+    erreur = models.TextField(blank=True)
+    checkpoint = models.JSONField(default=dict, blank=True, help_text="État de reprise après un arrêt du worker")
+    fichier = models.FileField(upload_to='jobs/', blank=True, help_text="Fichier produit par la tâche")
+    tentatives = models.IntegerField(default=0)
+    max_tentatives = models.IntegerField(default=3)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['statut', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.type_job} #{self.id} ({self.get_statut_display()})"
+
+    @property
+    def est_fini(self):
+        return self.statut in ('termine', 'echec')
+
+    def maj_progression(self, progression):
+        """Met à jour l'avancement (sert aussi de signe de vie du worker)"""
+        self.progression = max(0, min(100, int(progression)))
+        Job.objects.filter(id=self.id).update(progression=self.progression, updated_at=timezone.now())
+
+    def sauver_checkpoint(self, checkpoint, progression=None):
+        """Enregistre l'état de reprise (et l'avancement) sans toucher au reste de la tâche"""
+        self.checkpoint = checkpoint
+        if progression is not None:
+            self.progression = max(0, min(100, int(progression)))
+        Job.objects.filter(id=self.id).update(
+            checkpoint=checkpoint, progression=self.progression, updated_at=timezone.now()
+        )
@@ -0,0 +1,26 @@
+"""
+Registre des types de tâches
+
+Usage, dans le module tasks.py d'une application :
+
+    from jobs.registry import register
+
+    @register('qcm.generer_questions')
+    def generer_questions(job):
+        ...
+        return {'questions': 5}   # stocké dans job.resultat
+"""
+_handlers = {}
+
+
+def register(type_job):
+    """Décorateur enregistrant la fonction qui exécute un type de tâche"""
+    def decorator(func):
+        _handlers[type_job] = func
+        return func
+    return decorator
+
+
+def get_handler(type_job):
+    """Retourne la fonction d'un type de tâche (KeyError si inconnu)"""
+    return _handlers[type_job]
@@ -0,0 +1,135 @@
+"""
+File de tâches en arrière-plan stockée en base de données
+
+Les vues mettent une tâche en file (JobService.enqueue) et répondent
+immédiatement ; la commande run_jobs réclame et exécute les tâches dans un
+pool de processus, hors des workers web.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import Job
+from .registry import get_handler
+
+logger = logging.getLogger(__name__)
+
+
+class JobService:
+    """Service de gestion de la file de tâches"""
+
+    @classmethod
+    def enqueue(cls, type_job, parametres=None, user=None):
+        """
+        Met une tâche en file
+
+        Avec settings.JOBS_EAGER, la tâche est exécutée immédiatement dans le
+        processus courant (développement, tests).
+        """
+        job = Job.objects.create(
+            user=user,
+            type_job=type_job,
+            parametres=parametres or {},
+        )
+
+        if getattr(settings, 'JOBS_EAGER', False):
+            while cls._reclamer_job(job.id, 'eager'):
+                cls.executer(job.id)
+            job.refresh_from_db()
+
+        return job
+
+    @classmethod
+    def reclamer(cls, worker, limite=1):
+        """
+        Réclame jusqu'à `limite` tâches en attente, les plus anciennes d'abord
+
+        La réclamation est une mise à jour conditionnelle sur le statut :
+        deux workers ne peuvent pas obtenir la même tâche.
+
+        Returns:
+            list: Les identifiants des tâches réclamées
+        """
+        candidats = Job.objects.filter(statut='en_attente').order_by('created_at', 'id').values_list('id', flat=True)
+        reclames = []
+        for job_id in candidats[:limite * 2]:
+            if cls._reclamer_job(job_id, worker):
+                reclames.append(job_id)
+                if len(reclames) >= limite:
+                    break
+        return reclames
+
+    @staticmethod
+    def _reclamer_job(job_id, worker):
+        """Passe une tâche en cours si elle est toujours en attente"""
+        maintenant = timezone.now()
+        return Job.objects.filter(id=job_id, statut='en_attente').update(
+            statut='en_cours',
+            worker=worker,
+            tentatives=F('tentatives') + 1,
+            started_at=maintenant,
+            updated_at=maintenant,
+        ) == 1
+
+    @classmethod
+    def executer(cls, job_id):
+        """
+        Exécute une tâche réclamée
+
+        En cas d'exception, la tâche repart en file tant qu'il reste des
+        tentatives, sinon elle passe en échec.
+        """
+        job = Job.objects.get(id=job_id)
+
+        try:
+            handler = get_handler(job.type_job)
+        except KeyError:
+            cls._terminer(job, 'echec', erreur=f"Type de tâche inconnu : {job.type_job}")
+            return job
+
+        try:
+            resultat = handler(job)
+        except Exception as e:
+            logger.exception("Échec de la tâche %s (tentative %s)", job.id, job.tentatives)
+            if job.tentatives < job.max_tentatives:
+                Job.objects.filter(id=job.id).update(
+                    statut='en_attente', worker='', erreur=str(e), updated_at=timezone.now()
+                )
+                job.refresh_from_db()
+            else:
+                cls._terminer(job, 'echec', erreur=str(e))
+            return job
+
+        cls._terminer(job, 'termine', resultat=resultat or {})
+        return job
+
+    @staticmethod
+    def _terminer(job, statut, resultat=None, erreur=''):
+        job.statut = statut
+        job.erreur = erreur
+        job.finished_at = timezone.now()
+        if resultat is not None:
+            job.resultat = resultat
+        if statut == 'termine':
+            job.progression = 100
+        job.save(update_fields=['statut', 'erreur', 'finished_at', 'resultat', 'progression', 'updated_at'])
+
+    @staticmethod
+    def relancer_bloques(timeout=None):
+        """
+        Remet en file les tâches en cours sans signe de vie depuis `timeout`
+        secondes (worker arrêté brutalement)
+
+        Returns:
+            int: Le nombre de tâches remises en file
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'JOBS_TIMEOUT', 600)
+        maintenant = timezone.now()
+        bloques = Job.objects.filter(statut='en_cours', updated_at__lt=maintenant - timedelta(seconds=timeout))
+
+        bloques.filter(tentatives__gte=F('max_tentatives')).update(
+            statut='echec', erreur="Délai d'exécution dépassé", finished_at=maintenant, updated_at=maintenant
+        )
+        return bloques.update(statut='en_attente', worker='', updated_at=maintenant)
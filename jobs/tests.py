@@ -0,0 +1,130 @@
+"""
+Tests unitaires pour la file de tâches en arrière-plan
+"""
+from datetime import timedelta
+from io import StringIO
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from .models import Job
+from .registry import register
+from .services import JobService
+
+User = get_user_model()
+
+appels = []
+
+
+@register('tests.addition')
+def addition(job):
+    appels.append(job.id)
+    return {'somme': job.parametres['a'] + job.parametres['b']}
+
+
+@register('tests.echec')
+def echec(job):
+    raise ValueError('Erreur de test')
+
+
+class JobServiceTest(TestCase):
+    """Tests pour le service de file de tâches"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def test_enqueue_en_attente(self):
+        """Test qu'une tâche mise en file n'est pas exécutée dans la requête"""
+        job = JobService.enqueue('tests.addition', {'a': 1, 'b': 2}, user=self.user)
+        self.assertEqual(job.statut, 'en_attente')
+        self.assertEqual(job.tentatives, 0)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_enqueue_eager(self):
+        """Test l'exécution immédiate en mode eager"""
+        job = JobService.enqueue('tests.addition', {'a': 1, 'b': 2})
+        self.assertEqual(job.statut, 'termine')
+        self.assertEqual(job.resultat, {'somme': 3})
+        self.assertEqual(job.progression, 100)
+
+    def test_reclamer_une_seule_fois(self):
+        """Test qu'une tâche ne peut être réclamée que par un worker"""
+        job = JobService.enqueue('tests.addition', {'a': 1, 'b': 2})
+        self.assertEqual(JobService.reclamer('worker-1'), [job.id])
+        self.assertEqual(JobService.reclamer('worker-2'), [])
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'en_cours')
+        self.assertEqual(job.worker, 'worker-1')
+        self.assertEqual(job.tentatives, 1)
+
+    def test_echec_puis_nouvelle_tentative(self):
+        """Test la remise en file puis l'échec définitif"""
+        job = JobService.enqueue('tests.echec')
+        job.max_tentatives = 2
+        job.save()
+
+        with self.assertLogs('jobs.services', level='ERROR'):
+            JobService.executer(JobService.reclamer('w')[0])
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'en_attente')
+        self.assertEqual(job.erreur, 'Erreur de test')
+
+        with self.assertLogs('jobs.services', level='ERROR'):
+            JobService.executer(JobService.reclamer('w')[0])
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'echec')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_type_inconnu(self):
+        """Test qu'un type de tâche inconnu échoue sans nouvelle tentative"""
+        job = JobService.enqueue('tests.inconnu')
+        JobService.executer(JobService.reclamer('w')[0])
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'echec')
+
+    def test_relancer_bloques(self):
+        """Test la remise en file des tâches d'un worker arrêté"""
+        job = JobService.enqueue('tests.addition', {'a': 1, 'b': 2})
+        JobService.reclamer('w')
+        Job.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(JobService.relancer_bloques(timeout=600), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.statut, 'en_attente')
+
+    def test_commande_run_jobs(self):
+        """Test la commande run_jobs sans pool de processus"""
+        jobs = [JobService.enqueue('tests.addition', {'a': i, 'b': 1}) for i in range(3)]
+        out = StringIO()
+        call_command('run_jobs', processes=0, once=True, stdout=out)
+
+        self.assertIn('3 tâche(s) traitée(s)', out.getvalue())
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.statut, 'termine')
+
+
+class JobViewsTest(TestCase):
+    """Tests pour la vue de statut"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.autre = User.objects.create_user(username='autre', password='testpass123')
+        self.job = JobService.enqueue('tests.addition', {'a': 1, 'b': 2}, user=self.user)
+
+    def test_job_status(self):
+        """Test le statut JSON d'une tâche"""
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('jobs:status', args=[self.job.id]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['statut'], 'en_attente')
+        self.assertFalse(data['est_fini'])
+
+    def test_job_status_autre_utilisateur(self):
+        """Test qu'un utilisateur ne voit pas les tâches des autres"""
+        self.client.login(username='autre', password='testpass123')
+        response = self.client.get(reverse('jobs:status', args=[self.job.id]))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,23 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, Http404
+from django.shortcuts import get_object_or_404
+from .models import Job
+
+
+@login_required
+def job_status(request, job_id):
+    """Statut d'une tâche (interrogé par les pages en attente d'un résultat)"""
+    job = get_object_or_404(Job, id=job_id)
+    if job.user_id != request.user.id and not request.user.is_staff:
+        raise Http404
+
+    return JsonResponse({
+        'id': job.id,
+        'type_job': job.type_job,
+        'statut': job.statut,
+        'statut_display': job.get_statut_display(),
+        'progression': job.progression,
+        'est_fini': job.est_fini,
+        'resultat': job.resultat,
+        'erreur': job.erreur if job.statut == 'echec' else '',
+    })
@@ -0,0 +1,44 @@
+"""
+Point d'entrée des processus du pool de run_jobs
+
+Les processus sont démarrés en mode « spawn » : chacun initialise Django
+avant d'exécuter des tâches.
+"""
+import os
+
+PROCESSUS_POOL = 0  # Taille du pool run_jobs du processus courant (0 : hors pool)
+
+
+def initialiser_processus(settings_module, processus=0):
+    """Initialise Django dans un processus du pool"""
+    global PROCESSUS_POOL
+    PROCESSUS_POOL = processus
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def processus_par_tache():
+    """
+    Processus qu'une tâche peut lancer pour elle-même
+
+    Dans un pool run_jobs de N processus, N tâches tournent en même temps :
+    chacune dispose d'une part des processeurs (au moins un, rendu sur
+    place). None hors pool : aucune limite.
+    """
+    if not PROCESSUS_POOL:
+        return None
+    return max(1, (os.cpu_count() or 1) // PROCESSUS_POOL)
+
+
+def executer_dans_processus(job_id):
+    """Exécute une tâche dans un processus du pool"""
+    from django.db import close_old_connections
+    from .services import JobService
+
+    close_old_connections()
+    try:
+        JobService.executer(job_id)
+    finally:
+        close_old_connections()
+    return job_id
@@ -0,0 +1,44 @@
+"""
+Décorateurs pour les vues asynchrones
+
+Les décorateurs de Django 4.2 (login_required, csrf_exempt, require_http_methods)
+enveloppent la vue dans une fonction synchrone : une vue ``async def`` décorée
+ne serait plus reconnue comme asynchrone. Ces équivalents préservent la coroutine.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
+
+
+def async_login_required(view_func):
+    """Équivalent asynchrone de login_required"""
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        # request.user est paresseux : la lecture de session se fait dans un thread
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+def async_csrf_exempt(view_func):
+    """Équivalent asynchrone de csrf_exempt"""
+    @wraps(view_func)
+    async def _wrapped_view(*args, **kwargs):
+        return await view_func(*args, **kwargs)
+    _wrapped_view.csrf_exempt = True
+    return _wrapped_view
+
+
+def async_require_http_methods(request_method_list):
+    """Équivalent asynchrone de require_http_methods"""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,210 @@
+"""
+Cache des réponses Gemini
+Évite de renvoyer au modèle une génération identique (même modèle, même
+instruction système, même prompt, même configuration de génération)
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model_name, system_instruction, prompt, generation_config):
+    """
+    Calcule la clé de cache d'une génération
+
+    La clé est l'empreinte SHA-256 du quadruplet (modèle, instruction système,
+    prompt, configuration), sérialisé de façon canonique.
+    """
+    payload = json.dumps(
+        [model_name, system_instruction or '', prompt, generation_config or {}],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BaseResponseCache(ABC):
+    """Interface commune des backends de cache"""
+
+    def __init__(self, ttl=3600, max_entries=1000, **options):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def get(self, key):
+        """Réponse en cache, ou None"""
+
+    @abstractmethod
+    def set(self, key, value):
+        """Met une réponse en cache"""
+
+    @abstractmethod
+    def clear(self):
+        """Vide les réponses de ce cache (et seulement elles)"""
+
+
+class MemoryResponseCache(BaseResponseCache):
+    """Cache en mémoire du processus, avec expiration (TTL) et éviction LRU"""
+
+    def __init__(self, ttl=3600, max_entries=1000, **options):
+        super().__init__(ttl, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while self.max_entries and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoResponseCache(BaseResponseCache):
+    """
+    Délègue au framework de cache Django (locmem, Redis, Memcached...)
+
+    L'éviction LRU est assurée par le backend Django configuré. Les clés
+    sont préfixées par un numéro de version stocké dans le cache : clear()
+    incrémente ce numéro, ce qui rend invisibles les réponses précédentes
+    (elles expirent ensuite avec leur TTL) sans toucher aux autres données
+    du cache Django (sessions, corrigés, graphiques...).
+    """
+
+    def __init__(self, ttl=3600, max_entries=1000, alias='default', key_prefix='gemini', **options):
+        super().__init__(ttl, max_entries)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    @property
+    def _version_key(self):
+        return f"{self.key_prefix}:version"
+
+    def _key(self, key):
+        version = self._cache.get_or_set(self._version_key, 1, timeout=None)
+        return f"{self.key_prefix}:v{version}:{key}"
+
+    def get(self, key):
+        return self._cache.get(self._key(key))
+
+    def set(self, key, value):
+        self._cache.set(self._key(key), value, timeout=self.ttl or None)
+
+    def clear(self):
+        try:
+            self._cache.incr(self._version_key)
+        except ValueError:
+            # Version absente (jamais utilisée, ou évincée) : repartir d'une nouvelle
+            self._cache.set(self._version_key, int(time.time()), timeout=None)
+
+
+class SQLiteResponseCache(BaseResponseCache):
+    """Cache persistant dans un fichier SQLite, partagé entre les processus"""
+
+    def __init__(self, ttl=3600, max_entries=1000, path=None, **options):
+        super().__init__(ttl, max_entries)
+        self.path = str(path or settings.BASE_DIR / 'gemini_cache.sqlite3')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS reponses ('
+                'cle TEXT PRIMARY KEY, valeur TEXT NOT NULL, '
+                'expire_le REAL, utilise_le REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS reponses_lru ON reponses (utilise_le)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT valeur, expire_le FROM reponses WHERE cle = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        valeur, expire_le = row
+        now = time.time()
+        if expire_le is not None and expire_le < now:
+            conn.execute('DELETE FROM reponses WHERE cle = ?', (key,))
+            return None
+        conn.execute('UPDATE reponses SET utilise_le = ? WHERE cle = ?', (now, key))
+        return valeur
+
+    def set(self, key, value):
+        conn = self._connection()
+        now = time.time()
+        expire_le = now + self.ttl if self.ttl else None
+        conn.execute(
+            'INSERT OR REPLACE INTO reponses (cle, valeur, expire_le, utilise_le) VALUES (?, ?, ?, ?)',
+            (key, value, expire_le, now),
+        )
+        if self.max_entries:
+            conn.execute(
+                'DELETE FROM reponses WHERE cle IN ('
+                'SELECT cle FROM reponses ORDER BY utilise_le DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM reponses')
+
+
+BACKENDS = {
+    'memory': MemoryResponseCache,
+    'django': DjangoResponseCache,
+    'sqlite': SQLiteResponseCache,
+}
+
+
+def build_response_cache(config=None):
+    """
+    Construit le cache décrit par ``settings.GEMINI_RESPONSE_CACHE``
+
+    ``BACKEND`` accepte un alias (memory, django, sqlite), un chemin pointé vers
+    une sous-classe de BaseResponseCache, ou None pour désactiver le cache.
+    """
+    if config is None:
+        config = getattr(settings, 'GEMINI_RESPONSE_CACHE', {})
+    config = dict(config or {})
+    backend = config.pop('BACKEND', 'memory')
+    if not backend:
+        return None
+
+    backend_class = BACKENDS.get(backend) or import_string(backend)
+    options = {key.lower(): value for key, value in config.items()}
+    return backend_class(**options)
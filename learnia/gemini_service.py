@@ -3,8 +3,10 @@ Service centralisé pour l'API Gemini
 Gère toutes les interactions avec Google Gemini AI
 """
 import google.generativeai as genai
+from asgiref.sync import sync_to_async
 from django.conf import settings
 import logging
+from .gemini_cache import build_response_cache, make_cache_key
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,9 @@ class GeminiService:
     
     _initialized = False
     _model = None
+    _model_name = None
+    _response_cache = None
+    _response_cache_ready = False
     
     @classmethod
     def _initialize(cls):
@@ -41,6 +46,7 @@ class GeminiService:
             for model_name in model_names:
                 try:
                     cls._model = genai.GenerativeModel(model_name)
+                    cls._model_name = model_name
                     logger.info(f"Gemini API initialisée avec le modèle: {model_name}")
                     break
                 except Exception as e:
@@ -62,7 +68,45 @@ class GeminiService:
         return cls._model is not None
     
     @classmethod
-    def generate_text(cls, prompt, system_instruction=None, temperature=0.7, max_tokens=None):
+    def get_response_cache(cls):
+        """Retourne le cache de réponses configuré (None si désactivé)"""
+        if not cls._response_cache_ready:
+            try:
+                cls._response_cache = build_response_cache()
+            except Exception as e:
+                logger.error(f"Cache de réponses Gemini indisponible: {e}")
+                cls._response_cache = None
+            cls._response_cache_ready = True
+        return cls._response_cache
+    
+    @classmethod
+    def _prepare_generation(cls, prompt, system_instruction, temperature, max_tokens, use_cache):
+        """
+        Prépare une génération de texte (partagé entre les API sync et async)
+        
+        Returns:
+            tuple: (prompt complet, configuration de génération, cache, clé de cache)
+        """
+        generation_config = {
+            'temperature': temperature,
+        }
+        if max_tokens:
+            generation_config['max_output_tokens'] = max_tokens
+        
+        cache = cls.get_response_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = make_cache_key(cls._model_name, system_instruction, prompt, generation_config)
+        
+        # Construire le prompt complet
+        full_prompt = prompt
+        if system_instruction:
+            full_prompt = f"{system_instruction}\n\n{prompt}"
+        
+        return full_prompt, generation_config, cache, cache_key
+    
+    @classmethod
+    def generate_text(cls, prompt, system_instruction=None, temperature=0.7, max_tokens=None, use_cache=True):
         """
         Génère du texte avec Gemini
         
@@ -71,6 +115,7 @@ class GeminiService:
             system_instruction: Instruction système (optionnel)
             temperature: Contrôle la créativité (0.0-1.0)
             max_tokens: Nombre maximum de tokens (optionnel)
+            use_cache: Réutiliser une réponse identique déjà générée
         
         Returns:
             str: Le texte généré, ou None en cas d'erreur
@@ -82,16 +127,13 @@ class GeminiService:
             return None
         
         try:
-            generation_config = {
-                'temperature': temperature,
-            }
-            if max_tokens:
-                generation_config['max_output_tokens'] = max_tokens
-            
-            # Construire le prompt complet
-            full_prompt = prompt
-            if system_instruction:
-                full_prompt = f"{system_instruction}\n\n{prompt}"
+            full_prompt, generation_config, cache, cache_key = cls._prepare_generation(
+                prompt, system_instruction, temperature, max_tokens, use_cache
+            )
+            if cache_key:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached
             
             response = cls._model.generate_content(
                 full_prompt,
@@ -99,7 +141,10 @@ class GeminiService:
             )
             
             if response and response.text:
-                return response.text.strip()
+                text = response.text.strip()
+                if cache_key:
+                    cache.set(cache_key, text)
+                return text
             else:
                 logger.warning("Réponse Gemini vide")
                 return None
@@ -108,6 +153,108 @@ class GeminiService:
             logger.error(f"Erreur lors de la génération avec Gemini: {e}")
             return None
     
+    @classmethod
+    async def agenerate_text(cls, prompt, system_instruction=None, temperature=0.7, max_tokens=None, use_cache=True):
+        """
+        Version asynchrone de generate_text
+        
+        L'appel au modèle ne bloque pas la boucle d'événements : sous ASGI,
+        un même processus peut attendre de nombreuses générations à la fois.
+        """
+        cls._initialize()
+        
+        if not cls._model:
+            logger.warning("Gemini non disponible, fallback vers service local")
+            return None
+        
+        try:
+            full_prompt, generation_config, cache, cache_key = cls._prepare_generation(
+                prompt, system_instruction, temperature, max_tokens, use_cache
+            )
+            if cache_key:
+                cached = await sync_to_async(cache.get)(cache_key)
+                if cached is not None:
+                    return cached
+            
+            response = await cls._model.generate_content_async(
+                full_prompt,
+                generation_config=generation_config
+            )
+            
+            if response and response.text:
+                text = response.text.strip()
+                if cache_key:
+                    await sync_to_async(cache.set)(cache_key, text)
+                return text
+            else:
+                logger.warning("Réponse Gemini vide")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération avec Gemini: {e}")
+            return None
+    
+    @classmethod
+    def stream_text(cls, prompt, system_instruction=None, temperature=0.7, max_tokens=None, use_cache=True):
+        """
+        Génère du texte avec Gemini en flux (generate_content(stream=True))
+        
+        Les morceaux sont produits au fur et à mesure de la génération ; la
+        réponse complète est mise en cache à la fin du flux. Ne produit rien
+        si Gemini est indisponible ou en cas d'erreur avant le premier morceau.
+        
+        Yields:
+            str: Les morceaux de texte générés
+        """
+        cls._initialize()
+        
+        if not cls._model:
+            logger.warning("Gemini non disponible, fallback vers service local")
+            return
+        
+        try:
+            full_prompt, generation_config, cache, cache_key = cls._prepare_generation(
+                prompt, system_instruction, temperature, max_tokens, use_cache
+            )
+            if cache_key:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    yield cached
+                    return
+            
+            response = cls._model.generate_content(
+                full_prompt,
+                generation_config=generation_config,
+                stream=True
+            )
+            yield from cls._consume_stream(response, cache, cache_key)
+                
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération en flux avec Gemini: {e}")
+    
+    @staticmethod
+    def _consume_stream(response, cache, cache_key):
+        """Relaie les morceaux d'une réponse en flux et met en cache le texte complet"""
+        chunks = []
+        for chunk in response:
+            text = chunk.text
+            if text:
+                chunks.append(text)
+                yield text
+        
+        full_text = ''.join(chunks).strip()
+        if cache_key and full_text:
+            cache.set(cache_key, full_text)
+    
+    @staticmethod
+    def _structured_instruction(system_instruction, format_type):
+        """Complète l'instruction système selon le format attendu"""
+        if format_type == "json":
+            system_instruction = (system_instruction or "") + "\n\nRéponds UNIQUEMENT en format JSON valide, sans markdown."
+        elif format_type == "list":
+            system_instruction = (system_instruction or "") + "\n\nRéponds sous forme de liste à puces, chaque élément sur une nouvelle ligne."
+        return system_instruction
+    
     @classmethod
     def generate_structured_response(cls, prompt, system_instruction=None, format_type="text"):
         """
@@ -121,21 +268,83 @@ class GeminiService:
         Returns:
             str: La réponse générée
         """
-        if format_type == "json":
-            system_instruction = (system_instruction or "") + "\n\nRéponds UNIQUEMENT en format JSON valide, sans markdown."
-        elif format_type == "list":
-            system_instruction = (system_instruction or "") + "\n\nRéponds sous forme de liste à puces, chaque élément sur une nouvelle ligne."
-        
+        system_instruction = cls._structured_instruction(system_instruction, format_type)
         return cls.generate_text(prompt, system_instruction)
     
     @classmethod
-    def chat_response(cls, messages, system_instruction=None):
+    async def agenerate_structured_response(cls, prompt, system_instruction=None, format_type="text"):
+        """Version asynchrone de generate_structured_response"""
+        system_instruction = cls._structured_instruction(system_instruction, format_type)
+        return await cls.agenerate_text(prompt, system_instruction)
+    
+    @classmethod
+    def _model_for(cls, system_instruction=None):
+        """
+        Retourne un modèle portant l'instruction système nativement
+        
+        L'instruction voyage avec la requête au lieu d'être envoyée comme un
+        tour de conversation supplémentaire (et facturé).
+        """
+        if not system_instruction:
+            return cls._model
+        return genai.GenerativeModel(cls._model_name, system_instruction=system_instruction)
+    
+    @staticmethod
+    def _chat_contents(messages):
+        """
+        Convertit un historique [{"role", "content"}] en contenus Gemini
+        
+        Les rôles sont ramenés à user/model, les tours consécutifs d'un même
+        rôle fusionnés, et l'historique commence toujours par l'élève.
+        """
+        contents = []
+        for message in messages:
+            text = (message.get("content") or "").strip()
+            if not text:
+                continue
+            role = "model" if message.get("role") in ("assistant", "model") else "user"
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"][0] += f"\n\n{text}"
+            else:
+                contents.append({"role": role, "parts": [text]})
+        
+        while contents and contents[0]["role"] != "user":
+            contents.pop(0)
+        return contents
+    
+    @classmethod
+    def _prepare_chat(cls, messages, system_instruction, temperature, use_cache):
+        """
+        Prépare une requête de conversation (un seul appel au modèle)
+        
+        Returns:
+            tuple: (contenus, configuration, cache, clé de cache), contenus vides
+            si le dernier tour n'est pas un message de l'élève
+        """
+        contents = cls._chat_contents(messages)
+        if not contents or contents[-1]["role"] != "user":
+            return [], None, None, None
+        
+        generation_config = {
+            'temperature': temperature,
+        }
+        cache = cls.get_response_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = make_cache_key(cls._model_name, system_instruction, contents, generation_config)
+        return contents, generation_config, cache, cache_key
+    
+    @classmethod
+    def chat_response(cls, messages, system_instruction=None, temperature=0.7, use_cache=True):
         """
         Génère une réponse dans un contexte de conversation
         
         Args:
             messages: Liste de messages [{"role": "user", "content": "..."}, ...]
+                (rôles user/assistant, le dernier étant la question de l'élève)
             system_instruction: Instruction système
+            temperature: Contrôle la créativité (0.0-1.0)
+            use_cache: Réutiliser une réponse identique déjà générée
         
         Returns:
             str: La réponse générée
@@ -146,25 +355,111 @@ class GeminiService:
             return None
         
         try:
-            # Construire l'historique de conversation
-            chat = cls._model.start_chat(history=[])
+            contents, generation_config, cache, cache_key = cls._prepare_chat(
+                messages, system_instruction, temperature, use_cache
+            )
+            if not contents:
+                return None
+            if cache_key:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached
             
-            # Ajouter l'instruction système si fournie
-            if system_instruction:
-                chat.send_message(system_instruction)
+            # Historique, instruction système et question dans une seule requête
+            response = cls._model_for(system_instruction).generate_content(
+                contents,
+                generation_config=generation_config
+            )
             
-            # Envoyer le dernier message (les messages précédents sont dans l'historique)
-            last_message = messages[-1] if messages else None
-            if last_message and last_message.get("role") == "user":
-                response = chat.send_message(last_message["content"])
-                return response.text.strip() if response and response.text else None
+            if response and response.text:
+                text = response.text.strip()
+                if cache_key:
+                    cache.set(cache_key, text)
+                return text
+            return None
             
+        except Exception as e:
+            logger.error(f"Erreur lors du chat avec Gemini: {e}")
+            return None
+    
+    @classmethod
+    async def achat_response(cls, messages, system_instruction=None, temperature=0.7, use_cache=True):
+        """Version asynchrone de chat_response"""
+        cls._initialize()
+        
+        if not cls._model:
+            return None
+        
+        try:
+            contents, generation_config, cache, cache_key = cls._prepare_chat(
+                messages, system_instruction, temperature, use_cache
+            )
+            if not contents:
+                return None
+            if cache_key:
+                cached = await sync_to_async(cache.get)(cache_key)
+                if cached is not None:
+                    return cached
+            
+            response = await cls._model_for(system_instruction).generate_content_async(
+                contents,
+                generation_config=generation_config
+            )
+            
+            if response and response.text:
+                text = response.text.strip()
+                if cache_key:
+                    await sync_to_async(cache.set)(cache_key, text)
+                return text
             return None
             
         except Exception as e:
             logger.error(f"Erreur lors du chat avec Gemini: {e}")
             return None
     
+    @classmethod
+    def stream_chat(cls, messages, system_instruction=None, temperature=0.7, use_cache=True):
+        """
+        Version en flux de chat_response
+        
+        Yields:
+            str: Les morceaux de la réponse
+        """
+        cls._initialize()
+        
+        if not cls._model:
+            return
+        
+        try:
+            contents, generation_config, cache, cache_key = cls._prepare_chat(
+                messages, system_instruction, temperature, use_cache
+            )
+            if not contents:
+                return
+            if cache_key:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    yield cached
+                    return
+            
+            response = cls._model_for(system_instruction).generate_content(
+                contents,
+                generation_config=generation_config,
+                stream=True
+            )
+            yield from cls._consume_stream(response, cache, cache_key)
+            
+        except Exception as e:
+            logger.error(f"Erreur lors du chat en flux avec Gemini: {e}")
+    
+    @staticmethod
+    def _load_image(image_path):
+        """Charge une image pour l'analyse"""
+        import PIL.Image
+        image = PIL.Image.open(image_path)
+        image.load()
+        return image
+    
     @classmethod
     def analyze_image(cls, image_path, prompt, system_instruction=None):
         """
@@ -185,10 +480,8 @@ class GeminiService:
             return None
         
         try:
-            import PIL.Image
-            
             # Charger l'image
-            image = PIL.Image.open(image_path)
+            image = cls._load_image(image_path)
             
             # Construire le prompt complet
             full_prompt = prompt
@@ -207,4 +500,32 @@ class GeminiService:
         except Exception as e:
             logger.error(f"Erreur lors de l'analyse d'image avec Gemini: {e}")
             return None
-
+    
+    @classmethod
+    async def aanalyze_image(cls, image_path, prompt, system_instruction=None):
+        """Version asynchrone de analyze_image"""
+        cls._initialize()
+        
+        if not cls._model:
+            logger.warning("Gemini non disponible pour l'analyse d'image")
+            return None
+        
+        try:
+            # Lecture disque hors de la boucle d'événements
+            image = await sync_to_async(cls._load_image, thread_sensitive=False)(image_path)
+            
+            full_prompt = prompt
+            if system_instruction:
+                full_prompt = f"{system_instruction}\n\n{prompt}"
+            
+            response = await cls._model.generate_content_async([full_prompt, image])
+            
+            if response and response.text:
+                return response.text.strip()
+            else:
+                logger.warning("Réponse Gemini vide pour l'image")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Erreur lors de l'analyse d'image avec Gemini: {e}")
+            return None
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'calendar_app',
     'fiches',
     'posts',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -152,3 +153,24 @@ LOGOUT_REDIRECT_URL = 'home'
 import os
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+
+# Cache des réponses Gemini (prompts identiques => réponse réutilisée)
+# BACKEND: 'memory' (par processus), 'django' (framework de cache Django),
+# 'sqlite' (fichier partagé entre processus), chemin pointé, ou None pour désactiver
+GEMINI_RESPONSE_CACHE = {
+    'BACKEND': os.getenv('GEMINI_CACHE_BACKEND', 'memory'),
+    'TTL': 3600,            # Durée de vie d'une réponse (secondes)
+    'MAX_ENTRIES': 1000,    # Au-delà, éviction LRU
+}
+
+
+# Tâches en arrière-plan (application jobs, exécutées par `manage.py run_jobs`)
+JOBS_EAGER = False      # True : exécution immédiate dans la requête (développement)
+JOBS_TIMEOUT = 600      # Tâche en cours sans signe de vie => remise en file (secondes)
+
+# Rapports PDF : processus de rendu des graphiques (0 : rendu dans le processus courant)
+EXPORT_RENDER_PROCESSES = 0
+
+# Packs de fiches (fiches/batch.py) : processus de rendu (0 : un par processeur ;
+# dans un pool run_jobs, limité à la part de processeurs de chaque tâche)
+FICHES_BATCH_PROCESSES = 0
@@ -0,0 +1,166 @@
+"""
+Tests unitaires pour le service Gemini centralisé
+"""
+import re
+import tempfile
+from pathlib import Path
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+from .gemini_cache import (
+    BaseResponseCache, DjangoResponseCache, MemoryResponseCache, SQLiteResponseCache,
+    build_response_cache, make_cache_key
+)
+from .gemini_service import GeminiService
+
+
+class FakeModel:
+    """Modèle Gemini factice qui compte les appels"""
+
+    def __init__(self, text='Réponse générée'):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            return [mock.Mock(text=mot) for mot in re.findall(r'\S+\s*', self.text)]
+        return mock.Mock(text=self.text)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return self.generate_content(contents, **kwargs)
+
+
+class GeminiResponseCacheTest(SimpleTestCase):
+    """Tests pour le cache des réponses Gemini"""
+
+    def test_cache_key_depends_on_all_inputs(self):
+        """Test que la clé change avec chaque élément de la génération"""
+        base = make_cache_key('gemini', 'sys', 'prompt', {'temperature': 0.7})
+        self.assertEqual(base, make_cache_key('gemini', 'sys', 'prompt', {'temperature': 0.7}))
+        self.assertNotEqual(base, make_cache_key('autre', 'sys', 'prompt', {'temperature': 0.7}))
+        self.assertNotEqual(base, make_cache_key('gemini', None, 'prompt', {'temperature': 0.7}))
+        self.assertNotEqual(base, make_cache_key('gemini', 'sys', 'autre', {'temperature': 0.7}))
+        self.assertNotEqual(base, make_cache_key('gemini', 'sys', 'prompt', {'temperature': 0.2}))
+
+    def test_memory_cache_lru_eviction(self):
+        """Test l'éviction de l'entrée la moins récemment utilisée"""
+        cache = MemoryResponseCache(ttl=60, max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(cache.get('a'), '1')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), '3')
+
+    def test_memory_cache_ttl(self):
+        """Test l'expiration des entrées"""
+        cache = MemoryResponseCache(ttl=10, max_entries=10)
+        with mock.patch('learnia.gemini_cache.time.monotonic', return_value=100.0):
+            cache.set('a', '1')
+        with mock.patch('learnia.gemini_cache.time.monotonic', return_value=120.0):
+            self.assertIsNone(cache.get('a'))
+
+    def test_sqlite_cache_lru_eviction(self):
+        """Test le backend SQLite"""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SQLiteResponseCache(ttl=60, max_entries=2, path=Path(tmp) / 'cache.sqlite3')
+            cache.set('a', '1')
+            cache.set('b', '2')
+            cache.set('c', '3')
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('c'), '3')
+
+    def test_django_cache_clear_scoped(self):
+        """clear() n'efface que les réponses Gemini, pas le reste du cache Django"""
+        from django.core.cache import cache as django_cache
+        gemini = DjangoResponseCache(ttl=60)
+        gemini.set('k', 'réponse')
+        django_cache.set('autre:donnee', 'conservée')
+        gemini.clear()
+        self.assertIsNone(gemini.get('k'))
+        self.assertEqual(django_cache.get('autre:donnee'), 'conservée')
+        gemini.set('k', 'nouvelle')
+        self.assertEqual(gemini.get('k'), 'nouvelle')
+
+        django_cache.delete(gemini._version_key)  # Version évincée
+        gemini.clear()
+        self.assertIsNone(gemini.get('k'))
+
+    def test_base_cache_abstract(self):
+        """Un backend doit implémenter get, set et clear"""
+        with self.assertRaises(TypeError):
+            BaseResponseCache()
+
+    def test_build_response_cache_disabled(self):
+        """Test la désactivation du cache par configuration"""
+        self.assertIsNone(build_response_cache({'BACKEND': None}))
+        self.assertIsInstance(build_response_cache({'BACKEND': 'memory', 'TTL': 5}), MemoryResponseCache)
+
+    def test_generate_text_uses_cache(self):
+        """Test qu'une génération identique n'appelle le modèle qu'une fois"""
+        model = FakeModel()
+        with mock.patch.multiple(
+            GeminiService, _initialized=True, _model=model, _model_name='gemini-test',
+            _response_cache=MemoryResponseCache(), _response_cache_ready=True,
+        ):
+            first = GeminiService.generate_text('Explique', system_instruction='Tuteur', temperature=0.5)
+            second = GeminiService.generate_text('Explique', system_instruction='Tuteur', temperature=0.5)
+            GeminiService.generate_text('Explique', system_instruction='Tuteur', temperature=0.9)
+            GeminiService.generate_text('Explique', system_instruction='Tuteur', temperature=0.5, use_cache=False)
+
+        self.assertEqual(first, 'Réponse générée')
+        self.assertEqual(second, first)
+        self.assertEqual(model.calls, 3)
+
+    def test_agenerate_text_shares_cache(self):
+        """Test que l'API asynchrone partage le cache de l'API synchrone"""
+        model = FakeModel()
+        with mock.patch.multiple(
+            GeminiService, _initialized=True, _model=model, _model_name='gemini-test',
+            _response_cache=MemoryResponseCache(), _response_cache_ready=True,
+        ):
+            first = async_to_sync(GeminiService.agenerate_text)('Explique', temperature=0.5)
+            second = GeminiService.generate_text('Explique', temperature=0.5)
+
+        self.assertEqual(first, 'Réponse générée')
+        self.assertEqual(second, first)
+        self.assertEqual(model.calls, 1)
+
+    def test_stream_text_yields_chunks_and_caches(self):
+        """Test la génération en flux puis la réutilisation de la réponse complète"""
+        model = FakeModel(text='Une réponse en morceaux')
+        with mock.patch.multiple(
+            GeminiService, _initialized=True, _model=model, _model_name='gemini-test',
+            _response_cache=MemoryResponseCache(), _response_cache_ready=True,
+        ):
+            chunks = list(GeminiService.stream_text('Explique'))
+            cached = list(GeminiService.stream_text('Explique'))
+
+        self.assertEqual(chunks, ['Une ', 'réponse ', 'en ', 'morceaux'])
+        self.assertEqual(cached, ['Une réponse en morceaux'])
+        self.assertEqual(model.calls, 1)
+
+    def test_chat_response_single_request(self):
+        """Test que l'historique et l'instruction système partent en une seule requête"""
+        model = FakeModel()
+        messages = [
+            {'role': 'assistant', 'content': 'Bienvenue !'},
+            {'role': 'user', 'content': 'Une fraction ?'},
+            {'role': 'assistant', 'content': 'Un nombre a/b.'},
+            {'role': 'user', 'content': 'Un exemple ?'},
+        ]
+        with mock.patch.multiple(
+            GeminiService, _initialized=True, _model=model, _model_name='gemini-test',
+            _response_cache=None, _response_cache_ready=True,
+        ), mock.patch.object(GeminiService, '_model_for', return_value=model) as model_for:
+            with mock.patch.object(model, 'generate_content', wraps=model.generate_content) as generate:
+                response = GeminiService.chat_response(messages, system_instruction='Tuteur')
+
+        self.assertEqual(response, 'Réponse générée')
+        model_for.assert_called_once_with('Tuteur')
+        generate.assert_called_once()
+        contents = generate.call_args.args[0]
+        self.assertEqual([c['role'] for c in contents], ['user', 'model', 'user'])
+        self.assertEqual(contents[-1]['parts'], ['Un exemple ?'])
@@ -26,6 +26,7 @@ urlpatterns = [
     path('calendrier/', include('calendar_app.urls')),
     path('fiches/', include('fiches.urls')),
     path('posts/', include('posts.urls')),
+    path('jobs/', include('jobs.urls')),
 ]
 
 if settings.DEBUG:
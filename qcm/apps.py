@@ -5,5 +5,5 @@ class QcmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'qcm'
 
-
-
+    def ready(self):
+        from . import signals
@@ -0,0 +1,297 @@
+"""
+Correction des QCM
+
+Le corrigé d'un QCM est compilé en tableaux numpy (identifiants triés et
+index des bonnes réponses) à partir de deux requêtes, puis conservé dans le
+cache Django : tant que le QCM n'est pas modifié, une soumission est
+corrigée sans accès à la base de données. La clé de cache contient
+QCM.updated_at : quand une question ou un choix change (signaux de
+qcm/signals.py, QCMRepository), invalidate() avance cette date en base.
+Un processus qui a son propre cache (LocMemCache du serveur web pendant
+que le worker run_jobs régénère le QCM) relit le QCM à la requête suivante
+et ne peut donc plus tomber sur un corrigé périmé.
+"""
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import QCM, Question, Choix
+
+
+class AnswerKey:
+    """Corrigé compilé d'un QCM"""
+
+    CACHE_PREFIX = 'qcm:answer_key'
+    CACHE_TIMEOUT = 60 * 60 * 24  # Les QCM changent rarement après génération
+
+    def __init__(self, questions, choix):
+        """
+        Args:
+            questions: Liste de (question_id, texte) dans l'ordre du QCM
+            choix: Liste de (choix_id, question_id, texte, est_correct) par id croissant
+        """
+        self.question_ids = np.array([question_id for question_id, _ in questions], dtype=np.int64)
+        self.question_textes = [texte for _, texte in questions]
+        index_question = {question_id: i for i, question_id in enumerate(self.question_ids.tolist())}
+
+        # Choix triés par id : recherche dichotomique (searchsorted)
+        choix = [c for c in choix if c[1] in index_question]
+        self.choix_ids = np.array([c[0] for c in choix], dtype=np.int64)
+        self.choix_question = np.array([index_question[c[1]] for c in choix], dtype=np.int32)
+        self.choix_textes = [c[2] for c in choix]
+
+        # Index (dans les choix) de la bonne réponse de chaque question, -1 si aucune
+        self.correct = np.full(len(questions), -1, dtype=np.int32)
+        for i in range(len(choix) - 1, -1, -1):
+            if choix[i][3]:
+                self.correct[self.choix_question[i]] = i
+
+    @classmethod
+    def from_qcm(cls, qcm):
+        """Compile le corrigé d'un QCM depuis la base de données"""
+        questions = Question.objects.filter(qcm=qcm).order_by('numero', 'id').values_list('id', 'texte')
+        choix = Choix.objects.filter(question__qcm=qcm).order_by('id').values_list(
+            'id', 'question_id', 'texte', 'est_correct'
+        )
+        return cls(list(questions), list(choix))
+
+    @classmethod
+    def cache_key(cls, qcm_id, version):
+        """Clé du corrigé d'une version (QCM.updated_at) d'un QCM"""
+        return f"{cls.CACHE_PREFIX}:{qcm_id}:{version.timestamp() if version else 0}"
+
+    @classmethod
+    def for_qcm(cls, qcm):
+        """Corrigé d'un QCM, depuis le cache si possible"""
+        key = cls.cache_key(qcm.id, qcm.updated_at)
+        answer_key = cache.get(key)
+        if answer_key is None:
+            answer_key = cls.from_qcm(qcm)
+            # Un QCM sans questions est sans doute en cours de génération
+            if answer_key.total:
+                cache.set(key, answer_key, cls.CACHE_TIMEOUT)
+        return answer_key
+
+    @classmethod
+    def invalidate(cls, qcm_id):
+        """
+        Rend périmé le corrigé en cache d'un QCM, dans tous les processus
+
+        La version (updated_at) avance en base ; l'entrée de l'ancienne
+        version est aussi supprimée du cache local.
+
+        Returns:
+            datetime: La nouvelle version, None si le QCM n'existe plus
+        """
+        ancienne = QCM.objects.filter(id=qcm_id).values_list('updated_at', flat=True).first()
+        if ancienne is None:
+            return None
+        cache.delete(cls.cache_key(qcm_id, ancienne))
+        version = timezone.now()
+        QCM.objects.filter(id=qcm_id).update(updated_at=version)
+        return version
+
+    @property
+    def total(self):
+        return len(self.question_ids)
+
+    @staticmethod
+    def parse_question_id(key):
+        """
+        Identifiant de question d'une clé de réponse
+
+        Deux formats possibles : clé numérique directe ("1") ou avec préfixe
+        ("question_1"). ValueError si la clé est invalide.
+        """
+        if isinstance(key, str) and key.startswith('question_'):
+            return int(key.replace('question_', ''))
+        return int(key)
+
+    @classmethod
+    def parse_reponses(cls, reponses):
+        """Paires (question_id, choix_id) valides d'un jeu de réponses"""
+        paires = []
+        for key, choix_id in reponses.items():
+            try:
+                paires.append((cls.parse_question_id(key), int(choix_id)))
+            except (TypeError, ValueError):
+                continue
+        return paires
+
+    def lookup(self, question_ids, choix_ids):
+        """
+        Situe des réponses dans le corrigé (tableaux de même forme)
+
+        Returns:
+            tuple: (position du choix dans le corrigé, index de la question,
+            masque des réponses valides, masque des bonnes réponses)
+        """
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        choix_ids = np.asarray(choix_ids, dtype=np.int64)
+        if not len(self.choix_ids):
+            invalide = np.zeros(choix_ids.shape, dtype=bool)
+            return np.zeros(choix_ids.shape, dtype=np.int64), np.zeros(choix_ids.shape, dtype=np.int64), invalide, invalide
+
+        positions = np.minimum(np.searchsorted(self.choix_ids, choix_ids), len(self.choix_ids) - 1)
+        questions = self.choix_question[positions]
+        # Le choix doit exister et appartenir à la question indiquée
+        valides = (self.choix_ids[positions] == choix_ids) & (self.question_ids[questions] == question_ids)
+        corrects = valides & (self.correct[questions] == positions)
+        return positions, questions, valides, corrects
+
+    def matrice_reponses(self, jeux_reponses):
+        """
+        Matrice (soumissions x questions) des choix sélectionnés, 0 si aucun
+
+        Seule la première réponse valide à une question est retenue.
+        """
+        colonnes = {question_id: i for i, question_id in enumerate(self.question_ids.tolist())}
+        matrice = np.zeros((len(jeux_reponses), self.total), dtype=np.int64)
+        for ligne, reponses in enumerate(jeux_reponses):
+            for question_id, choix_id in self.parse_reponses(reponses):
+                colonne = colonnes.get(question_id)
+                if colonne is not None and not matrice[ligne, colonne]:
+                    matrice[ligne, colonne] = choix_id
+        return matrice
+
+    def grade_matrix(self, matrice):
+        """
+        Corrige d'un coup une matrice de réponses (voir matrice_reponses)
+
+        Returns:
+            tuple: (scores par soumission, matrice booléenne des bonnes réponses)
+        """
+        questions = np.broadcast_to(self.question_ids, matrice.shape)
+        _, _, _, corrects = self.lookup(questions, matrice)
+        return corrects.sum(axis=1), corrects
+
+    def grade(self, reponses):
+        """
+        Corrige un jeu de réponses
+
+        Args:
+            reponses: dict question -> choix_id (voir parse_question_id)
+
+        Returns:
+            dict: score, total, pourcentage et le détail par question
+            (questions répondues d'abord, puis les questions sans réponse)
+        """
+        paires = self.parse_reponses(reponses)
+        score = 0
+        resultats = []
+        repondues = set()
+
+        if paires:
+            positions, questions, valides, corrects = self.lookup(*zip(*paires))
+            for position, question, valide, correct in zip(
+                positions.tolist(), questions.tolist(), valides.tolist(), corrects.tolist()
+            ):
+                # Ignorer les réponses invalides et les doublons
+                if not valide or question in repondues:
+                    continue
+                repondues.add(question)
+                score += correct
+                resultats.append(self._resultat(question, position, correct))
+
+        for question in range(self.total):
+            if question not in repondues:
+                resultats.append(self._resultat(question, None, False))
+
+        pourcentage = (score / self.total * 100) if self.total > 0 else 0
+
+        return {
+            'score': score,
+            'total': self.total,
+            'pourcentage': pourcentage,
+            'resultats': resultats,
+        }
+
+    def _resultat(self, question, position, est_correct):
+        correct = int(self.correct[question])
+        return {
+            'question_id': int(self.question_ids[question]),
+            'question_texte': self.question_textes[question],
+            'choix_selectionne_id': int(self.choix_ids[position]) if position is not None else None,
+            'choix_selectionne_texte': self.choix_textes[position] if position is not None else None,
+            'choix_correct_id': int(self.choix_ids[correct]) if correct >= 0 else None,
+            'choix_correct_texte': self.choix_textes[correct] if correct >= 0 else '',
+            'est_correct': bool(est_correct),
+        }
+
+
+class BatchGradingService:
+    """Correction groupée des soumissions d'une classe pour un même QCM"""
+
+    @staticmethod
+    def submit(qcm, soumissions):
+        """
+        Corrige et enregistre les soumissions de plusieurs élèves
+
+        Args:
+            qcm: Le QCM
+            soumissions: Liste de {"user_id", "reponses"} (format de submit_qcm)
+
+        Les résultats, l'XP et les agrégats d'analyses sont enregistrés dans
+        une même transaction : une erreur en cours de route n'en laisse
+        aucune trace partielle.
+
+        Returns:
+            list: {"user_id", "score", "total", "pourcentage"} par soumission
+
+        Raises:
+            ValueError: Si un identifiant d'élève est absent ou inconnu
+        """
+        from .models import ResultatQCM
+
+        try:
+            user_ids = {int(s['user_id']) for s in soumissions}
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Identifiant élève manquant ou invalide")
+        inconnus = user_ids - set(
+            get_user_model().objects.filter(id__in=user_ids).values_list('id', flat=True)
+        )
+        if inconnus:
+            raise ValueError(f"Élèves inconnus : {sorted(inconnus)}")
+
+        answer_key = AnswerKey.for_qcm(qcm)
+        total = answer_key.total
+        scores, _ = answer_key.grade_matrix(
+            answer_key.matrice_reponses([s.get('reponses') or {} for s in soumissions])
+        )
+        pourcentages = scores * 100.0 / total if total else np.zeros(len(soumissions))
+
+        resultats = [
+            ResultatQCM(
+                user_id=int(soumission['user_id']),
+                qcm=qcm,
+                score=int(score),
+                total=total,
+                pourcentage=float(pourcentage),
+            )
+            for soumission, score, pourcentage in zip(soumissions, scores, pourcentages)
+        ]
+        with transaction.atomic():
+            ResultatQCM.objects.bulk_create(resultats)
+
+            try:
+                from gamification.services import GamificationService
+                GamificationService.ajouter_xp_qcm_batch([(r.user_id, r.pourcentage) for r in resultats])
+            except ImportError:
+                pass  # Si la gamification n'est pas disponible
+
+            try:
+                from analytics.rollups import RollupService
+                RollupService.enregistrer_resultats(resultats)  # bulk_create : pas de signal post_save
+            except ImportError:
+                pass
+
+        return [
+            {
+                'user_id': r.user_id,
+                'score': r.score,
+                'total': r.total,
+                'pourcentage': round(r.pourcentage, 2),
+            }
+            for r in resultats
+        ]
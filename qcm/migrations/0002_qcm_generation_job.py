@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+        ('qcm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qcm',
+            name='generation_job',
+            field=models.ForeignKey(blank=True, help_text='Tâche de génération des questions', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='jobs.job'),
+        ),
+    ]
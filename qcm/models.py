@@ -11,6 +11,10 @@ class QCM(models.Model):
     titre = models.CharField(max_length=200)
     chapitre = models.ForeignKey(Chapitre, on_delete=models.SET_NULL, null=True, blank=True)
     texte_source = models.TextField(help_text="Texte à partir duquel générer les questions")
+    generation_job = models.ForeignKey(
+        'jobs.Job', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Tâche de génération des questions"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -0,0 +1,53 @@
+"""
+Persistance des QCM générés
+
+Point d'entrée commun au générateur (tâche qcm.generer_questions, vue
+asynchrone) et aux outils d'import : un QCM complet s'écrit en un nombre
+constant de requêtes, quel que soit le nombre de questions.
+"""
+from django.db import transaction
+from .grading import AnswerKey
+from .models import Question, Choix
+
+
+class QCMRepository:
+    """Accès en écriture aux questions et choix d'un QCM"""
+
+    @staticmethod
+    def save_generated(qcm, questions_data):
+        """
+        Enregistre les questions générées pour un QCM
+
+        Les questions existantes sont remplacées : une tâche de génération
+        relancée après un échec ne crée pas de doublons.
+
+        Args:
+            qcm: Le QCM
+            questions_data: Liste de {"texte", "numero", "choix": [{"texte", "correct"}]}
+
+        Returns:
+            list: Les questions créées
+        """
+        with transaction.atomic():
+            qcm.questions.all().delete()
+
+            questions = Question.objects.bulk_create([
+                Question(qcm=qcm, texte=q_data['texte'], numero=q_data.get('numero', index))
+                for index, q_data in enumerate(questions_data, start=1)
+            ])
+
+            # Les backends sans RETURNING (MySQL) ne renseignent pas les clés
+            if questions and questions[0].pk is None:
+                ids = qcm.questions.order_by('id').values_list('id', flat=True)
+                for question, question_id in zip(questions, ids):
+                    question.pk = question_id
+
+            Choix.objects.bulk_create([
+                Choix(question=question, texte=choix_data['texte'], est_correct=bool(choix_data['correct']))
+                for question, q_data in zip(questions, questions_data)
+                for choix_data in q_data['choix']
+            ])
+
+        # bulk_create n'émet pas de signaux : invalider le corrigé explicitement
+        qcm.updated_at = AnswerKey.invalidate(qcm.id) or qcm.updated_at
+        return questions
@@ -22,8 +22,23 @@ class QCMGenerator:
         # Fallback vers l'ancien système
         return self._generate_fallback(texte, nombre_questions)
     
-    def _generate_with_gemini(self, texte, nombre_questions=5):
-        """Génère des questions avec Gemini AI"""
+    async def agenerate_questions(self, texte, nombre_questions=5):
+        """Version asynchrone de generate_questions"""
+        if GeminiService.is_available():
+            prompt, system_instruction = self._build_gemini_prompt(texte, nombre_questions)
+            response = await GeminiService.agenerate_structured_response(
+                prompt=prompt,
+                system_instruction=system_instruction,
+                format_type="json"
+            )
+            questions = self._parse_gemini_response(response, nombre_questions)
+            if questions:
+                return questions
+        
+        return self._generate_fallback(texte, nombre_questions)
+    
+    def _build_gemini_prompt(self, texte, nombre_questions=5):
+        """Construit le prompt et l'instruction système pour Gemini"""
         system_instruction = """Tu es un générateur de questions pédagogiques pour des élèves togolais.
         
 Génère des questions de qualité adaptées au niveau scolaire, avec :
@@ -48,12 +63,22 @@ Génère les questions en format JSON. Chaque question doit avoir :
 
 Réponds UNIQUEMENT en JSON valide, sans texte supplémentaire."""
         
+        return prompt, system_instruction
+    
+    def _generate_with_gemini(self, texte, nombre_questions=5):
+        """Génère des questions avec Gemini AI"""
+        prompt, system_instruction = self._build_gemini_prompt(texte, nombre_questions)
+        
         response = GeminiService.generate_structured_response(
             prompt=prompt,
             system_instruction=system_instruction,
             format_type="json"
         )
         
+        return self._parse_gemini_response(response, nombre_questions)
+    
+    def _parse_gemini_response(self, response, nombre_questions=5):
+        """Valide et formate les questions renvoyées par Gemini"""
         if not response:
             return None
         
@@ -238,4 +263,3 @@ Réponds UNIQUEMENT en JSON valide, sans texte supplémentaire."""
             'choix': choix
         }
 
-
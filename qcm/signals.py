@@ -0,0 +1,22 @@
+"""
+Invalidation du corrigé en cache d'un QCM (voir qcm/grading.py)
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .grading import AnswerKey
+from .models import Question, Choix
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalider_corrige_question(sender, instance, **kwargs):
+    AnswerKey.invalidate(instance.qcm_id)
+
+
+@receiver([post_save, post_delete], sender=Choix)
+def invalider_corrige_choix(sender, instance, **kwargs):
+    if Choix.question.is_cached(instance):
+        qcm_id = instance.question.qcm_id
+    else:
+        qcm_id = Question.objects.filter(id=instance.question_id).values_list('qcm_id', flat=True).first()
+    if qcm_id is not None:
+        AnswerKey.invalidate(qcm_id)
@@ -0,0 +1,25 @@
+"""
+Tâches en arrière-plan de l'application QCM
+"""
+from jobs.registry import register
+from .models import QCM
+from .repository import QCMRepository
+from .services import QCMGenerator
+
+
+@register('qcm.generer_questions')
+def generer_questions(job):
+    """Génère et enregistre les questions d'un QCM"""
+    qcm = QCM.objects.get(id=job.parametres['qcm_id'])
+    job.maj_progression(10)
+    
+    generator = QCMGenerator()
+    questions_data = generator.generate_questions(
+        qcm.texte_source,
+        nombre_questions=job.parametres.get('nombre_questions', 5)
+    )
+    job.maj_progression(80)
+    
+    QCMRepository.save_generated(qcm, questions_data)
+    
+    return {'qcm_id': qcm.id, 'questions': len(questions_data)}
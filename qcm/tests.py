@@ -2,12 +2,18 @@
 Tests unitaires pour l'application QCM
 Tests backend et base de données
 """
+from unittest import mock
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from accounts.models import Matiere, Chapitre
 from .models import QCM, Question, Choix, ResultatQCM
 from .services import QCMGenerator
+from .repository import QCMRepository
+from .grading import AnswerKey, BatchGradingService
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import json
 
 User = get_user_model()
@@ -100,6 +106,253 @@ class QCMModelTest(TestCase):
         self.assertEqual(resultat.pourcentage, 80.0)
 
 
+class QCMRepositoryTest(TestCase):
+    """Tests pour l'enregistrement en masse des questions"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.qcm = QCM.objects.create(user=self.user, titre='QCM Test', texte_source='Texte')
+    
+    def _questions(self, n):
+        return [
+            {
+                'numero': i,
+                'texte': f'Question {i} ?',
+                'choix': [
+                    {'texte': f'Réponse {i}.{j}', 'correct': j == 0} for j in range(4)
+                ]
+            }
+            for i in range(1, n + 1)
+        ]
+    
+    def test_save_generated(self):
+        """Test la création des questions et de leurs choix"""
+        QCMRepository.save_generated(self.qcm, self._questions(3))
+        self.assertEqual(self.qcm.questions.count(), 3)
+        for question in self.qcm.questions.all():
+            self.assertEqual(question.choix.count(), 4)
+            self.assertEqual(question.choix.filter(est_correct=True).count(), 1)
+    
+    def test_save_generated_remplace(self):
+        """Test qu'un nouvel enregistrement remplace les questions existantes"""
+        QCMRepository.save_generated(self.qcm, self._questions(3))
+        QCMRepository.save_generated(self.qcm, self._questions(2))
+        self.assertEqual(self.qcm.questions.count(), 2)
+        self.assertEqual(Choix.objects.filter(question__qcm=self.qcm).count(), 8)
+    
+    def test_save_generated_nombre_constant_de_requetes(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre de questions"""
+        autre = QCM.objects.create(user=self.user, titre='Autre', texte_source='Texte')
+        with CaptureQueriesContext(connection) as petit:
+            QCMRepository.save_generated(self.qcm, self._questions(2))
+        with CaptureQueriesContext(connection) as grand:
+            QCMRepository.save_generated(autre, self._questions(20))
+        self.assertEqual(len(petit), len(grand))
+
+
+class AnswerKeyTest(TestCase):
+    """Tests pour la correction en mémoire"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.qcm = QCM.objects.create(user=self.user, titre='QCM Test', texte_source='Texte')
+        QCMRepository.save_generated(self.qcm, [
+            {
+                'numero': i,
+                'texte': f'Question {i} ?',
+                'choix': [{'texte': f'Réponse {i}.{j}', 'correct': j == 1} for j in range(3)]
+            }
+            for i in range(1, 4)
+        ])
+        self.questions = list(self.qcm.questions.all())
+    
+    def _choix(self, question, correct):
+        return question.choix.get(est_correct=correct) if correct else question.choix.filter(est_correct=False).first()
+    
+    def test_grade(self):
+        """Test le score et le détail des questions"""
+        q1, q2, q3 = self.questions
+        bon = self._choix(q1, True)
+        mauvais = self._choix(q2, False)
+        correction = AnswerKey.from_qcm(self.qcm).grade({
+            str(q1.id): bon.id,
+            f'question_{q2.id}': str(mauvais.id),
+        })
+        
+        self.assertEqual(correction['score'], 1)
+        self.assertEqual(correction['total'], 3)
+        resultats = correction['resultats']
+        self.assertEqual([r['question_id'] for r in resultats], [q1.id, q2.id, q3.id])
+        self.assertTrue(resultats[0]['est_correct'])
+        self.assertEqual(resultats[1]['choix_selectionne_texte'], mauvais.texte)
+        self.assertEqual(resultats[1]['choix_correct_id'], self._choix(q2, True).id)
+        self.assertIsNone(resultats[2]['choix_selectionne_id'])
+        self.assertFalse(resultats[2]['est_correct'])
+    
+    def test_grade_reponses_invalides(self):
+        """Test que les réponses invalides sont ignorées"""
+        q1, q2, _ = self.questions
+        correction = AnswerKey.from_qcm(self.qcm).grade({
+            'abc': 1,
+            str(q1.id): self._choix(q2, True).id,  # choix d'une autre question
+            '999999': 1,
+        })
+        self.assertEqual(correction['score'], 0)
+        self.assertEqual(len(correction['resultats']), 3)
+    
+    def test_from_qcm_deux_requetes(self):
+        """Test que le corrigé se charge en deux requêtes"""
+        with self.assertNumQueries(2):
+            key = AnswerKey.from_qcm(self.qcm)
+        reponses = {str(q.id): self._choix(q, True).id for q in self.questions}
+        with self.assertNumQueries(0):
+            correction = key.grade(reponses)
+        self.assertEqual(correction['score'], 3)
+    
+    def test_for_qcm_cache(self):
+        """Test que le corrigé en cache évite tout accès à la base"""
+        cache.clear()
+        AnswerKey.for_qcm(self.qcm)
+        with self.assertNumQueries(0):
+            key = AnswerKey.for_qcm(self.qcm)
+        self.assertEqual(key.total, 3)
+    
+    def test_invalidation_signaux(self):
+        """Test l'invalidation du corrigé quand un choix ou une question change"""
+        cache.clear()
+        q1 = self.questions[0]
+        ancien = self._choix(q1, True)
+        nouveau = self._choix(q1, False)
+        AnswerKey.for_qcm(self.qcm)
+        
+        ancien.est_correct = False
+        ancien.save()
+        nouveau.est_correct = True
+        nouveau.save()
+        self.qcm.refresh_from_db()  # Chaque requête relit le QCM (et sa version)
+        correction = AnswerKey.for_qcm(self.qcm).grade({str(q1.id): nouveau.id})
+        self.assertEqual(correction['score'], 1)
+        
+        self.questions[2].delete()
+        self.qcm.refresh_from_db()
+        self.assertEqual(AnswerKey.for_qcm(self.qcm).total, 2)
+    
+    def test_invalidation_autre_processus(self):
+        """Test qu'un cache non invalidé (autre processus) ne sert pas un corrigé périmé"""
+        cache.clear()
+        AnswerKey.for_qcm(self.qcm)
+        # Le worker régénère le QCM : sa suppression n'atteint pas le cache du serveur web
+        with mock.patch('qcm.grading.cache.delete'):
+            QCMRepository.save_generated(QCM.objects.get(id=self.qcm.id), [
+                {'numero': 1, 'texte': 'Seule question ?', 'choix': [{'texte': 'Oui', 'correct': True}]}
+            ])
+        qcm = QCM.objects.get(id=self.qcm.id)
+        self.assertNotEqual(qcm.updated_at, self.qcm.updated_at)
+        self.assertEqual(AnswerKey.for_qcm(qcm).total, 1)
+    
+    def test_save_generated_invalide(self):
+        """Test que l'enregistrement en masse invalide le corrigé"""
+        cache.clear()
+        AnswerKey.for_qcm(self.qcm)
+        QCMRepository.save_generated(self.qcm, [
+            {'numero': 1, 'texte': 'Seule question ?', 'choix': [{'texte': 'Oui', 'correct': True}]}
+        ])
+        self.assertEqual(AnswerKey.for_qcm(self.qcm).total, 1)
+
+
+class BatchGradingTest(TestCase):
+    """Tests pour la correction groupée d'une classe"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.prof = User.objects.create_user(username='prof', password='testpass123', is_staff=True)
+        self.eleves = [
+            User.objects.create_user(username=f'eleve{i}', password='testpass123') for i in range(3)
+        ]
+        self.qcm = QCM.objects.create(user=self.prof, titre='QCM Classe', texte_source='Texte')
+        QCMRepository.save_generated(self.qcm, [
+            {
+                'numero': i,
+                'texte': f'Question {i} ?',
+                'choix': [{'texte': f'Réponse {i}.{j}', 'correct': j == 0} for j in range(3)]
+            }
+            for i in range(1, 3)
+        ])
+        self.questions = list(self.qcm.questions.all())
+        self.bons = [q.choix.get(est_correct=True).id for q in self.questions]
+        self.mauvais = [q.choix.filter(est_correct=False).first().id for q in self.questions]
+    
+    def _soumissions(self):
+        q1, q2 = self.questions
+        return [
+            {'user_id': self.eleves[0].id, 'reponses': {str(q1.id): self.bons[0], str(q2.id): self.bons[1]}},
+            {'user_id': self.eleves[1].id, 'reponses': {f'question_{q1.id}': self.bons[0], str(q2.id): self.mauvais[1]}},
+            {'user_id': self.eleves[2].id, 'reponses': {str(q2.id): self.bons[0]}},  # choix d'une autre question
+        ]
+    
+    def test_grade_matrix(self):
+        """Test la correction vectorisée"""
+        key = AnswerKey.for_qcm(self.qcm)
+        matrice = key.matrice_reponses([s['reponses'] for s in self._soumissions()])
+        scores, corrects = key.grade_matrix(matrice)
+        self.assertEqual(scores.tolist(), [2, 1, 0])
+        self.assertEqual(corrects.shape, (3, 2))
+    
+    def test_submit_batch(self):
+        """Test l'enregistrement des résultats et de la gamification"""
+        from gamification.models import UserProgress
+        resultats = BatchGradingService.submit(self.qcm, self._soumissions())
+        
+        self.assertEqual([r['pourcentage'] for r in resultats], [100.0, 50.0, 0.0])
+        self.assertEqual(ResultatQCM.objects.filter(qcm=self.qcm).count(), 3)
+        progress = UserProgress.objects.get(user=self.eleves[0])
+        self.assertEqual(progress.qcm_completes, 1)
+        self.assertEqual(progress.jours_streak, 1)
+        self.assertEqual(progress.points_xp, 50)
+        self.assertEqual(UserProgress.objects.get(user=self.eleves[2]).points_xp, 10)
+    
+    def test_submit_batch_view(self):
+        """Test l'endpoint de soumission groupée"""
+        self.client.login(username='prof', password='testpass123')
+        url = reverse('qcm:submit_batch', args=[self.qcm.id])
+        response = self.client.post(url, json.dumps({'soumissions': self._soumissions()}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['score'] for r in response.json()['resultats']], [2, 1, 0])
+    
+    def test_submit_batch_eleve_inconnu(self):
+        """Test qu'un élève inconnu est refusé (400) sans rien enregistrer"""
+        self.client.login(username='prof', password='testpass123')
+        url = reverse('qcm:submit_batch', args=[self.qcm.id])
+        soumissions = self._soumissions() + [{'user_id': 999999, 'reponses': {}}]
+        response = self.client.post(url, json.dumps({'soumissions': soumissions}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', response.json()['error'])
+        response = self.client.post(url, json.dumps({'soumissions': [{'reponses': {}}]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ResultatQCM.objects.filter(qcm=self.qcm).exists())
+    
+    def test_submit_batch_atomique(self):
+        """Test qu'une erreur après l'insertion annule toute la soumission"""
+        from gamification.models import UserProgress
+        with mock.patch('analytics.rollups.RollupService.enregistrer_resultats',
+                        side_effect=RuntimeError('panne')):
+            with self.assertRaises(RuntimeError):
+                BatchGradingService.submit(self.qcm, self._soumissions())
+        self.assertFalse(ResultatQCM.objects.filter(qcm=self.qcm).exists())
+        self.assertFalse(UserProgress.objects.filter(user__in=self.eleves, points_xp__gt=0).exists())
+    
+    def test_submit_batch_view_reserve_au_personnel(self):
+        """Test qu'un élève ne peut pas soumettre pour sa classe"""
+        self.client.login(username='eleve0', password='testpass123')
+        url = reverse('qcm:submit_batch', args=[self.qcm.id])
+        response = self.client.post(url, json.dumps({'soumissions': self._soumissions()}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
 class QCMGeneratorServiceTest(TestCase):
     """Tests pour le service QCMGenerator"""
     
@@ -192,6 +445,54 @@ class QCMViewsTest(TestCase):
         # Vérifier que le QCM est créé
         self.assertTrue(QCM.objects.filter(titre='QCM Test').exists())
     
+    def test_generate_qcm_post_enqueue(self):
+        """Test que la génération des questions est mise en file"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('qcm:generate')
+        response = self.client.post(url, {
+            'titre': 'QCM File',
+            'texte_source': 'Les mathématiques sont importantes. Une équation est une égalité.',
+        })
+        qcm = QCM.objects.get(titre='QCM File')
+        self.assertRedirects(response, reverse('qcm:detail', args=[qcm.id]))
+        self.assertEqual(qcm.generation_job.type_job, 'qcm.generer_questions')
+        self.assertEqual(qcm.generation_job.statut, 'en_attente')
+        self.assertEqual(qcm.questions.count(), 0)
+        
+        response = self.client.get(reverse('qcm:detail', args=[qcm.id]))
+        self.assertContains(response, reverse('jobs:status', args=[qcm.generation_job.id]))
+    
+    def test_generer_questions_job(self):
+        """Test l'exécution de la tâche de génération des questions"""
+        from jobs.services import JobService
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(reverse('qcm:generate'), {
+            'titre': 'QCM Job',
+            'texte_source': 'Les mathématiques sont importantes pour tous les élèves. Une équation est une égalité avec une inconnue.',
+        })
+        qcm = QCM.objects.get(titre='QCM Job')
+        
+        JobService.executer(JobService.reclamer('test')[0])
+        
+        qcm.generation_job.refresh_from_db()
+        self.assertEqual(qcm.generation_job.statut, 'termine')
+        self.assertGreater(qcm.questions.count(), 0)
+        self.assertEqual(qcm.generation_job.resultat['questions'], qcm.questions.count())
+    
+    def test_generate_qcm_async_post(self):
+        """Test la génération d'un QCM via la vue asynchrone"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('qcm:generate_async')
+        data = {
+            'titre': 'QCM Async',
+            'texte_source': 'Les mathématiques sont importantes pour tous les élèves. Une équation est une égalité avec une inconnue.',
+            'chapitre_id': self.chapitre.id
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        qcm = QCM.objects.get(titre='QCM Async')
+        self.assertGreater(qcm.questions.count(), 0)
+    
     def test_submit_qcm(self):
         """Test la soumission d'un QCM"""
         self.client.login(username='testuser', password='testpass123')
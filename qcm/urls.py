@@ -6,8 +6,10 @@ app_name = 'qcm'
 urlpatterns = [
     path('', views.qcm_index, name='index'),
     path('generate/', views.generate_qcm, name='generate'),
+    path('generate/async/', views.generate_qcm_async, name='generate_async'),
     path('<int:qcm_id>/', views.qcm_detail, name='detail'),
     path('<int:qcm_id>/submit/', views.submit_qcm, name='submit'),
+    path('<int:qcm_id>/submit/batch/', views.submit_qcm_batch, name='submit_batch'),
 ]
 
 
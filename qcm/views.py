@@ -1,13 +1,17 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
-from .models import QCM, Question, Choix, ResultatQCM
+from .models import QCM, ResultatQCM
 from .services import QCMGenerator
+from .repository import QCMRepository
+from .grading import AnswerKey, BatchGradingService
 from accounts.models import Chapitre
-
+from jobs.services import JobService
+from learnia.decorators import async_login_required, async_require_http_methods
 
 @login_required
 def qcm_index(request):
@@ -33,7 +37,7 @@ def generate_qcm(request):
         
         chapitre = Chapitre.objects.get(id=chapitre_id) if chapitre_id else None
         
-        # Créer le QCM
+        # Créer le QCM ; les questions sont générées en arrière-plan
         qcm = QCM.objects.create(
             user=request.user,
             titre=titre,
@@ -41,24 +45,12 @@ def generate_qcm(request):
             texte_source=texte
         )
         
-        # Générer les questions
-        generator = QCMGenerator()
-        questions_data = generator.generate_questions(texte, nombre_questions=5)
-        
-        # Créer les questions et choix
-        for q_data in questions_data:
-            question = Question.objects.create(
-                qcm=qcm,
-                texte=q_data['texte'],
-                numero=q_data['numero']
-            )
-            
-            for choix_data in q_data['choix']:
-                Choix.objects.create(
-                    question=question,
-                    texte=choix_data['texte'],
-                    est_correct=choix_data['correct']
-                )
+        job = JobService.enqueue(
+            'qcm.generer_questions',
+            {'qcm_id': qcm.id, 'nombre_questions': 5},
+            user=request.user
+        )
+        QCM.objects.filter(id=qcm.id).update(generation_job=job)
         
         return redirect('qcm:detail', qcm_id=qcm.id)
     
@@ -66,14 +58,48 @@ def generate_qcm(request):
     return render(request, 'qcm/generate.html', {'chapitres': chapitres})
 
 
+@async_login_required
+@async_require_http_methods(["POST"])
+async def generate_qcm_async(request):
+    """
+    Génère un QCM à partir d'un texte (vue asynchrone, servie sous ASGI)
+    
+    Reçoit le même formulaire que generate_qcm ; la génération Gemini est
+    attendue sans bloquer de thread.
+    """
+    texte = request.POST.get('texte_source', '')
+    titre = request.POST.get('titre', 'Nouveau QCM')
+    chapitre_id = request.POST.get('chapitre_id')
+    
+    if not texte:
+        return redirect('qcm:index')
+    
+    chapitre = await Chapitre.objects.aget(id=chapitre_id) if chapitre_id else None
+    
+    qcm = await QCM.objects.acreate(
+        user=request.user,
+        titre=titre,
+        chapitre=chapitre,
+        texte_source=texte
+    )
+    
+    generator = QCMGenerator()
+    questions_data = await generator.agenerate_questions(texte, nombre_questions=5)
+    
+    await sync_to_async(QCMRepository.save_generated)(qcm, questions_data)
+    
+    return redirect('qcm:detail', qcm_id=qcm.id)
+
+
 @login_required
 def qcm_detail(request, qcm_id):
     """Détails d'un QCM"""
-    qcm = get_object_or_404(QCM, id=qcm_id, user=request.user)
+    qcm = get_object_or_404(QCM.objects.select_related('generation_job'), id=qcm_id, user=request.user)
     questions = qcm.questions.all()
     return render(request, 'qcm/detail.html', {
         'qcm': qcm,
         'questions': questions,
+        'job': qcm.generation_job,
     })
 
 
@@ -94,58 +120,11 @@ def submit_qcm(request, qcm_id):
     if not reponses:
         return JsonResponse({'error': 'Aucune réponse fournie'}, status=400)
     
-    score = 0
-    total = qcm.questions.count()
-    resultats_questions = []  # Pour stocker les détails de chaque question
-    
-    # Vérifier les réponses
-    for key, choix_id in reponses.items():
-        try:
-            # Gérer deux formats possibles :
-            # 1. Clé numérique directe : "1" -> 1
-            # 2. Clé avec préfixe : "question_1" -> 1
-            if isinstance(key, str) and key.startswith('question_'):
-                question_id = int(key.replace('question_', ''))
-            else:
-                question_id = int(key)
-            
-            question = Question.objects.get(id=question_id, qcm=qcm)
-            choix_selectionne = Choix.objects.get(id=int(choix_id), question=question)
-            choix_correct = question.choix.filter(est_correct=True).first()
-            
-            est_correct = choix_selectionne.est_correct
-            if est_correct:
-                score += 1
-            
-            resultats_questions.append({
-                'question_id': question_id,
-                'question_texte': question.texte,
-                'choix_selectionne_id': choix_selectionne.id,
-                'choix_selectionne_texte': choix_selectionne.texte,
-                'choix_correct_id': choix_correct.id if choix_correct else None,
-                'choix_correct_texte': choix_correct.texte if choix_correct else '',
-                'est_correct': est_correct
-            })
-        except (ValueError, Question.DoesNotExist, Choix.DoesNotExist) as e:
-            # Ignorer les réponses invalides
-            continue
-    
-    # Ajouter les questions sans réponse
-    questions_avec_reponse = {r['question_id'] for r in resultats_questions}
-    for question in qcm.questions.all():
-        if question.id not in questions_avec_reponse:
-            choix_correct = question.choix.filter(est_correct=True).first()
-            resultats_questions.append({
-                'question_id': question.id,
-                'question_texte': question.texte,
-                'choix_selectionne_id': None,
-                'choix_selectionne_texte': None,
-                'choix_correct_id': choix_correct.id if choix_correct else None,
-                'choix_correct_texte': choix_correct.texte if choix_correct else '',
-                'est_correct': False
-            })
-    
-    pourcentage = (score / total * 100) if total > 0 else 0
+    # Correction en mémoire à partir du corrigé du QCM (mis en cache)
+    correction = AnswerKey.for_qcm(qcm).grade(reponses)
+    score = correction['score']
+    total = correction['total']
+    pourcentage = correction['pourcentage']
     
     # Sauvegarder le résultat
     ResultatQCM.objects.create(
@@ -168,6 +147,44 @@ def submit_qcm(request, qcm_id):
         'total': total,
         'pourcentage': round(pourcentage, 2),
         'message': f"Score : {score}/{total} ({round(pourcentage, 2)}%)",
-        'resultats': resultats_questions
+        'resultats': correction['resultats']
     })
 
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def submit_qcm_batch(request, qcm_id):
+    """
+    Soumet en une fois les réponses de toute une classe (réservé au personnel)
+    
+    Corps JSON : {"soumissions": [{"user_id": 1, "reponses": {...}}, ...]}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Accès réservé aux enseignants'}, status=403)
+    
+    qcm = get_object_or_404(QCM, id=qcm_id)
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Données JSON invalides'}, status=400)
+    
+    soumissions = data.get('soumissions') or []
+    if not isinstance(soumissions, list) or not soumissions:
+        return JsonResponse({'error': 'Aucune soumission fournie'}, status=400)
+    
+    try:
+        resultats = BatchGradingService.submit(qcm, [
+            {'user_id': s.get('user_id'), 'reponses': s.get('reponses') or {}}
+            if isinstance(s, dict) else {}
+            for s in soumissions
+        ])
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'qcm_id': qcm.id,
+        'total': resultats[0]['total'],
+        'resultats': resultats
+    })
@@ -20,6 +20,7 @@ if __name__ == "__main__":
     
     # Liste des applications à tester
     apps_to_test = [
+        'learnia',
         'accounts',
         'qcm',
         'flashcards',
@@ -29,6 +30,8 @@ if __name__ == "__main__":
         'calendar_app',
         'fiches',
         'export',
+        'jobs',
+        'analytics',
     ]
     
     # Tests spécifiques
@@ -0,0 +1,59 @@
+/**
+ * Envoi d'un message au tuteur avec lecture de la réponse en flux
+ * (server-sent events renvoyés par tutor:send_message_stream).
+ *
+ * handlers : { conversation(data), chunk(data), done(data) }
+ */
+async function streamTutorMessage(url, payload, csrfToken, handlers) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'X-CSRFToken': csrfToken
+        },
+        body: JSON.stringify(payload)
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error('Réponse invalide du serveur (' + response.status + ')');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function dispatch(rawEvent) {
+        let event = 'message';
+        let data = '';
+        rawEvent.split('\n').forEach(function(line) {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        });
+        const handler = handlers[event];
+        if (handler) {
+            handler(data ? JSON.parse(data) : {});
+        }
+    }
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            dispatch(buffer.slice(0, separator));
+            buffer = buffer.slice(separator + 2);
+        }
+    }
+
+    if (buffer.trim()) {
+        dispatch(buffer);
+    }
+}
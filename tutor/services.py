@@ -2,7 +2,76 @@
 Service IA pour le tuteur intelligent
 Utilise Gemini AI avec fallback vers réponses pré-générées
 """
+import re
+from asgiref.sync import sync_to_async
 from learnia.gemini_service import GeminiService
+from .models import Message
+
+
+class ConversationContextBuilder:
+    """
+    Construit le contexte multi-tours d'une conversation avec le tuteur
+    
+    Les derniers messages sont chargés en une seule requête ; les plus récents
+    sont gardés dans la limite d'un budget de tokens et les plus anciens sont
+    condensés en un court résumé destiné à l'instruction système.
+    """
+    
+    CHARS_PAR_TOKEN = 4  # Estimation grossière pour le français
+    
+    def __init__(self, max_messages=20, token_budget=2000, resume_max_chars=600):
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.resume_max_chars = resume_max_chars
+    
+    @classmethod
+    def estimer_tokens(cls, texte):
+        """Estime le nombre de tokens d'un texte"""
+        return len(texte) // cls.CHARS_PAR_TOKEN + 1
+    
+    def build(self, conversation):
+        """
+        Construit l'historique à envoyer au modèle
+        
+        Returns:
+            tuple: (messages [{"role", "content"}] du plus ancien au plus récent,
+            résumé des tours écartés ou chaîne vide)
+        """
+        lignes = list(
+            Message.objects.filter(conversation=conversation)
+            .order_by('-created_at', '-id')
+            .values_list('role', 'contenu')[:self.max_messages]
+        )
+        
+        # Garder les tours les plus récents dans le budget (le dernier toujours)
+        budget = self.token_budget
+        gardes = 0
+        for role, contenu in lignes:
+            cout = self.estimer_tokens(contenu)
+            if gardes and cout > budget:
+                break
+            budget -= cout
+            gardes += 1
+        
+        recents = reversed(lignes[:gardes])
+        anciens = list(reversed(lignes[gardes:]))
+        messages = [{'role': role, 'content': contenu} for role, contenu in recents]
+        return messages, self.resumer(anciens)
+    
+    def resumer(self, lignes):
+        """Résumé extractif des tours écartés (aucun appel supplémentaire au modèle)"""
+        resume = []
+        taille = 0
+        # Partir des plus récents pour privilégier le contexte proche
+        for role, contenu in reversed(lignes):
+            premiere_phrase = re.split(r'(?<=[.!?])\s', contenu.strip(), maxsplit=1)[0][:150]
+            auteur = "Élève" if role == 'user' else "Tuteur"
+            ligne = f"- {auteur} : {premiere_phrase}"
+            if taille + len(ligne) > self.resume_max_chars:
+                break
+            resume.append(ligne)
+            taille += len(ligne)
+        return '\n'.join(reversed(resume))
 
 
 class TuteurService:
@@ -17,21 +86,7 @@ class TuteurService:
         'science': "Les sciences, c'est passionnant ! Que veux-tu apprendre aujourd'hui ?",
     }
     
-    def get_response(self, question, chapitre=None, user=None):
-        """Génère une réponse adaptée à la question avec Gemini AI"""
-        # Essayer d'abord avec Gemini
-        if GeminiService.is_available():
-            response = self._get_gemini_response(question, chapitre, user)
-            if response:
-                return response
-        
-        # Fallback vers l'ancien système si Gemini n'est pas disponible
-        return self._get_fallback_response(question, chapitre, user)
-    
-    def _get_gemini_response(self, question, chapitre=None, user=None):
-        """Génère une réponse avec Gemini AI"""
-        # Construire le prompt système
-        system_instruction = """Tu es un tuteur intelligent et bienveillant pour des élèves togolais du primaire à la terminale.
+    SYSTEM_INSTRUCTION = """Tu es un tuteur intelligent et bienveillant pour des élèves togolais du primaire à la terminale.
         
 Ton rôle est de :
 - Expliquer les concepts de manière simple et adaptée au niveau de l'élève
@@ -41,28 +96,98 @@ Ton rôle est de :
 - Utiliser un langage clair et accessible
 
 Réponds toujours en français, de manière amicale et encourageante."""
+    
+    def __init__(self, context_builder=None):
+        self.context_builder = context_builder or ConversationContextBuilder()
+    
+    def get_response(self, question, chapitre=None, user=None, conversation=None):
+        """
+        Génère une réponse adaptée à la question avec Gemini AI
+        
+        Si la conversation est fournie, ses derniers échanges (question
+        comprise, déjà enregistrée) servent de contexte.
+        """
+        # Essayer d'abord avec Gemini
+        if GeminiService.is_available():
+            messages, system_instruction = self._build_chat_request(question, chapitre, user, conversation)
+            response = GeminiService.chat_response(messages, system_instruction, temperature=0.7)
+            if response:
+                return response
+        
+        # Fallback vers l'ancien système si Gemini n'est pas disponible
+        return self._get_fallback_response(question, chapitre, user)
+    
+    async def aget_response(self, question, chapitre=None, user=None, conversation=None):
+        """
+        Version asynchrone de get_response
         
-        # Construire le prompt utilisateur
-        prompt = f"Question de l'élève : {question}\n\n"
+        Le chapitre doit être chargé avec sa matière (select_related).
+        """
+        if GeminiService.is_available():
+            messages, system_instruction = await sync_to_async(self._build_chat_request)(
+                question, chapitre, user, conversation
+            )
+            response = await GeminiService.achat_response(messages, system_instruction, temperature=0.7)
+            if response:
+                return response
+        
+        return self._get_fallback_response(question, chapitre, user)
+    
+    def stream_response(self, question, chapitre=None, user=None, conversation=None):
+        """
+        Génère la réponse morceau par morceau (pour un affichage progressif)
+        
+        Yields:
+            str: Les morceaux de la réponse ; la réponse de fallback d'un bloc
+            si Gemini n'a rien produit
+        """
+        if GeminiService.is_available():
+            messages, system_instruction = self._build_chat_request(question, chapitre, user, conversation)
+            streamed = False
+            for chunk in GeminiService.stream_chat(messages, system_instruction, temperature=0.7):
+                streamed = True
+                yield chunk
+            if streamed:
+                return
+        
+        yield self._get_fallback_response(question, chapitre, user)
+    
+    def _build_chat_request(self, question, chapitre=None, user=None, conversation=None):
+        """
+        Construit l'historique et l'instruction système envoyés à Gemini
+        
+        Returns:
+            tuple: (messages, instruction système)
+        """
+        resume = ''
+        if conversation is not None:
+            messages, resume = self.context_builder.build(conversation)
+        else:
+            messages = []
+        
+        if not messages or messages[-1]['role'] != 'user':
+            messages.append({'role': 'user', 'content': question})
+        
+        return messages, self._build_system_instruction(chapitre, user, resume)
+    
+    def _build_system_instruction(self, chapitre=None, user=None, resume=''):
+        """Complète l'instruction système avec le contexte de l'élève"""
+        system_instruction = self.SYSTEM_INSTRUCTION
         
         if chapitre:
-            prompt += f"Contexte : L'élève étudie le chapitre '{chapitre.titre}' de la matière '{chapitre.matiere.nom if chapitre.matiere else 'non spécifiée'}'.\n\n"
+            system_instruction += f"\n\nContexte : L'élève étudie le chapitre '{chapitre.titre}' de la matière '{chapitre.matiere.nom if chapitre.matiere else 'non spécifiée'}'."
         
         if user:
             niveau = getattr(user, 'niveau_etude', None)
             if niveau:
-                prompt += f"Niveau de l'élève : {niveau}\n\n"
+                system_instruction += f"\n\nNiveau de l'élève : {niveau}"
         
-        prompt += "Réponds à la question de manière pédagogique, claire et adaptée au niveau de l'élève."
+        if resume:
+            system_instruction += f"\n\nRésumé des échanges précédents :\n{resume}"
         
-        # Générer la réponse avec Gemini
-        response = GeminiService.generate_text(
-            prompt=prompt,
-            system_instruction=system_instruction,
-            temperature=0.7
-        )
+        system_instruction += "\n\nRéponds à la dernière question de manière pédagogique, claire et adaptée au niveau de l'élève, en tenant compte des échanges précédents."
         
-        return response
+        return system_instruction
     
     def _get_fallback_response(self, question, chapitre=None, user=None):
         """Génère une réponse avec le système de fallback (ancien système)"""
@@ -2,12 +2,13 @@
 Tests unitaires pour l'application tutor
 Tests backend
 """
+from unittest import mock
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from accounts.models import Matiere, Chapitre
 from .models import Conversation, Message
-from .services import TuteurService
+from .services import ConversationContextBuilder, TuteurService
 import json
 
 User = get_user_model()
@@ -113,6 +114,54 @@ class ConversationModelTest(TestCase):
         self.assertEqual(conversation.messages.count(), 2)
 
 
+class ConversationContextBuilderTest(TestCase):
+    """Tests pour le constructeur de contexte multi-tours"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            email='test@example.com'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, titre='Révisions')
+        for i in range(6):
+            Message.objects.create(
+                conversation=self.conversation,
+                role='user' if i % 2 == 0 else 'assistant',
+                contenu=f"Message numéro {i}. " + 'x' * 80
+            )
+    
+    def test_build_loads_recent_messages_in_one_query(self):
+        """Test le chargement des derniers messages en une requête"""
+        builder = ConversationContextBuilder(max_messages=4, token_budget=10000)
+        with self.assertNumQueries(1):
+            messages, resume = builder.build(self.conversation)
+        self.assertEqual(len(messages), 4)
+        self.assertTrue(messages[0]['content'].startswith('Message numéro 2.'))
+        self.assertTrue(messages[-1]['content'].startswith('Message numéro 5.'))
+        self.assertEqual(resume, '')
+    
+    def test_build_trims_to_token_budget_and_summarizes(self):
+        """Test la coupe au budget de tokens et le résumé des anciens tours"""
+        builder = ConversationContextBuilder(max_messages=20, token_budget=60)
+        messages, resume = builder.build(self.conversation)
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[-1]['content'].startswith('Message numéro 5.'))
+        self.assertIn('Élève : Message numéro 0.', resume)
+        self.assertIn('Tuteur : Message numéro 3.', resume)
+    
+    def test_chat_request_includes_history_and_context(self):
+        """Test que la requête envoyée contient l'historique et le résumé"""
+        service = TuteurService(ConversationContextBuilder(token_budget=60))
+        Message.objects.create(conversation=self.conversation, role='user', contenu='Et ensuite ?')
+        messages, system_instruction = service._build_chat_request(
+            'Et ensuite ?', None, self.user, self.conversation
+        )
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'Et ensuite ?'})
+        self.assertIn('Résumé des échanges précédents', system_instruction)
+        self.assertIn(self.user.niveau_etude, system_instruction)
+
+
 class TutorViewsTest(TestCase):
     """Tests pour les vues du tuteur"""
     
@@ -154,6 +203,60 @@ class TutorViewsTest(TestCase):
         response_data = json.loads(response.content)
         self.assertIn('response', response_data)
         self.assertIn('conversation_id', response_data)
-
-
-
+    
+    def test_send_message_async(self):
+        """Test l'envoi d'un message via la vue asynchrone"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('tutor:send_message_async')
+        response = self.client.post(
+            url,
+            data=json.dumps({'message': 'Bonjour !'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.content)
+        conversation = Conversation.objects.get(id=response_data['conversation_id'])
+        self.assertEqual(conversation.messages.count(), 2)
+    
+    def test_send_message_async_requires_login(self):
+        """Test que la vue asynchrone nécessite une connexion"""
+        url = reverse('tutor:send_message_async')
+        response = self.client.post(url, data='{}', content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+    
+    def test_send_message_stream(self):
+        """Test la réponse en flux et l'enregistrement du message du tuteur"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('tutor:send_message_stream')
+        response = self.client.post(
+            url,
+            data=json.dumps({'message': 'Bonjour !'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/event-stream'))
+        contenu = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('event: chunk', contenu)
+        self.assertTrue(contenu.rstrip().split('\n\n')[-1].startswith('event: done'))
+        
+        conversation = Conversation.objects.get(user=self.user)
+        reponse = conversation.messages.get(role='assistant')
+        self.assertIn('Bonjour', reponse.contenu)
+    
+    def test_send_message_stream_interrompu(self):
+        """Test que la réponse partielle est enregistrée si le client se déconnecte"""
+        self.client.login(username='testuser', password='testpass123')
+        with mock.patch.object(TuteurService, 'stream_response', return_value=iter(['Début ', 'suite', ' fin'])):
+            response = self.client.post(
+                reverse('tutor:send_message_stream'),
+                data=json.dumps({'message': 'Bonjour !'}),
+                content_type='application/json'
+            )
+            flux = iter(response.streaming_content)
+            next(flux)  # conversation
+            next(flux)  # premier morceau
+            next(flux)  # second morceau
+            response.close()  # Déconnexion du client
+        
+        conversation = Conversation.objects.get(user=self.user)
+        self.assertEqual(conversation.messages.get(role='assistant').contenu, 'Début suite')
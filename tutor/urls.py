@@ -7,6 +7,8 @@ urlpatterns = [
     path('', views.tutor_index, name='index'),
     path('conversation/<int:conversation_id>/', views.conversation_detail, name='conversation_detail'),
     path('send-message/', views.send_message, name='send_message'),
+    path('send-message/stream/', views.send_message_stream, name='send_message_stream'),
+    path('send-message/async/', views.send_message_async, name='send_message_async'),
     path('new/', views.new_conversation, name='new_conversation'),
 ]
 
@@ -1,12 +1,14 @@
 import json
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .models import Conversation, Message
 from .services import TuteurService
 from accounts.models import Chapitre
+from learnia.decorators import async_csrf_exempt, async_login_required, async_require_http_methods
 
 
 @login_required
@@ -31,6 +33,34 @@ def conversation_detail(request, conversation_id):
     })
 
 
+def _get_or_create_conversation(user, message_text, conversation_id=None, chapitre_id=None):
+    """Récupère la conversation ciblée ou en crée une nouvelle (chapitre et matière préchargés)"""
+    if conversation_id:
+        return get_object_or_404(
+            Conversation.objects.select_related('chapitre__matiere'),
+            id=conversation_id,
+            user=user
+        )
+
+    # Créer une nouvelle conversation
+    titre = message_text[:50] if len(message_text) > 50 else message_text
+    chapitre = Chapitre.objects.select_related('matiere').get(id=chapitre_id) if chapitre_id else None
+    return Conversation.objects.create(
+        user=user,
+        titre=titre,
+        chapitre=chapitre
+    )
+
+
+def _ajouter_xp_tuteur(user):
+    """Ajoute des points XP via la gamification"""
+    try:
+        from gamification.services import GamificationService
+        GamificationService.ajouter_xp_tuteur(user)
+    except:
+        pass
+
+
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -38,20 +68,9 @@ def send_message(request):
     """Envoyer un message au tuteur"""
     data = json.loads(request.body)
     message_text = data.get('message', '')
-    conversation_id = data.get('conversation_id')
-    chapitre_id = data.get('chapitre_id')
-
-    if conversation_id:
-        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-    else:
-        # Créer une nouvelle conversation
-        titre = message_text[:50] if len(message_text) > 50 else message_text
-        chapitre = Chapitre.objects.get(id=chapitre_id) if chapitre_id else None
-        conversation = Conversation.objects.create(
-            user=request.user,
-            titre=titre,
-            chapitre=chapitre
-        )
+    conversation = _get_or_create_conversation(
+        request.user, message_text, data.get('conversation_id'), data.get('chapitre_id')
+    )
 
     # Sauvegarder le message de l'utilisateur
     Message.objects.create(
@@ -62,7 +81,9 @@ def send_message(request):
 
     # Générer la réponse du tuteur
     tuteur_service = TuteurService()
-    response = tuteur_service.get_response(message_text, conversation.chapitre, request.user)
+    response = tuteur_service.get_response(
+        message_text, conversation.chapitre, request.user, conversation=conversation
+    )
 
     # Sauvegarder la réponse
     Message.objects.create(
@@ -71,12 +92,7 @@ def send_message(request):
         contenu=response
     )
     
-    # Ajouter des points XP via la gamification
-    try:
-        from gamification.services import GamificationService
-        GamificationService.ajouter_xp_tuteur(request.user)
-    except:
-        pass
+    _ajouter_xp_tuteur(request.user)
     
     return JsonResponse({
         'response': response,
@@ -84,6 +100,107 @@ def send_message(request):
     })
 
 
+def _sse(event, data):
+    """Formate un événement server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def send_message_stream(request):
+    """
+    Envoyer un message au tuteur et recevoir la réponse en flux (server-sent events)
+    
+    Événements : ``conversation`` (identifiant), ``chunk`` (morceau de texte),
+    ``done`` une fois la réponse enregistrée.
+    """
+    data = json.loads(request.body)
+    message_text = data.get('message', '')
+    conversation = _get_or_create_conversation(
+        request.user, message_text, data.get('conversation_id'), data.get('chapitre_id')
+    )
+    user = request.user
+
+    Message.objects.create(
+        conversation=conversation,
+        role='user',
+        contenu=message_text
+    )
+
+    def evenements():
+        yield _sse('conversation', {'conversation_id': conversation.id})
+
+        morceaux = []
+        try:
+            for chunk in TuteurService().stream_response(
+                message_text, conversation.chapitre, user, conversation=conversation
+            ):
+                morceaux.append(chunk)
+                yield _sse('chunk', {'text': chunk})
+        finally:
+            # Enregistrée aussi si le client se déconnecte en cours de flux
+            # (GeneratorExit) : la partie déjà générée n'est pas perdue
+            contenu = ''.join(morceaux).strip()
+            if contenu:
+                Message.objects.create(
+                    conversation=conversation,
+                    role='assistant',
+                    contenu=contenu
+                )
+
+        # XP seulement pour une réponse complète
+        _ajouter_xp_tuteur(user)
+
+        yield _sse('done', {'conversation_id': conversation.id})
+
+    response = StreamingHttpResponse(evenements(), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Désactive la mise en tampon de nginx
+    return response
+
+
+@async_login_required
+@async_csrf_exempt
+@async_require_http_methods(["POST"])
+async def send_message_async(request):
+    """
+    Envoyer un message au tuteur (vue asynchrone, servie sous ASGI)
+    
+    L'attente de Gemini ne bloque pas de thread : seuls les accès à la base
+    passent par sync_to_async.
+    """
+    data = json.loads(request.body)
+    message_text = data.get('message', '')
+    conversation = await sync_to_async(_get_or_create_conversation)(
+        request.user, message_text, data.get('conversation_id'), data.get('chapitre_id')
+    )
+
+    await Message.objects.acreate(
+        conversation=conversation,
+        role='user',
+        contenu=message_text
+    )
+
+    tuteur_service = TuteurService()
+    response = await tuteur_service.aget_response(
+        message_text, conversation.chapitre, request.user, conversation=conversation
+    )
+
+    await Message.objects.acreate(
+        conversation=conversation,
+        role='assistant',
+        contenu=response
+    )
+
+    await sync_to_async(_ajouter_xp_tuteur)(request.user)
+
+    return JsonResponse({
+        'response': response,
+        'conversation_id': conversation.id
+    })
+
+
 @login_required
 def new_conversation(request):
     """Créer une nouvelle conversation"""